@@ -9,6 +9,14 @@ from membership_routes import membership_bp
 from equipment_routes import equipment_bp
 from attendance_routes import attendance_bp
 from payment_routes import payment_bp
+from metrics_routes import metrics_bp
+from background import start_worker
+from member_purge import process_pending
+from attendance_queue import flush_pending
+from attendance_partitions import maintain as maintain_partitions
+from attendance_sweeper import close_stale_sessions
+from attendance_forecast import refresh_forecast
+from occupancy import start_listener
 from config import config
 import os
 from datetime import datetime, timezone
@@ -35,6 +43,21 @@ def create_app(config_name=None):
     app.register_blueprint(equipment_bp)
     app.register_blueprint(attendance_bp)
     app.register_blueprint(payment_bp)
+    app.register_blueprint(metrics_bp)
+    
+    # Background workers
+    if app.config['BACKGROUND_WORKERS']:
+        start_worker(app, 'member_purge', app.config['PURGE_INTERVAL_SECONDS'], process_pending)
+        start_worker(app, 'attendance_sweeper', app.config['ATTENDANCE_SWEEP_INTERVAL_SECONDS'], close_stale_sessions)
+        # Refits the occupancy forecast once a day
+        start_worker(app, 'attendance_forecast', app.config['ATTENDANCE_FORECAST_INTERVAL_SECONDS'], refresh_forecast)
+        if app.config['ATTENDANCE_WRITE_BEHIND']:
+            # Replays whatever a previous run left in the queue, then keeps flushing
+            start_worker(app, 'attendance_flush', app.config['ATTENDANCE_FLUSH_INTERVAL_SECONDS'], flush_pending)
+        if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql'):
+            # Occupancy updates from other processes
+            start_listener(app)
+            start_worker(app, 'attendance_partitions', app.config['PARTITION_MAINTENANCE_INTERVAL_SECONDS'], maintain_partitions)
     
     # JWT error handlers
     @jwt.expired_token_loader
@@ -0,0 +1,287 @@
+"""
+Batch check-in/check-out for turnstile gateways.
+
+A gateway forwards its buffered badge events as one ordered list. The batch
+is resolved in a single transaction:
+
+1. every event is validated on its own;
+2. members, trainers, the members' open sessions (locked), their latest
+   check-outs and already used event ids are loaded with one query each;
+3. the events are replayed in order in memory, which decides the result of
+   every event;
+4. new sessions are written with multi-row INSERT ... ON CONFLICT DO NOTHING
+   statements and check-outs of existing sessions with one bulk UPDATE;
+   member summaries, attendance rollups and trainer clients get one upsert
+   per table.
+
+A session opened and closed within the same batch is inserted already
+closed. A check-in earlier than the member's latest check-out is rejected.
+Check-in events may carry an `event_id`, stored as the session's
+idempotency key, so a gateway can resend a batch after a timeout; an event
+whose id a concurrent request stored first is reported as a duplicate.
+"""
+
+import uuid
+from collections import namedtuple
+from datetime import datetime, timezone, timedelta
+from models import db, Attendance, Member, Trainer, MemberSummary
+from db_utils import dialect_insert
+from attendance_checkin import CheckIn, MAX_IDEMPOTENCY_KEY_LENGTH
+from member_summary import record_attendance
+from attendance_rollups import record_sessions
+from trainer_analytics import record_trainer_clients
+from occupancy import check_in_event, check_out_event, publish_events
+from sqlalchemy import update
+
+# Largest batch accepted in one request
+MAX_BATCH_EVENTS = 5000
+
+# New sessions written per INSERT statement
+INSERT_CHUNK_SIZE = 1000
+
+# Gateway clocks may run slightly ahead of the server
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+EVENT_TYPES = ('check_in', 'check_out')
+
+BadgeEvent = namedtuple('BadgeEvent', ['index', 'type', 'member_id', 'timestamp', 'trainer_id', 'event_id'])
+ClosedSession = namedtuple('ClosedSession', ['id', 'member_id', 'check_out'])
+
+
+def _as_utc(value):
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _uuid(value, field):
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        raise ValueError(f'Invalid {field}')
+
+
+def parse_event(index, data, now):
+    """Validate one event of a batch; raises ValueError with a message for the client"""
+    if not isinstance(data, dict):
+        raise ValueError('Event must be an object')
+
+    event_type = data.get('type')
+    if event_type not in EVENT_TYPES:
+        raise ValueError(f"type must be one of: {', '.join(EVENT_TYPES)}")
+
+    if not data.get('member_id'):
+        raise ValueError('member_id is required')
+    member_id = _uuid(data['member_id'], 'member_id')
+
+    if not data.get('timestamp'):
+        raise ValueError('timestamp is required')
+    try:
+        timestamp = _as_utc(datetime.fromisoformat(str(data['timestamp']).replace('Z', '+00:00')))
+    except ValueError:
+        raise ValueError('Invalid timestamp. Use an ISO 8601 timestamp')
+    if timestamp > now + MAX_CLOCK_SKEW:
+        raise ValueError('timestamp is in the future')
+
+    trainer_id = None
+    if data.get('trainer_id'):
+        if event_type != 'check_in':
+            raise ValueError('trainer_id is only allowed on check_in events')
+        trainer_id = _uuid(data['trainer_id'], 'trainer_id')
+
+    event_id = data.get('event_id')
+    if event_id is not None:
+        event_id = str(event_id)
+        if not event_id or len(event_id) > MAX_IDEMPOTENCY_KEY_LENGTH:
+            raise ValueError(f'event_id must be 1 to {MAX_IDEMPOTENCY_KEY_LENGTH} characters')
+
+    return BadgeEvent(index, event_type, member_id, timestamp, trainer_id, event_id)
+
+
+def _load_state(events):
+    """Everything the replay needs, with one query per table"""
+    member_ids = {event.member_id for event in events}
+    trainer_ids = {event.trainer_id for event in events if event.trainer_id}
+    event_ids = {event.event_id for event in events if event.event_id and event.type == 'check_in'}
+
+    members = {row.id: f"{row.first_name} {row.last_name}" for row in db.session.query(
+        Member.id, Member.first_name, Member.last_name
+    ).filter(Member.id.in_(member_ids), Member.deleted_at.is_(None)).all()}
+
+    trainers = {row.id: f"{row.first_name} {row.last_name}" for row in db.session.query(
+        Trainer.id, Trainer.first_name, Trainer.last_name
+    ).filter(Trainer.id.in_(trainer_ids)).all()} if trainer_ids else {}
+
+    # Locked so concurrent check-outs cannot close them under us
+    open_sessions = {row.member_id: {'id': row.id, 'check_in': _as_utc(row.check_in), 'new': False}
+                     for row in db.session.query(
+                         Attendance.id, Attendance.member_id, Attendance.check_in
+                     ).filter(Attendance.member_id.in_(member_ids), Attendance.check_out.is_(None))
+                     .with_for_update().all()}
+
+    # The summaries keep the end of each member's last closed session
+    last_check_outs = {row.member_id: _as_utc(row.last_check_out) for row in db.session.query(
+        MemberSummary.member_id, MemberSummary.last_check_out
+    ).filter(MemberSummary.member_id.in_(member_ids), MemberSummary.last_check_out.isnot(None)).all()}
+
+    return members, trainers, open_sessions, last_check_outs, _used_event_ids(event_ids)
+
+
+def _used_event_ids(event_ids):
+    """{event id: (attendance id, member id)} of the sessions that already carry the ids"""
+    if not event_ids:
+        return {}
+    return {row.idempotency_key: (row.id, row.member_id) for row in db.session.query(
+        Attendance.idempotency_key, Attendance.id, Attendance.member_id
+    ).filter(Attendance.idempotency_key.in_(event_ids)).all()}
+
+
+def process_batch(items):
+    """
+    Resolve an ordered list of badge events in the current transaction.
+    Returns (per-event results, occupancy events to apply after committing)
+    """
+    now = datetime.now(timezone.utc)
+    results = [None] * len(items)
+    events = []
+    for index, item in enumerate(items):
+        try:
+            events.append(parse_event(index, item, now))
+        except ValueError as e:
+            results[index] = {'index': index, 'status': 'error', 'error': str(e)}
+
+    if not events:
+        return results, []
+
+    members, trainers, open_sessions, last_check_outs, used_event_ids = _load_state(events)
+
+    new_rows = {}       # attendance id -> row to insert
+    row_events = {}     # attendance id -> indexes of the events folded into the row
+    closes = {}         # existing attendance id -> (member_id, check_in, check_out)
+    outcomes = []       # (event, attendance id) of accepted events, in order
+
+    def reject(event, error):
+        results[event.index] = {'index': event.index, 'status': 'error', 'error': error}
+
+    for event in events:
+        if event.member_id not in members:
+            reject(event, 'Member not found')
+            continue
+        current = open_sessions.get(event.member_id)
+
+        if event.type == 'check_in':
+            if event.event_id in used_event_ids:
+                attendance_id, member_id = used_event_ids[event.event_id]
+                if member_id != event.member_id:
+                    reject(event, 'event_id was already used for another member')
+                else:
+                    results[event.index] = {'index': event.index, 'status': 'duplicate',
+                                            'attendance_id': str(attendance_id)}
+                continue
+            if event.trainer_id and event.trainer_id not in trainers:
+                reject(event, 'Trainer not found')
+                continue
+            if current:
+                reject(event, 'Member is already checked in')
+                continue
+            if event.member_id in last_check_outs and event.timestamp < last_check_outs[event.member_id]:
+                reject(event, 'Check-in is earlier than the last check-out')
+                continue
+
+            attendance_id = uuid.uuid4()
+            new_rows[attendance_id] = {
+                'id': attendance_id,
+                'member_id': event.member_id,
+                'trainer_id': event.trainer_id,
+                'check_in': event.timestamp,
+                'check_out': None,
+                'idempotency_key': event.event_id,
+                'created_at': now
+            }
+            row_events[attendance_id] = [event.index]
+            open_sessions[event.member_id] = {'id': attendance_id, 'check_in': event.timestamp, 'new': True}
+            if event.event_id:
+                used_event_ids[event.event_id] = (attendance_id, event.member_id)
+            results[event.index] = {'index': event.index, 'status': 'ok', 'attendance_id': str(attendance_id)}
+            outcomes.append((event, attendance_id))
+
+        else:
+            if not current:
+                reject(event, 'No active check-in found for this member')
+                continue
+            if event.timestamp < current['check_in']:
+                reject(event, 'Check-out is earlier than the check-in')
+                continue
+
+            if current['new']:
+                new_rows[current['id']]['check_out'] = event.timestamp
+                row_events[current['id']].append(event.index)
+            else:
+                closes[current['id']] = (event.member_id, current['check_in'], event.timestamp)
+            open_sessions[event.member_id] = None
+            last_check_outs[event.member_id] = event.timestamp
+            results[event.index] = {
+                'index': event.index,
+                'status': 'ok',
+                'attendance_id': str(current['id']),
+                'duration_minutes': int((event.timestamp - current['check_in']).total_seconds() / 60)
+            }
+            outcomes.append((event, current['id']))
+
+    # New sessions; a concurrent check-in of the same member wins the partial unique index
+    rows = list(new_rows.values())
+    inserted = set()
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        statement = dialect_insert(Attendance).values(rows[start:start + INSERT_CHUNK_SIZE])\
+            .on_conflict_do_nothing().returning(Attendance.id)
+        inserted.update(db.session.execute(statement).scalars())
+    conflicted = set(new_rows) - inserted
+    # A concurrent request may have stored the same event first (a resent batch)
+    stored = _used_event_ids({new_rows[attendance_id]['idempotency_key'] for attendance_id in conflicted
+                              if new_rows[attendance_id]['idempotency_key']})
+    for attendance_id in conflicted:
+        row = new_rows[attendance_id]
+        check_in_index, *check_out_indexes = row_events[attendance_id]
+        for index in check_out_indexes:
+            results[index] = {'index': index, 'status': 'error',
+                              'error': 'Conflicted with a concurrent check-in, please retry'}
+        if row['idempotency_key'] in stored:
+            existing_id, member_id = stored[row['idempotency_key']]
+            if member_id == row['member_id']:
+                results[check_in_index] = {'index': check_in_index, 'status': 'duplicate',
+                                           'attendance_id': str(existing_id)}
+            else:
+                results[check_in_index] = {'index': check_in_index, 'status': 'error',
+                                           'error': 'event_id was already used for another member'}
+        else:
+            results[check_in_index] = {'index': check_in_index, 'status': 'error',
+                                       'error': 'Conflicted with a concurrent check-in, please retry'}
+
+    if closes:
+        db.session.execute(update(Attendance), [
+            {'id': attendance_id, 'check_out': check_out} for attendance_id, (_, _, check_out) in closes.items()
+        ])
+
+    check_ins = [(row['member_id'], row['check_in']) for row in rows if row['id'] in inserted]
+    check_outs = [(row['member_id'], row['check_in'], row['check_out']) for row in rows
+                  if row['id'] in inserted and row['check_out'] is not None]
+    check_outs += list(closes.values())
+    record_attendance(check_ins, [(member_id, check_out) for member_id, _, check_out in check_outs])
+    record_sessions(check_ins, check_outs)
+    record_trainer_clients([(row['trainer_id'], row['member_id'], row['check_in']) for row in rows
+                            if row['id'] in inserted])
+
+    occupancy_events = []
+    for event, attendance_id in outcomes:
+        if attendance_id in new_rows and attendance_id not in inserted:
+            continue
+        if event.type == 'check_in':
+            occupancy_events.append(check_in_event(CheckIn(
+                attendance_id, event.member_id, event.timestamp,
+                members[event.member_id], trainers.get(event.trainer_id)
+            )))
+        else:
+            occupancy_events.append(check_out_event(ClosedSession(attendance_id, event.member_id, event.timestamp)))
+    publish_events(occupancy_events)
+
+    return results, occupancy_events
@@ -0,0 +1,106 @@
+"""
+Single-statement check-in.
+
+A check-in is one INSERT ... SELECT ... ON CONFLICT DO NOTHING RETURNING:
+
+- the SELECT only produces a row when the member exists (and is not
+  deleted) and the requested trainer exists;
+- the partial unique index uq_attendance_open_member rejects a second open
+  session of the same member, so concurrent taps cannot both succeed;
+- uq_attendance_idempotency_key rejects a retried request.
+
+RETURNING carries the member and trainer names for the response, so the
+happy path needs no other query. When nothing is inserted, callers use
+rejection_reason() to find out why.
+"""
+
+import uuid
+from collections import namedtuple
+from datetime import datetime, timezone
+from models import db, Attendance, Member, Trainer
+from db_utils import dialect_insert
+from sqlalchemy import select, literal, exists
+
+# Longest accepted Idempotency-Key
+MAX_IDEMPOTENCY_KEY_LENGTH = 100
+
+CheckIn = namedtuple('CheckIn', ['id', 'member_id', 'check_in', 'member_name', 'trainer_name'])
+
+
+def _as_uuid(value):
+    return value if value is None or isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+
+
+def _column(model_id, value, column):
+    return select(column).where(model_id == value).scalar_subquery()
+
+
+def _name(first_name, last_name):
+    return f"{first_name} {last_name}"
+
+
+def insert_check_in(member_id, trainer_id=None, check_in=None, idempotency_key=None):
+    """
+    Open a session for a member. Returns a CheckIn, or None when nothing was
+    inserted (see rejection_reason)
+    """
+    member_id = _as_uuid(member_id)
+    trainer_id = _as_uuid(trainer_id)
+    check_in = check_in or datetime.now(timezone.utc)
+    attendance_id = uuid.uuid4()
+
+    source = select(
+        literal(attendance_id, Attendance.id.type),
+        Member.id,
+        literal(trainer_id, Attendance.trainer_id.type),
+        literal(check_in, Attendance.check_in.type),
+        literal(idempotency_key, Attendance.idempotency_key.type),
+        literal(check_in, Attendance.created_at.type)
+    ).where(Member.id == member_id, Member.deleted_at.is_(None))
+    if trainer_id is not None:
+        source = source.where(exists().where(Trainer.id == trainer_id))
+
+    statement = dialect_insert(Attendance).from_select(
+        ['id', 'member_id', 'trainer_id', 'check_in', 'idempotency_key', 'created_at'], source
+    ).on_conflict_do_nothing().returning(
+        Attendance.id,
+        _column(Member.id, member_id, Member.first_name),
+        _column(Member.id, member_id, Member.last_name),
+        _column(Trainer.id, trainer_id, Trainer.first_name),
+        _column(Trainer.id, trainer_id, Trainer.last_name)
+    )
+    row = db.session.execute(statement).first()
+    if row is None:
+        return None
+    _, first_name, last_name, trainer_first_name, trainer_last_name = row
+    return CheckIn(
+        attendance_id, member_id, check_in,
+        _name(first_name, last_name),
+        _name(trainer_first_name, trainer_last_name) if trainer_id is not None else None
+    )
+
+
+def find_by_idempotency_key(idempotency_key):
+    if not idempotency_key:
+        return None
+    return Attendance.query.filter(Attendance.idempotency_key == idempotency_key).first()
+
+
+def rejection_reason(member_id, trainer_id=None):
+    """
+    Why insert_check_in() inserted nothing, as (error, status, open session).
+    Only called on the failure path.
+    """
+    member = db.session.get(Member, _as_uuid(member_id))
+    if not member or member.deleted_at:
+        return 'Member not found', 404, None
+    if trainer_id is not None and not db.session.get(Trainer, _as_uuid(trainer_id)):
+        return 'Trainer not found', 404, None
+    open_session = Attendance.query.filter(
+        Attendance.member_id == member.id,
+        Attendance.check_out.is_(None)
+    ).first()
+    if open_session:
+        return 'Member is already checked in', 400, open_session
+    # The conflicting session was closed after our INSERT ran
+    return 'Check-in conflicted with another request, please retry', 409, None
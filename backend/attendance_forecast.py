@@ -0,0 +1,242 @@
+"""
+Occupancy forecast.
+
+Hourly check-ins over the last ATTENDANCE_FORECAST_HISTORY_WEEKS weeks,
+read from the attendance_hourly rollup, are fitted by least squares to a
+seasonal model with a linear trend:
+
+    check-ins(t) = seasonal[local weekday, local hour] + trend_per_week * weeks(t - origin)
+
+Rollup rows are keyed by UTC day and hour, like everything record_sessions()
+and rebuild_rollups() write. The fit places each row on the UTC hour it
+stands for (_rollup_hour()) and only then maps hours to seasonal slots in
+GYM_TIMEZONE (_slots()), so a slot means the same local hour in the fit
+and in forecast(), across DST changes too.
+
+Expected occupancy follows from the expected check-ins and the average
+session length: a member who arrives during an hour stays there, and in
+the following hours, for a share of the session that the occupancy kernel
+gives.
+
+The fitted parameters are stored in `attendance_forecasts` and refitted
+once a day after ATTENDANCE_FORECAST_REFIT_HOUR (gym time) by the
+attendance_forecast background worker. Each process keeps the parameters
+in memory for FORECAST_CACHE_SECONDS, so a prediction costs the same
+however long the history is.
+
+Refit now with:
+    python attendance_forecast.py
+"""
+
+import sys
+import os
+import math
+import time
+import threading
+import numpy as np
+from datetime import datetime, timezone, timedelta
+from zoneinfo import ZoneInfo
+
+# Add the backend directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import current_app
+from models import db, AttendanceDaily, AttendanceHourly, AttendanceForecast
+from db_utils import dialect_insert
+from sqlalchemy import func
+
+FORECAST_NAME = 'occupancy'
+
+# Hours ahead a single request may ask for
+MAX_FORECAST_HOURS = 24
+
+# How long a process serves the parameters it loaded before checking for a refit
+FORECAST_CACHE_SECONDS = 300
+
+# Used until there are completed sessions to measure
+DEFAULT_SESSION_MINUTES = 60.0
+
+HOURS_PER_WEEK = 168
+
+_cache_lock = threading.Lock()
+_cache = {'params': None, 'expires': 0.0}
+
+
+def _as_utc(value):
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _rollup_hour(day, hour):
+    """The UTC hour an attendance_hourly row stands for"""
+    return datetime(day.year, day.month, day.day, hour, tzinfo=timezone.utc)
+
+
+def _slots(start, hours, tz):
+    """Weekday * 24 + hour (Monday 00:00 = 0) in `tz` of `hours` consecutive UTC hours from `start`"""
+    slots = np.empty(hours, dtype=np.int64)
+    for index in range(hours):
+        local = (start + timedelta(hours=index)).astimezone(tz)
+        slots[index] = local.weekday() * 24 + local.hour
+    return slots
+
+
+def occupancy_kernel(session_minutes):
+    """
+    Average share of hour k (k = 0, 1, ...) spent in the gym by a member who
+    arrives at a uniformly random time during hour 0
+    """
+    arrivals = np.arange(60) + 0.5
+    kernel = []
+    for k in range(math.ceil((session_minutes + 60) / 60)):
+        overlap = np.minimum(arrivals + session_minutes, 60 * k + 60) - np.maximum(arrivals, 60 * k)
+        kernel.append(float(np.clip(overlap, 0, 60).mean() / 60))
+    return kernel
+
+
+def fit_forecast(history_weeks, tz_name, now=None):
+    """Fit the model on the `history_weeks` weeks before the current hour; returns the parameters"""
+    tz = ZoneInfo(tz_name)
+    now = now or datetime.now(timezone.utc)
+    end = now.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(weeks=history_weeks)
+    hours = history_weeks * HOURS_PER_WEEK
+
+    # Index i is the UTC hour start + i; hours without a rollup row had no check-ins
+    arrivals = np.zeros(hours)
+    for day, hour, visits in db.session.query(AttendanceHourly.day, AttendanceHourly.hour, AttendanceHourly.visits)\
+            .filter(AttendanceHourly.day >= start.date(), AttendanceHourly.day <= end.date()).all():
+        index = int((_rollup_hour(day, hour) - start).total_seconds() // 3600)
+        if 0 <= index < hours:
+            arrivals[index] = visits
+
+    # One indicator column per local weekday and hour, plus a trend in weeks from the middle of the window
+    design = np.zeros((hours, HOURS_PER_WEEK + 1))
+    design[np.arange(hours), _slots(start, hours, tz)] = 1
+    design[:, HOURS_PER_WEEK] = (np.arange(hours) - hours / 2) / HOURS_PER_WEEK
+    coefficients = np.linalg.lstsq(design, arrivals, rcond=None)[0]
+
+    completed, minutes = db.session.query(
+        func.coalesce(func.sum(AttendanceDaily.completed_sessions), 0),
+        func.coalesce(func.sum(AttendanceDaily.workout_minutes), 0)
+    ).filter(AttendanceDaily.day >= start.date()).one()
+
+    return {
+        'name': FORECAST_NAME,
+        'fitted_at': now,
+        'gym_timezone': tz_name,
+        'history_weeks': history_weeks,
+        'seasonal': [round(float(value), 4) for value in coefficients[:HOURS_PER_WEEK]],
+        'trend_per_week': float(coefficients[HOURS_PER_WEEK]),
+        'trend_origin': start + timedelta(hours=hours / 2),
+        'session_minutes': float(minutes) / int(completed) if completed else DEFAULT_SESSION_MINUTES
+    }
+
+
+def last_refit_time(now, tz_name, refit_hour):
+    """The latest scheduled refit (today's or yesterday's refit hour, gym time) at or before `now`"""
+    local = now.astimezone(ZoneInfo(tz_name))
+    scheduled = local.replace(hour=refit_hour, minute=0, second=0, microsecond=0)
+    if scheduled > local:
+        scheduled -= timedelta(days=1)
+    return scheduled
+
+
+def refresh_forecast(force=False):
+    """Refit and store the parameters unless they are from after the last scheduled refit; returns True if refitted"""
+    config = current_app.config
+    now = datetime.now(timezone.utc)
+    tz_name = config['GYM_TIMEZONE']
+    history_weeks = config['ATTENDANCE_FORECAST_HISTORY_WEEKS']
+
+    current = db.session.get(AttendanceForecast, FORECAST_NAME)
+    if not force and current is not None \
+            and current.gym_timezone == tz_name and current.history_weeks == history_weeks \
+            and _as_utc(current.fitted_at) >= last_refit_time(now, tz_name, config['ATTENDANCE_FORECAST_REFIT_HOUR']):
+        db.session.rollback()
+        return False
+
+    params = fit_forecast(history_weeks, tz_name, now)
+    # Several processes may refit at the same time; the last one wins
+    statement = dialect_insert(AttendanceForecast).values(params)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['name'],
+        set_={column: statement.excluded[column] for column in params if column != 'name'}
+    ))
+    db.session.commit()
+    with _cache_lock:
+        _cache['expires'] = 0.0
+    print(f"Refitted the occupancy forecast on {history_weeks} weeks of attendance")
+    return True
+
+
+def _load_params():
+    row = db.session.get(AttendanceForecast, FORECAST_NAME)
+    if row is None:
+        return None
+    return {
+        'fitted_at': _as_utc(row.fitted_at),
+        'tz': ZoneInfo(row.gym_timezone),
+        'seasonal': np.array(row.seasonal, dtype=float),
+        'trend_per_week': row.trend_per_week,
+        'trend_origin': _as_utc(row.trend_origin),
+        'kernel': occupancy_kernel(row.session_minutes)
+    }
+
+
+def get_params():
+    """Fitted parameters from the process cache, loaded (or fitted, the first time) when needed"""
+    with _cache_lock:
+        if _cache['params'] is not None and time.monotonic() < _cache['expires']:
+            return _cache['params']
+    params = _load_params()
+    if params is None:
+        refresh_forecast(force=True)
+        params = _load_params()
+    with _cache_lock:
+        _cache['params'] = params
+        _cache['expires'] = time.monotonic() + FORECAST_CACHE_SECONDS
+    return params
+
+
+def forecast(hours, now=None):
+    """Expected check-ins and occupancy for each of the next `hours` hours, starting with the current one"""
+    params = get_params()
+    now = now or datetime.now(timezone.utc)
+    start = now.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    kernel = params['kernel']
+
+    # Earlier hours are needed too: members who arrived then are still in
+    first = start - timedelta(hours=len(kernel) - 1)
+    total = hours + len(kernel) - 1
+    offsets = np.arange(total)
+    weeks = ((first - params['trend_origin']).total_seconds() / 3600 + offsets) / HOURS_PER_WEEK
+    check_ins = np.maximum(
+        params['seasonal'][_slots(first, total, params['tz'])] + params['trend_per_week'] * weeks, 0
+    )
+    occupancy = np.convolve(check_ins, kernel)[len(kernel) - 1:total]
+
+    return {
+        'fitted_at': params['fitted_at'].isoformat(),
+        'timezone': str(params['tz']),
+        'hours': [{
+            'start': (start + timedelta(hours=index)).isoformat(),
+            'expected_check_ins': round(float(check_ins[index + len(kernel) - 1]), 1),
+            'expected_occupancy': round(float(occupancy[index]), 1)
+        } for index in range(hours)]
+    }
+
+
+def main():
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        refresh_forecast(force=True)
+        print("Done.")
+
+
+if __name__ == "__main__":
+    main()
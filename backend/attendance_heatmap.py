@@ -0,0 +1,91 @@
+"""
+Weekly occupancy heatmap.
+
+Average number of members in the gym for every weekday and hour (in the
+gym's local timezone) over the last N weeks, computed from check-in/check-out
+intervals with a sweep line: every session adds +1 at the minute it starts
+and -1 at the minute it ends, and a cumulative sum gives the occupancy of
+every minute of the window. Minutes are then grouped by local weekday and
+hour and averaged.
+"""
+
+import numpy as np
+from datetime import datetime, timezone, timedelta
+from zoneinfo import ZoneInfo
+from models import db, Attendance
+from attendance_stats import WEEKDAY_NAMES
+from sqlalchemy import or_
+
+MAX_HEATMAP_WEEKS = 52
+
+# Sessions starting this long before the window are not looked at, which
+# keeps the query on the check_in index (longer sessions are stale anyway)
+MAX_SESSION_LOOKBACK = timedelta(days=1)
+
+
+def _as_utc(value):
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def occupancy_heatmap(weeks, tz_name, now=None):
+    """
+    7x24 matrix (Monday first) of average concurrent occupancy per local
+    weekday and hour over the `weeks` weeks before the current hour
+    """
+    tz = ZoneInfo(tz_name)
+    now = now or datetime.now(timezone.utc)
+    end = now.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(weeks=weeks)
+    minutes = int((end - start).total_seconds() // 60)
+
+    sessions = db.session.query(Attendance.check_in, Attendance.check_out).filter(
+        Attendance.check_in >= start - MAX_SESSION_LOOKBACK,
+        Attendance.check_in < end,
+        or_(Attendance.check_out.is_(None), Attendance.check_out > start)
+    ).all()
+
+    # Sweep line over minute offsets from `start`
+    delta = np.zeros(minutes + 1, dtype=np.int64)
+    if sessions:
+        bounds = np.array([
+            ((_as_utc(check_in) - start).total_seconds() // 60,
+             ((_as_utc(check_out) if check_out else now) - start).total_seconds() // 60)
+            for check_in, check_out in sessions
+        ], dtype=np.int64)
+        bounds = np.clip(bounds, 0, minutes)
+        bounds[:, 1] = np.maximum(bounds[:, 0], bounds[:, 1])
+        np.add.at(delta, bounds[:, 0], 1)
+        np.add.at(delta, bounds[:, 1], -1)
+    occupancy = np.cumsum(delta)[:minutes]
+
+    # Local weekday and hour of every minute; UTC offsets are looked up per hour
+    offsets = np.array([
+        (start + timedelta(hours=hour)).astimezone(tz).utcoffset().total_seconds() // 60
+        for hour in range(minutes // 60)
+    ], dtype=np.int64)
+    local_minutes = int(start.timestamp() // 60) + np.arange(minutes) + np.repeat(offsets, 60)
+    # 1970-01-01 was a Thursday (weekday 3)
+    weekday = (local_minutes // 1440 + 3) % 7
+    hour = (local_minutes // 60) % 24
+    slot = weekday * 24 + hour
+
+    totals = np.bincount(slot, weights=occupancy, minlength=168)
+    counts = np.bincount(slot, minlength=168)
+    averages = np.divide(totals, counts, out=np.zeros(168), where=counts > 0).reshape(7, 24)
+
+    peak_day, peak_hour = np.unravel_index(int(np.argmax(averages)), averages.shape)
+    return {
+        'weeks': weeks,
+        'timezone': tz_name,
+        'window': {'start': start.isoformat(), 'end': end.isoformat()},
+        'days': WEEKDAY_NAMES,
+        'hours': list(range(24)),
+        'matrix': [[round(float(value), 2) for value in row] for row in averages],
+        'peak': {
+            'day': WEEKDAY_NAMES[peak_day],
+            'hour': int(peak_hour),
+            'average_occupancy': round(float(averages[peak_day, peak_hour]), 2)
+        }
+    }
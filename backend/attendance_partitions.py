@@ -0,0 +1,289 @@
+"""
+Monthly range partitioning of the attendance table (PostgreSQL 13+).
+
+`python attendance_partitions.py migrate` converts an existing attendance
+table into a table partitioned by month of check_in, copying the rows in
+one transaction. The table is locked for the duration, so run it in a
+maintenance window. The partitions are named attendance_yYYYYmMM, and
+attendance_default catches rows outside the prepared months.
+
+A partitioned table cannot have unique indexes without check_in in them,
+so the two guarantees check-in relies on move to small guard tables,
+maintained by triggers:
+
+- attendance_open_sessions: at most one open session per member, which
+  replaces uq_attendance_open_member;
+- attendance_idempotency_keys: which replaces uq_attendance_idempotency_key.
+
+A BEFORE INSERT trigger skips the row when a guard is taken, just as
+ON CONFLICT DO NOTHING does, so check-in code behaves the same on both
+layouts.
+
+`python attendance_partitions.py maintain` (also run by the
+attendance_partitions background worker) creates partitions
+ATTENDANCE_PARTITIONS_AHEAD months ahead. It also retires the partitions
+older than ATTENDANCE_RETENTION_MONTHS: the rollups of their rows are
+rebuilt, then the partition is detached and moved to the
+ATTENDANCE_ARCHIVE_SCHEMA schema, or dropped with ATTENDANCE_RETENTION_DROP.
+"""
+
+import sys
+import os
+import re
+from datetime import datetime, timezone
+
+# Add the backend directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import current_app
+from models import db
+from attendance_rollups import rebuild_rollups
+from sqlalchemy import text
+
+PARTITION_NAME = re.compile(r'^attendance_y(\d{4})m(\d{2})$')
+
+# Serializes maintenance between processes (pg_advisory_xact_lock key)
+MAINTENANCE_LOCK_ID = 716001
+
+GUARD_DDL = [
+    "CREATE TABLE IF NOT EXISTS attendance_open_sessions ("
+    "member_id UUID PRIMARY KEY, attendance_id UUID NOT NULL UNIQUE)",
+    "CREATE TABLE IF NOT EXISTS attendance_idempotency_keys ("
+    "idempotency_key VARCHAR(100) PRIMARY KEY, attendance_id UUID NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_attendance_idempotency_keys_attendance_id "
+    "ON attendance_idempotency_keys (attendance_id)",
+    """
+    CREATE OR REPLACE FUNCTION attendance_guard_insert() RETURNS trigger AS $$
+    BEGIN
+        IF NEW.idempotency_key IS NOT NULL THEN
+            INSERT INTO attendance_idempotency_keys (idempotency_key, attendance_id)
+            VALUES (NEW.idempotency_key, NEW.id) ON CONFLICT DO NOTHING;
+            IF NOT FOUND THEN
+                RETURN NULL;
+            END IF;
+        END IF;
+        IF NEW.check_out IS NULL AND NEW.member_id IS NOT NULL THEN
+            INSERT INTO attendance_open_sessions (member_id, attendance_id)
+            VALUES (NEW.member_id, NEW.id) ON CONFLICT DO NOTHING;
+            IF NOT FOUND THEN
+                DELETE FROM attendance_idempotency_keys WHERE attendance_id = NEW.id;
+                RETURN NULL;
+            END IF;
+        END IF;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION attendance_guard_release() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            DELETE FROM attendance_open_sessions WHERE attendance_id = OLD.id;
+            DELETE FROM attendance_idempotency_keys WHERE attendance_id = OLD.id;
+        ELSIF OLD.check_out IS NULL AND NEW.check_out IS NOT NULL THEN
+            DELETE FROM attendance_open_sessions WHERE attendance_id = OLD.id;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS attendance_guard_insert ON attendance",
+    "CREATE TRIGGER attendance_guard_insert BEFORE INSERT ON attendance "
+    "FOR EACH ROW EXECUTE FUNCTION attendance_guard_insert()",
+    "DROP TRIGGER IF EXISTS attendance_guard_release ON attendance",
+    "CREATE TRIGGER attendance_guard_release AFTER UPDATE OR DELETE ON attendance "
+    "FOR EACH ROW EXECUTE FUNCTION attendance_guard_release()",
+]
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def partition_name(start):
+    return f"attendance_y{start.year:04d}m{start.month:02d}"
+
+
+def is_partitioned():
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return False
+    return db.session.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('attendance'))"
+    )).scalar()
+
+
+def list_partitions():
+    """Monthly partitions of attendance as {month start: name}"""
+    names = db.session.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass('attendance')"
+    )).scalars()
+    partitions = {}
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)] = name
+    return partitions
+
+
+def create_partition(start):
+    """Create the partition of the month starting at `start` unless it exists"""
+    end = add_months(start, 1)
+    name = partition_name(start)
+    overflow = db.session.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM attendance_default WHERE check_in >= :start AND check_in < :end)"
+    ), {'start': start, 'end': end}).scalar()
+    if overflow:
+        # PostgreSQL refuses to create a partition whose rows sit in the default partition
+        print(f"Skipping {name}: attendance_default holds rows for that month")
+        return False
+    db.session.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF attendance "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+    return True
+
+
+def migrate(months_ahead):
+    """Convert attendance into a partitioned table, copying existing rows"""
+    if is_partitioned():
+        print("attendance is already partitioned.")
+        return False
+
+    db.session.execute(text("LOCK TABLE attendance IN ACCESS EXCLUSIVE MODE"))
+    first = db.session.execute(text("SELECT min(check_in) FROM attendance")).scalar()
+    now = datetime.now(timezone.utc)
+
+    for statement in [
+        "ALTER TABLE attendance RENAME TO attendance_unpartitioned",
+        "CREATE TABLE attendance (LIKE attendance_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (check_in)",
+        "ALTER TABLE attendance ADD PRIMARY KEY (id, check_in)",
+        "ALTER TABLE attendance ADD FOREIGN KEY (member_id) REFERENCES members (id) ON DELETE SET NULL",
+        "ALTER TABLE attendance ADD FOREIGN KEY (trainer_id) REFERENCES trainers (id) ON DELETE SET NULL",
+        "CREATE TABLE attendance_default PARTITION OF attendance DEFAULT",
+    ]:
+        db.session.execute(text(statement))
+
+    start = month_start(first or now)
+    last = add_months(month_start(now), months_ahead)
+    while start <= last:
+        create_partition(start)
+        start = add_months(start, 1)
+
+    copied = db.session.execute(text("INSERT INTO attendance SELECT * FROM attendance_unpartitioned")).rowcount
+    db.session.execute(text("DROP TABLE attendance_unpartitioned"))
+
+    # Partitioned versions of the table's indexes (created on every partition)
+    for statement in [
+        "CREATE INDEX ix_attendance_check_in_id ON attendance (check_in, id)",
+        "CREATE INDEX ix_attendance_trainer_check_in ON attendance (trainer_id, check_in)",
+        "CREATE INDEX ix_attendance_member_open ON attendance (member_id) WHERE check_out IS NULL",
+        "CREATE INDEX ix_attendance_idempotency_key ON attendance (idempotency_key) "
+        "WHERE idempotency_key IS NOT NULL",
+    ] + GUARD_DDL + [
+        "INSERT INTO attendance_open_sessions (member_id, attendance_id) "
+        "SELECT DISTINCT ON (member_id) member_id, id FROM attendance "
+        "WHERE check_out IS NULL AND member_id IS NOT NULL ORDER BY member_id, check_in DESC",
+        "INSERT INTO attendance_idempotency_keys (idempotency_key, attendance_id) "
+        "SELECT idempotency_key, id FROM attendance WHERE idempotency_key IS NOT NULL "
+        "ON CONFLICT DO NOTHING",
+    ]:
+        db.session.execute(text(statement))
+
+    db.session.commit()
+    print(f"Partitioned attendance by month; copied {copied} rows.")
+    return True
+
+
+def ensure_partitions(months_ahead):
+    """Create the partitions of the current and next `months_ahead` months"""
+    existing = list_partitions()
+    start = month_start(datetime.now(timezone.utc))
+    created = 0
+    for offset in range(months_ahead + 1):
+        month = add_months(start, offset)
+        if month not in existing and create_partition(month):
+            created += 1
+    return created
+
+
+def retire_partition(start, name, archive_schema, drop):
+    """Rebuild the rollups of a partition, then detach and archive (or drop) it"""
+    end = add_months(start, 1)
+    rebuild_rollups(start, end)
+    # Detaching does not fire the release trigger
+    db.session.execute(text(
+        f"DELETE FROM attendance_open_sessions WHERE attendance_id IN (SELECT id FROM {name})"
+    ))
+    db.session.execute(text(
+        f"DELETE FROM attendance_idempotency_keys WHERE attendance_id IN (SELECT id FROM {name})"
+    ))
+    db.session.execute(text(f"ALTER TABLE attendance DETACH PARTITION {name}"))
+    if drop:
+        db.session.execute(text(f"DROP TABLE {name}"))
+    else:
+        db.session.execute(text(f"CREATE SCHEMA IF NOT EXISTS {archive_schema}"))
+        db.session.execute(text(f"ALTER TABLE {name} SET SCHEMA {archive_schema}"))
+
+
+def apply_retention(retention_months, archive_schema, drop=False):
+    """
+    Retire the partitions entirely older than `retention_months` months in
+    the current transaction; returns their names
+    """
+    cutoff = add_months(month_start(datetime.now(timezone.utc)), -retention_months)
+    retired = []
+    for start, name in sorted(list_partitions().items()):
+        if add_months(start, 1) > cutoff:
+            break
+        retire_partition(start, name, archive_schema, drop)
+        retired.append(name)
+        print(f"Retired attendance partition {name}")
+    return retired
+
+
+def maintain():
+    """
+    Create upcoming partitions and retire old ones in one transaction
+    (no-op unless attendance is partitioned)
+    """
+    if not is_partitioned():
+        return
+    config = current_app.config
+    # Only one process at a time; the others skip this round
+    if not db.session.execute(text("SELECT pg_try_advisory_xact_lock(:id)"), {'id': MAINTENANCE_LOCK_ID}).scalar():
+        db.session.rollback()
+        return
+    ensure_partitions(config['ATTENDANCE_PARTITIONS_AHEAD'])
+    apply_retention(config['ATTENDANCE_RETENTION_MONTHS'], config['ATTENDANCE_ARCHIVE_SCHEMA'],
+                    drop=config['ATTENDANCE_RETENTION_DROP'])
+    db.session.commit()
+
+
+def main():
+    import argparse
+    from app import create_app
+
+    parser = argparse.ArgumentParser(description='Monthly partitioning of the attendance table')
+    parser.add_argument('command', choices=['migrate', 'maintain'])
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if db.session.get_bind().dialect.name != 'postgresql':
+            print("Partitioning needs PostgreSQL; nothing to do.")
+            return
+        if args.command == 'migrate':
+            migrate(app.config['ATTENDANCE_PARTITIONS_AHEAD'])
+        else:
+            maintain()
+            print("Done.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Write-behind queue for attendance events.
+
+With ATTENDANCE_WRITE_BEHIND enabled, /attendance/check-in and
+/attendance/check-out answer 202 as soon as the event is appended to a local
+SQLite database in WAL mode with synchronous=FULL, so an acknowledged event
+survives a crash. The attendance_flush worker started by create_app moves
+the oldest events to the main database in batches through
+attendance_batch.process_batch(). Events are flushed in the order they were
+appended, so the events of a member are applied in the order they were
+acknowledged.
+
+Replay after a crash applies every event exactly once: each queue file has
+a random id and its events increasing sequence numbers. A flush records the
+last applied sequence of the queue in attendance_queue_checkpoints in the
+same transaction as the events, and only then deletes them locally. Events
+that were applied but not yet deleted are skipped on the next flush.
+
+Events rejected when they are flushed (e.g. member already checked in) are
+moved to the queue's `rejected` table for inspection.
+
+Flush the queue once from the command line with:
+    python attendance_queue.py
+"""
+
+import sys
+import os
+import json
+import sqlite3
+import threading
+import uuid
+from collections import namedtuple
+from datetime import datetime, timezone
+
+# Add the backend directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import current_app
+from models import db, AttendanceQueueCheckpoint
+from attendance_batch import process_batch, MAX_BATCH_EVENTS
+from occupancy import apply_events
+
+QueuedEvent = namedtuple('QueuedEvent', ['sequence', 'event'])
+
+QUEUE_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS events ("
+    "sequence INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, queued_at TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS rejected ("
+    "sequence INTEGER PRIMARY KEY, payload TEXT NOT NULL, error TEXT, rejected_at TEXT NOT NULL)",
+]
+
+
+class AttendanceQueue:
+    """Durable FIFO of attendance events in a local SQLite file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # Shared by the request threads and the flush worker, guarded by _lock
+        self._connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=FULL")
+        with self._lock:
+            for statement in QUEUE_SCHEMA:
+                self._connection.execute(statement)
+            self._connection.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('queue_id', ?)", (str(uuid.uuid4()),)
+            )
+            self.queue_id = self._connection.execute(
+                "SELECT value FROM meta WHERE key = 'queue_id'"
+            ).fetchone()[0]
+
+    def append(self, event):
+        """Durably append an event; returns its sequence number"""
+        with self._lock:
+            cursor = self._connection.execute(
+                "INSERT INTO events (payload, queued_at) VALUES (?, ?)",
+                (json.dumps(event), datetime.now(timezone.utc).isoformat())
+            )
+            return cursor.lastrowid
+
+    def peek(self, limit):
+        """Oldest `limit` events, without removing them"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT sequence, payload FROM events ORDER BY sequence LIMIT ?", (limit,)
+            ).fetchall()
+        return [QueuedEvent(sequence, json.loads(payload)) for sequence, payload in rows]
+
+    def ack(self, last_sequence, rejected=()):
+        """Remove events up to `last_sequence`, keeping `rejected` (QueuedEvent, error) pairs aside"""
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO rejected (sequence, payload, error, rejected_at) VALUES (?, ?, ?, ?)",
+                    [(queued.sequence, json.dumps(queued.event), error, now) for queued, error in rejected]
+                )
+                self._connection.execute("DELETE FROM events WHERE sequence <= ?", (last_sequence,))
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def pending(self):
+        with self._lock:
+            return self._connection.execute("SELECT count(*) FROM events").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def get_queue(app=None):
+    """The attendance queue of `app` (opened once per process)"""
+    app = app or current_app._get_current_object()
+    if 'attendance_queue' not in app.extensions:
+        app.extensions['attendance_queue'] = AttendanceQueue(app.config['ATTENDANCE_QUEUE_PATH'])
+    return app.extensions['attendance_queue']
+
+
+def enqueue(event):
+    """Acknowledge an event by appending it to the queue; returns its sequence number"""
+    return get_queue().append(event)
+
+
+def flush(queue, batch_size):
+    """Apply the oldest `batch_size` events to the database; returns the number read"""
+    queued = queue.peek(batch_size)
+    if not queued:
+        return 0
+
+    # Locked so flushers of several processes sharing the file take turns
+    checkpoint = db.session.get(AttendanceQueueCheckpoint, queue.queue_id, with_for_update=True)
+    if checkpoint is None:
+        checkpoint = AttendanceQueueCheckpoint(queue_id=queue.queue_id, last_sequence=0)
+        db.session.add(checkpoint)
+
+    # Events up to the checkpoint were applied before a crash or by another process
+    unapplied = [item for item in queued if item.sequence > checkpoint.last_sequence]
+    rejected = []
+    occupancy_events = []
+    if unapplied:
+        results, occupancy_events = process_batch([item.event for item in unapplied])
+        rejected = [(item, result['error']) for item, result in zip(unapplied, results)
+                    if result['status'] == 'error']
+        checkpoint.last_sequence = unapplied[-1].sequence
+    db.session.commit()
+    apply_events(occupancy_events)
+
+    queue.ack(queued[-1].sequence, rejected)
+    for item, error in rejected:
+        print(f"Rejected queued attendance event {item.sequence}: {error}")
+    return len(queued)
+
+
+def flush_pending(max_batches=None):
+    """Flush the current app's queue until it is empty; returns the number of events read"""
+    queue = get_queue()
+    batch_size = min(current_app.config['ATTENDANCE_FLUSH_BATCH_SIZE'], MAX_BATCH_EVENTS)
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        count = flush(queue, batch_size)
+        if not count:
+            break
+        total += count
+        batches += 1
+    return total
+
+
+def main():
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        total = flush_pending()
+        print(f"Done. Flushed {total} queued attendance events.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Attendance rollups.
+
+- attendance_daily: visits, completed sessions and workout minutes per
+  member and day of check-in;
+- attendance_hourly: check-ins of the whole gym per day and hour.
+
+Reports read these tables instead of grouping raw attendance rows, so
+their cost does not grow with the history. Routes call record_sessions()
+in the same transaction as the check-ins/check-outs it accounts for.
+Sessions auto-closed by the stale-session sweeper count as visits but not
+as completed sessions, so they stay out of duration averages. The
+rollups can be rebuilt from the raw rows of a time range with
+rebuild_rollups(), which the partition retention job also does before it
+archives old partitions. Deleted sessions are taken back out with
+forget_sessions().
+
+Rebuild the rollups of all raw attendance with:
+    python attendance_rollups.py
+"""
+
+import sys
+import os
+from collections import defaultdict
+from datetime import datetime, timezone
+
+# Add the backend directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from models import db, Attendance, AttendanceDaily, AttendanceHourly
+from attendance_stats import visit_date_expr, visit_hour_expr, session_minutes_expr
+from db_utils import dialect_insert
+from sqlalchemy import select, insert, update, delete, func, case, and_, bindparam
+
+
+def _as_utc(value):
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def session_minutes(check_in, check_out):
+    """Whole minutes of a session, like session_minutes_expr()"""
+    return int((_as_utc(check_out) - _as_utc(check_in)).total_seconds() / 60)
+
+
+def record_sessions(check_ins=(), check_outs=()):
+    """
+    Account for new check-ins, as (member_id, check_in), and check-outs, as
+    (member_id, check_in, check_out), with one upsert per rollup table
+    """
+    daily = defaultdict(lambda: [0, 0, 0])
+    hourly = defaultdict(int)
+    for member_id, check_in in check_ins:
+        check_in = _as_utc(check_in)
+        daily[(check_in.date(), member_id)][0] += 1
+        hourly[(check_in.date(), check_in.hour)] += 1
+    for member_id, check_in, check_out in check_outs:
+        # Sessions are counted on the day they started
+        totals = daily[(_as_utc(check_in).date(), member_id)]
+        totals[1] += 1
+        totals[2] += session_minutes(check_in, check_out)
+
+    # Keys are sorted so concurrent upserts lock rows in the same order
+    if daily:
+        statement = dialect_insert(AttendanceDaily).values([{
+            'day': day,
+            'member_id': member_id,
+            'visits': visits,
+            'completed_sessions': completed,
+            'workout_minutes': minutes
+        } for (day, member_id), (visits, completed, minutes) in sorted(daily.items(), key=str)])
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['day', 'member_id'],
+            set_={
+                'visits': AttendanceDaily.visits + statement.excluded.visits,
+                'completed_sessions': AttendanceDaily.completed_sessions + statement.excluded.completed_sessions,
+                'workout_minutes': AttendanceDaily.workout_minutes + statement.excluded.workout_minutes
+            }
+        ))
+    if hourly:
+        statement = dialect_insert(AttendanceHourly).values([
+            {'day': day, 'hour': hour, 'visits': visits} for (day, hour), visits in sorted(hourly.items())
+        ])
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['day', 'hour'],
+            set_={'visits': AttendanceHourly.visits + statement.excluded.visits}
+        ))
+
+
+def forget_sessions(sessions):
+    """
+    Take deleted sessions, as (member_id, check_in, check_out, auto_closed),
+    back out of both rollups: the reverse of record_sessions() for their
+    check-ins and (unless auto-closed) check-outs
+    """
+    daily = defaultdict(lambda: [0, 0, 0])
+    hourly = defaultdict(int)
+    for member_id, check_in, check_out, auto_closed in sessions:
+        check_in = _as_utc(check_in)
+        totals = daily[(check_in.date(), member_id)]
+        totals[0] += 1
+        if check_out is not None and not auto_closed:
+            totals[1] += 1
+            totals[2] += session_minutes(check_in, check_out)
+        hourly[(check_in.date(), check_in.hour)] += 1
+
+    if daily:
+        table = AttendanceDaily.__table__
+        db.session.execute(update(table).where(
+            table.c.day == bindparam('b_day'), table.c.member_id == bindparam('b_member_id')
+        ).values(
+            visits=table.c.visits - bindparam('b_visits'),
+            completed_sessions=table.c.completed_sessions - bindparam('b_completed'),
+            workout_minutes=table.c.workout_minutes - bindparam('b_minutes')
+        ), [{
+            'b_day': day, 'b_member_id': member_id, 'b_visits': visits,
+            'b_completed': completed, 'b_minutes': minutes
+        } for (day, member_id), (visits, completed, minutes) in sorted(daily.items(), key=str)])
+    if hourly:
+        table = AttendanceHourly.__table__
+        db.session.execute(update(table).where(
+            table.c.day == bindparam('b_day'), table.c.hour == bindparam('b_hour')
+        ).values(visits=table.c.visits - bindparam('b_visits')), [
+            {'b_day': day, 'b_hour': hour, 'b_visits': visits} for (day, hour), visits in sorted(hourly.items())
+        ])
+
+
+def rebuild_rollups(start, end):
+    """Recompute both rollups for check-ins in [start, end) (day boundaries) from raw rows"""
+    in_range = [Attendance.check_in >= start, Attendance.check_in < end]
+
+    db.session.execute(delete(AttendanceDaily).where(
+        AttendanceDaily.day >= start.date(), AttendanceDaily.day < end.date()
+    ))
+    day = visit_date_expr()
+    # Sessions closed by the stale-session sweeper have no real duration
+    completed = and_(Attendance.check_out.isnot(None), Attendance.auto_closed.is_(False))
+    db.session.execute(insert(AttendanceDaily).from_select(
+        ['day', 'member_id', 'visits', 'completed_sessions', 'workout_minutes'],
+        select(
+            day,
+            Attendance.member_id,
+            func.count(Attendance.id),
+            func.count(case((completed, 1))),
+            func.coalesce(func.sum(case((completed, session_minutes_expr()))), 0)
+        ).where(*in_range, Attendance.member_id.isnot(None)).group_by(day, Attendance.member_id)
+    ))
+
+    db.session.execute(delete(AttendanceHourly).where(
+        AttendanceHourly.day >= start.date(), AttendanceHourly.day < end.date()
+    ))
+    hour = visit_hour_expr()
+    db.session.execute(insert(AttendanceHourly).from_select(
+        ['day', 'hour', 'visits'],
+        select(day, hour, func.count(Attendance.id)).where(*in_range).group_by(day, hour)
+    ))
+
+
+def rebuild_all():
+    """
+    Rebuild the rollups month by month from the earliest raw check-in,
+    committing per month. Rollups of archived partitions are left alone.
+    """
+    first = db.session.query(func.min(Attendance.check_in)).scalar()
+    if first is None:
+        return 0
+    first = _as_utc(first) if isinstance(first, datetime) else datetime.fromisoformat(first).replace(tzinfo=timezone.utc)
+    start = datetime(first.year, first.month, 1, tzinfo=timezone.utc)
+    now = datetime.now(timezone.utc)
+    months = 0
+    while start <= now:
+        end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1, tzinfo=timezone.utc)
+        rebuild_rollups(start, end)
+        db.session.commit()
+        months += 1
+        print(f"Rebuilt attendance rollups for {start:%Y-%m}")
+        start = end
+    return months
+
+
+def main():
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        months = rebuild_all()
+        print(f"Done. Rebuilt {months} months of attendance rollups.")
+
+
+if __name__ == "__main__":
+    main()
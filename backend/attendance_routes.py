@@ -1,8 +1,23 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Attendance, Member, Trainer, User, Role
+from models import db, Attendance, AttendanceDaily, AttendanceHourly, Member, MemberSummary, Trainer, User, Role
+from pagination import InvalidCursor, keyset_paginate, page_meta, wants_total
+from export_utils import EXPORT_FORMATS, EXPORT_BATCH_SIZE, stream_export
+from member_summary import record_check_in, record_check_out
+from member_listing import visit_engagement
+from attendance_stats import daily_attendance, weekly_pattern, members_attended_since
+from attendance_rollups import record_sessions, session_minutes
+from trainer_analytics import record_trainer_clients
+from attendance_heatmap import occupancy_heatmap, MAX_HEATMAP_WEEKS
+from attendance_forecast import forecast, MAX_FORECAST_HOURS
+from event_hub import hub as event_hub, stream as event_stream
+from attendance_checkin import insert_check_in, find_by_idempotency_key, rejection_reason, MAX_IDEMPOTENCY_KEY_LENGTH
+from occupancy import tracker as occupancy_tracker, current_members as occupancy_current_members, \
+    check_in_event, check_out_event, publish_event, apply_event, apply_events
+from attendance_batch import process_batch, MAX_BATCH_EVENTS
+from attendance_queue import enqueue
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import func, desc, and_, extract
+from sqlalchemy import select, func, desc, and_, extract
 from datetime import datetime, timezone, date, timedelta
 import uuid
 
@@ -31,6 +46,67 @@ def is_member(user):
     """Check if user has member role"""
     return user and user.role and user.role.name == 'MEMBER'
 
+def filter_attendance(query, current_user, args):
+    """
+    Apply the role-based visibility rules and the member_id, trainer_id,
+    start_date and end_date filters of `args` to an attendance query (or
+    select). Returns (query, None), or (None, error response)
+    """
+    member_id = args.get('member_id')
+    trainer_id = args.get('trainer_id')
+    start_date = args.get('start_date')  # YYYY-MM-DD
+    end_date = args.get('end_date')      # YYYY-MM-DD
+    
+    # Apply role-based filtering
+    if is_member(current_user):
+        # Members can only see their own attendance
+        if current_user.member_profile:
+            query = query.filter(Attendance.member_id == current_user.member_profile.id)
+        else:
+            return None, (jsonify({'error': 'Member profile not found'}), 404)
+    elif is_trainer(current_user):
+        # Trainers can see their own sessions and all attendance if no specific filters
+        if not (member_id or trainer_id):
+            # If no specific filters, show trainer's own sessions
+            if current_user.trainer_profile:
+                query = query.filter(Attendance.trainer_id == current_user.trainer_profile.id)
+            else:
+                return None, (jsonify({'error': 'Trainer profile not found'}), 404)
+    elif not is_admin(current_user):
+        return None, (jsonify({'error': 'Insufficient permissions'}), 403)
+    
+    # Apply additional filters
+    if member_id:
+        try:
+            uuid.UUID(member_id)
+            query = query.filter(Attendance.member_id == member_id)
+        except ValueError:
+            return None, (jsonify({'error': 'Invalid member ID format'}), 400)
+    
+    if trainer_id:
+        try:
+            uuid.UUID(trainer_id)
+            query = query.filter(Attendance.trainer_id == trainer_id)
+        except ValueError:
+            return None, (jsonify({'error': 'Invalid trainer ID format'}), 400)
+    
+    # Apply date filters
+    if start_date:
+        try:
+            start_dt = datetime.strptime(start_date, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+            query = query.filter(Attendance.check_in >= start_dt)
+        except ValueError:
+            return None, (jsonify({'error': 'Invalid start_date format. Use YYYY-MM-DD'}), 400)
+    
+    if end_date:
+        try:
+            end_dt = datetime.strptime(end_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59, tzinfo=timezone.utc)
+            query = query.filter(Attendance.check_in <= end_dt)
+        except ValueError:
+            return None, (jsonify({'error': 'Invalid end_date format. Use YYYY-MM-DD'}), 400)
+    
+    return query, None
+
 @attendance_bp.route('/', methods=['GET'])
 @jwt_required()
 def get_attendance_records():
@@ -41,72 +117,31 @@ def get_attendance_records():
             return jsonify({'error': 'User not found'}), 404
         
         # Get query parameters
-        member_id = request.args.get('member_id')
-        trainer_id = request.args.get('trainer_id')
-        start_date = request.args.get('start_date')  # YYYY-MM-DD
-        end_date = request.args.get('end_date')      # YYYY-MM-DD
         page = int(request.args.get('page', 1))
         limit = int(request.args.get('limit', 50))
+        cursor = request.args.get('cursor')  # present (even empty) selects cursor mode
+        cursor_mode = cursor is not None
         
         # Build base query
         query = db.session.query(Attendance)\
             .join(Member, Attendance.member_id == Member.id, isouter=True)\
             .join(Trainer, Attendance.trainer_id == Trainer.id, isouter=True)
+        query, error = filter_attendance(query, current_user, request.args)
+        if error:
+            return error
         
-        # Apply role-based filtering
-        if is_member(current_user):
-            # Members can only see their own attendance
-            if current_user.member_profile:
-                query = query.filter(Attendance.member_id == current_user.member_profile.id)
-            else:
-                return jsonify({'error': 'Member profile not found'}), 404
-        elif is_trainer(current_user):
-            # Trainers can see their own sessions and all attendance if no specific filters
-            if not (member_id or trainer_id):
-                # If no specific filters, show trainer's own sessions
-                if current_user.trainer_profile:
-                    query = query.filter(Attendance.trainer_id == current_user.trainer_profile.id)
-                else:
-                    return jsonify({'error': 'Trainer profile not found'}), 404
-        elif not is_admin(current_user):
-            return jsonify({'error': 'Insufficient permissions'}), 403
-        
-        # Apply additional filters
-        if member_id:
-            try:
-                uuid.UUID(member_id)
-                query = query.filter(Attendance.member_id == member_id)
-            except ValueError:
-                return jsonify({'error': 'Invalid member ID format'}), 400
-        
-        if trainer_id:
-            try:
-                uuid.UUID(trainer_id)
-                query = query.filter(Attendance.trainer_id == trainer_id)
-            except ValueError:
-                return jsonify({'error': 'Invalid trainer ID format'}), 400
-        
-        # Apply date filters
-        if start_date:
-            try:
-                start_dt = datetime.strptime(start_date, '%Y-%m-%d').replace(tzinfo=timezone.utc)
-                query = query.filter(Attendance.check_in >= start_dt)
-            except ValueError:
-                return jsonify({'error': 'Invalid start_date format. Use YYYY-MM-DD'}), 400
-        
-        if end_date:
-            try:
-                end_dt = datetime.strptime(end_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59, tzinfo=timezone.utc)
-                query = query.filter(Attendance.check_in <= end_dt)
-            except ValueError:
-                return jsonify({'error': 'Invalid end_date format. Use YYYY-MM-DD'}), 400
-        
-        # Get total count
-        total = query.count()
+        # Get total count (optional in cursor mode)
+        total = query.count() if wants_total(request.args, cursor_mode) else None
         
         # Apply pagination and ordering
-        attendance_records = query.order_by(desc(Attendance.check_in))\
-            .offset((page - 1) * limit).limit(limit).all()
+        next_cursor = None
+        if cursor_mode:
+            attendance_records, next_cursor = keyset_paginate(
+                query, [(Attendance.check_in, True), (Attendance.id, True)], cursor, limit
+            )
+        else:
+            attendance_records = query.order_by(desc(Attendance.check_in))\
+                .offset((page - 1) * limit).limit(limit).all()
         
         # Format response
         attendance_data = []
@@ -119,11 +154,14 @@ def get_attendance_records():
                 'trainer_name': f"{record.trainer.first_name} {record.trainer.last_name}" if record.trainer else None,
                 'check_in': record.check_in.isoformat(),
                 'check_out': record.check_out.isoformat() if record.check_out else None,
+                'auto_closed': record.auto_closed,
                 'created_at': record.created_at.isoformat() if record.created_at else None
             }
             
-            # Calculate session duration
-            if record.check_out:
+            # Calculate session duration (unknown for sessions closed by the sweeper)
+            if record.auto_closed:
+                record_dict['duration_minutes'] = None
+            elif record.check_out:
                 duration = record.check_out - record.check_in
                 record_dict['duration_minutes'] = int(duration.total_seconds() / 60)
             else:
@@ -134,12 +172,68 @@ def get_attendance_records():
         
         return jsonify({
             'attendance': attendance_data,
-            'total': total,
-            'page': page,
-            'limit': limit,
-            'pages': (total + limit - 1) // limit
+            **page_meta(limit, total, page, next_cursor, cursor_mode)
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+EXPORT_COLUMNS = [
+    'id', 'member_id', 'member_name', 'trainer_id', 'trainer_name',
+    'check_in', 'check_out', 'duration_minutes', 'auto_closed'
+]
+
+@attendance_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_attendance():
+    """
+    Stream raw attendance sessions as CSV or NDJSON, oldest first, with the
+    same filters and role-based visibility as the attendance list
+    """
+    try:
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        fmt = request.args.get('format', 'csv').lower()
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({'error': 'format must be csv or ndjson'}), 400
+        
+        # Plain columns read through a server-side cursor, EXPORT_BATCH_SIZE at a time
+        query = select(
+            Attendance.id, Attendance.member_id, Member.first_name.label('member_first_name'),
+            Member.last_name.label('member_last_name'), Attendance.trainer_id,
+            Trainer.first_name.label('trainer_first_name'), Trainer.last_name.label('trainer_last_name'),
+            Attendance.check_in, Attendance.check_out, Attendance.auto_closed
+        ).outerjoin(Member, Attendance.member_id == Member.id)\
+            .outerjoin(Trainer, Attendance.trainer_id == Trainer.id)
+        query, error = filter_attendance(query, current_user, request.args)
+        if error:
+            return error
+        query = query.order_by(Attendance.check_in, Attendance.id)\
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        
+        def sessions():
+            for batch in db.session.execute(query).partitions():
+                for row in batch:
+                    completed = row.check_out is not None and not row.auto_closed
+                    yield {
+                        'id': str(row.id),
+                        'member_id': str(row.member_id) if row.member_id else None,
+                        'member_name': f"{row.member_first_name} {row.member_last_name}" if row.member_id else None,
+                        'trainer_id': str(row.trainer_id) if row.trainer_id else None,
+                        'trainer_name': f"{row.trainer_first_name} {row.trainer_last_name}" if row.trainer_id else None,
+                        'check_in': row.check_in.isoformat(),
+                        'check_out': row.check_out.isoformat() if row.check_out else None,
+                        'duration_minutes': session_minutes(row.check_in, row.check_out) if completed else None,
+                        'auto_closed': row.auto_closed
+                    }
+        
+        filename = f"attendance-{datetime.now(timezone.utc).strftime('%Y%m%d')}"
+        return stream_export(fmt, EXPORT_COLUMNS, sessions(), filename)
+        
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -173,53 +267,76 @@ def check_in():
         else:
             return jsonify({'error': 'Insufficient permissions'}), 403
         
-        # Verify member exists
-        member = Member.query.get(member_id)
-        if not member:
-            return jsonify({'error': 'Member not found'}), 404
-        
-        # Check if member is already checked in (no check-out record)
-        existing_checkin = Attendance.query.filter(
-            Attendance.member_id == member_id,
-            Attendance.check_out.is_(None)
-        ).first()
-        
-        if existing_checkin:
-            return jsonify({
-                'error': 'Member is already checked in',
-                'existing_checkin': existing_checkin.check_in.isoformat()
-            }), 400
-        
         # Get trainer_id if provided
         trainer_id = None
         if data and data.get('trainer_id'):
             try:
-                uuid.UUID(data['trainer_id'])
-                trainer = Trainer.query.get(data['trainer_id'])
-                if trainer:
-                    trainer_id = data['trainer_id']
-                else:
-                    return jsonify({'error': 'Trainer not found'}), 404
+                trainer_id = uuid.UUID(data['trainer_id'])
             except ValueError:
                 return jsonify({'error': 'Invalid trainer ID format'}), 400
         
-        # Create attendance record
-        attendance = Attendance(
-            member_id=member_id,
-            trainer_id=trainer_id,
-            check_in=datetime.now(timezone.utc)
-        )
-        
-        db.session.add(attendance)
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key and len(idempotency_key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+            return jsonify({'error': f'Idempotency-Key must be at most {MAX_IDEMPOTENCY_KEY_LENGTH} characters'}), 400
+        
+        if current_app.config['ATTENDANCE_WRITE_BEHIND']:
+            # Applied by the flush worker; its checks run then
+            check_in_time = datetime.now(timezone.utc)
+            sequence = enqueue({
+                'type': 'check_in',
+                'member_id': str(member_id),
+                'timestamp': check_in_time.isoformat(),
+                'trainer_id': str(trainer_id) if trainer_id else None,
+                'event_id': idempotency_key
+            })
+            return jsonify({
+                'message': 'Check-in queued',
+                'queued': {'sequence': sequence, 'member_id': str(member_id), 'check_in': check_in_time.isoformat()}
+            }), 202
+        
+        # One statement: inserts nothing if the member is unknown, already
+        # checked in, or this key was used before
+        checked_in = insert_check_in(member_id, trainer_id, idempotency_key=idempotency_key)
+        
+        if checked_in is None:
+            db.session.rollback()
+        
+            # Retried request: answer with the session it created
+            previous = find_by_idempotency_key(idempotency_key)
+            if previous:
+                if str(previous.member_id) != str(member_id):
+                    return jsonify({'error': 'Idempotency-Key was already used for another member'}), 409
+                return jsonify({
+                    'message': 'Check-in already recorded',
+                    'attendance': {
+                        'id': str(previous.id),
+                        'member_name': f"{previous.member.first_name} {previous.member.last_name}",
+                        'check_in': previous.check_in.isoformat(),
+                        'trainer_name': f"{previous.trainer.first_name} {previous.trainer.last_name}" if previous.trainer else None
+                    }
+                }), 200
+        
+            error, status, open_session = rejection_reason(member_id, trainer_id)
+            response = {'error': error}
+            if open_session:
+                response['existing_checkin'] = open_session.check_in.isoformat()
+            return jsonify(response), status
+        
+        record_check_in(checked_in.member_id, checked_in.check_in)
+        record_sessions(check_ins=[(checked_in.member_id, checked_in.check_in)])
+        record_trainer_clients([(trainer_id, checked_in.member_id, checked_in.check_in)])
+        event = check_in_event(checked_in)
+        publish_event(event)
         db.session.commit()
+        apply_event(event)
         
         return jsonify({
             'message': 'Check-in recorded successfully',
             'attendance': {
-                'id': str(attendance.id),
-                'member_name': f"{member.first_name} {member.last_name}",
-                'check_in': attendance.check_in.isoformat(),
-                'trainer_name': f"{attendance.trainer.first_name} {attendance.trainer.last_name}" if attendance.trainer else None
+                'id': str(checked_in.id),
+                'member_name': checked_in.member_name,
+                'check_in': checked_in.check_in.isoformat(),
+                'trainer_name': checked_in.trainer_name
             }
         }), 201
         
@@ -260,6 +377,19 @@ def check_out():
         else:
             return jsonify({'error': 'Insufficient permissions'}), 403
         
+        if current_app.config['ATTENDANCE_WRITE_BEHIND']:
+            # Applied by the flush worker; its checks run then
+            check_out_time = datetime.now(timezone.utc)
+            sequence = enqueue({
+                'type': 'check_out',
+                'member_id': str(member_id),
+                'timestamp': check_out_time.isoformat()
+            })
+            return jsonify({
+                'message': 'Check-out queued',
+                'queued': {'sequence': sequence, 'member_id': str(member_id), 'check_out': check_out_time.isoformat()}
+            }), 202
+        
         # Find active check-in record
         attendance = Attendance.query.filter(
             Attendance.member_id == member_id,
@@ -277,7 +407,12 @@ def check_out():
         duration = check_out_time - attendance.check_in
         duration_minutes = int(duration.total_seconds() / 60)
         
+        record_check_out(attendance.member_id, check_out_time)
+        record_sessions(check_outs=[(attendance.member_id, attendance.check_in, check_out_time)])
+        event = check_out_event(attendance)
+        publish_event(event)
         db.session.commit()
+        apply_event(event)
         
         return jsonify({
             'message': 'Check-out recorded successfully',
@@ -296,6 +431,47 @@ def check_out():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@attendance_bp.route('/batch', methods=['POST'])
+@jwt_required()
+def batch_attendance():
+    """Record an ordered batch of check-in/check-out events from a gateway (Admin/Trainer only)"""
+    try:
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        if not (is_admin(current_user) or is_trainer(current_user)):
+            return jsonify({'error': 'Admin or Trainer access required'}), 403
+        
+        data = request.get_json()
+        events = data.get('events') if isinstance(data, dict) else data
+        if not isinstance(events, list) or not events:
+            return jsonify({'error': 'events must be a non-empty list'}), 400
+        if len(events) > MAX_BATCH_EVENTS:
+            return jsonify({'error': f'At most {MAX_BATCH_EVENTS} events per batch'}), 400
+        
+        results, occupancy_events = process_batch(events)
+        db.session.commit()
+        apply_events(occupancy_events)
+        
+        succeeded = sum(1 for result in results if result['status'] == 'ok')
+        duplicates = sum(1 for result in results if result['status'] == 'duplicate')
+        return jsonify({
+            'message': f'Processed {len(results)} events',
+            'processed': len(results),
+            'succeeded': succeeded,
+            'duplicates': duplicates,
+            'failed': len(results) - succeeded - duplicates,
+            'results': results
+        }), 200
+        
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return jsonify({'error': 'Database error occurred'}), 500
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @attendance_bp.route('/current', methods=['GET'])
 @jwt_required()
 def get_current_attendance():
@@ -308,28 +484,8 @@ def get_current_attendance():
         if not (is_admin(current_user) or is_trainer(current_user)):
             return jsonify({'error': 'Admin or Trainer access required'}), 403
         
-        # Get all active check-ins (no check-out)
-        active_attendance = db.session.query(Attendance)\
-            .join(Member)\
-            .filter(Attendance.check_out.is_(None))\
-            .order_by(Attendance.check_in).all()
-        
-        current_members = []
-        for record in active_attendance:
-            # Calculate time since check-in
-            time_since_checkin = datetime.now(timezone.utc) - record.check_in
-            hours_since = int(time_since_checkin.total_seconds() / 3600)
-            minutes_since = int((time_since_checkin.total_seconds() % 3600) / 60)
-            
-            member_data = {
-                'attendance_id': str(record.id),
-                'member_id': str(record.member_id),
-                'member_name': f"{record.member.first_name} {record.member.last_name}",
-                'check_in': record.check_in.isoformat(),
-                'time_since_checkin': f"{hours_since}h {minutes_since}m",
-                'trainer_name': f"{record.trainer.first_name} {record.trainer.last_name}" if record.trainer else None
-            }
-            current_members.append(member_data)
+        # All active check-ins (no check-out), served from the in-memory tracker
+        current_members = occupancy_current_members(occupancy_tracker.sessions())
         
         return jsonify({
             'current_members': current_members,
@@ -339,6 +495,38 @@ def get_current_attendance():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@attendance_bp.route('/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_attendance():
+    """
+    Server-sent events with live check-ins/check-outs and occupancy (Admin/Trainer only).
+    Browsers' EventSource cannot set headers, so the token may be passed as ?jwt=
+    """
+    try:
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        if not (is_admin(current_user) or is_trainer(current_user)):
+            return jsonify({'error': 'Admin or Trainer access required'}), 403
+        
+        # Subscribe before the snapshot so no event falls in between
+        subscriber = event_hub.subscribe()
+        sessions = occupancy_tracker.sessions()
+        snapshot = {
+            'occupancy': len(sessions),
+            'current_members': occupancy_current_members(sessions)
+        }
+        db.session.remove()
+        
+        return Response(event_stream(subscriber, snapshot), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @attendance_bp.route('/stats', methods=['GET'])
 @jwt_required()
 def get_attendance_statistics():
@@ -373,42 +561,31 @@ def get_attendance_statistics():
         
         start_datetime = datetime.combine(start_date, datetime.min.time()).replace(tzinfo=timezone.utc)
         
-        # Build base query
-        query = db.session.query(Attendance)\
-            .filter(Attendance.check_in >= start_datetime)
-        
         if member_id:
             try:
                 uuid.UUID(member_id)
-                query = query.filter(Attendance.member_id == member_id)
             except ValueError:
                 return jsonify({'error': 'Invalid member ID format'}), 400
         
-        # Get attendance records
-        attendance_records = query.all()
+        # Per-day visits, completed sessions and minutes, aggregated in the database
+        daily = daily_attendance(start_datetime, member_id)
         
         # Calculate statistics
-        total_visits = len(attendance_records)
+        total_visits = sum(visits for visits, _, _ in daily.values())
+        completed_sessions = sum(completed for _, completed, _ in daily.values())
         
         # Calculate total workout time (only completed sessions)
-        completed_sessions = [a for a in attendance_records if a.check_out]
-        total_workout_minutes = sum(
-            int((a.check_out - a.check_in).total_seconds() / 60)
-            for a in completed_sessions
-        )
+        total_workout_minutes = sum(minutes for _, _, minutes in daily.values())
         
         # Calculate average session duration
         avg_session_minutes = 0
         if completed_sessions:
-            avg_session_minutes = total_workout_minutes / len(completed_sessions)
+            avg_session_minutes = total_workout_minutes / completed_sessions
         
         # Daily visit counts for trend analysis
-        daily_visits = {}
-        for record in attendance_records:
-            visit_date = record.check_in.date()
-            daily_visits[visit_date] = daily_visits.get(visit_date, 0) + 1
+        daily_visits = {visit_date: visits for visit_date, (visits, _, _) in sorted(daily.items())}
         
-        # Most active days
+        # Most active days (earliest wins a tie)
         most_active_day = None
         max_visits = 0
         if daily_visits:
@@ -416,11 +593,9 @@ def get_attendance_statistics():
             max_visits = daily_visits[most_active_day]
         
         # Weekly pattern (if enough data)
-        weekly_pattern = {}
+        weekly = {}
         if period in ['month', 'year']:
-            for record in attendance_records:
-                day_name = record.check_in.strftime('%A')
-                weekly_pattern[day_name] = weekly_pattern.get(day_name, 0) + 1
+            weekly = weekly_pattern(daily)
         
         # Member-specific stats (if single member)
         member_info = None
@@ -429,13 +604,14 @@ def get_attendance_statistics():
             if member:
                 # Calculate attendance rate
                 total_days = (today - start_date).days
-                unique_visit_days = len(set(record.check_in.date() for record in attendance_records))
+                unique_visit_days = len(daily_visits)
                 attendance_rate = (unique_visit_days / total_days) * 100 if total_days > 0 else 0
                 
                 member_info = {
                     'member_name': f"{member.first_name} {member.last_name}",
                     'unique_visit_days': unique_visit_days,
-                    'attendance_rate': round(attendance_rate, 1)
+                    'attendance_rate': round(attendance_rate, 1),
+                    **visit_engagement(db.session.get(MemberSummary, member.id))
                 }
         
         return jsonify({
@@ -451,7 +627,7 @@ def get_attendance_statistics():
                 'date': most_active_day.isoformat() if most_active_day else None,
                 'visits': max_visits
             },
-            'weekly_pattern': weekly_pattern,
+            'weekly_pattern': weekly,
             'daily_visits': {
                 date_str.isoformat(): count 
                 for date_str, count in daily_visits.items()
@@ -462,6 +638,48 @@ def get_attendance_statistics():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@attendance_bp.route('/heatmap', methods=['GET'])
+@jwt_required()
+def get_occupancy_heatmap():
+    """Average occupancy per weekday and hour over the last weeks (Admin/Trainer only)"""
+    try:
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        if not (is_admin(current_user) or is_trainer(current_user)):
+            return jsonify({'error': 'Admin or Trainer access required'}), 403
+        
+        weeks = request.args.get('weeks', 4, type=int)
+        if not weeks or not 1 <= weeks <= MAX_HEATMAP_WEEKS:
+            return jsonify({'error': f'weeks must be between 1 and {MAX_HEATMAP_WEEKS}'}), 400
+        
+        return jsonify(occupancy_heatmap(weeks, current_app.config['GYM_TIMEZONE'])), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@attendance_bp.route('/forecast', methods=['GET'])
+@jwt_required()
+def get_occupancy_forecast():
+    """Expected check-ins and occupancy for the next hours"""
+    try:
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        hours = request.args.get('hours', 3, type=int)
+        if not hours or not 1 <= hours <= MAX_FORECAST_HOURS:
+            return jsonify({'error': f'hours must be between 1 and {MAX_FORECAST_HOURS}'}), 400
+        
+        return jsonify(forecast(hours)), 200
+        
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return jsonify({'error': 'Database error occurred'}), 500
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @attendance_bp.route('/report', methods=['GET'])
 @jwt_required()
 def get_attendance_report():
@@ -490,54 +708,43 @@ def get_attendance_report():
         except ValueError:
             return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
         
-        # Get attendance data for the period
-        attendance_query = db.session.query(Attendance)\
-            .join(Member)\
-            .filter(
-                Attendance.check_in >= start_dt,
-                Attendance.check_in <= end_dt
-            )
+        # Read from the rollups; a check-in counts on its (UTC) day
+        first_day, last_day = start_dt.date(), end_dt.date()
         
         # Member attendance summary
         member_stats = db.session.query(
             Member.id,
             Member.first_name,
             Member.last_name,
-            func.count(Attendance.id).label('visit_count'),
-            func.sum(
-                func.case(
-                    (Attendance.check_out.isnot(None),
-                     func.extract('epoch', Attendance.check_out - Attendance.check_in) / 60),
-                    else_=0
-                )
-            ).label('total_minutes')
-        ).join(Attendance)\
+            func.sum(AttendanceDaily.visits).label('visit_count'),
+            func.sum(AttendanceDaily.workout_minutes).label('total_minutes')
+        ).join(AttendanceDaily, AttendanceDaily.member_id == Member.id)\
          .filter(
-             Attendance.check_in >= start_dt,
-             Attendance.check_in <= end_dt
+             AttendanceDaily.day >= first_day,
+             AttendanceDaily.day <= last_day
          )\
          .group_by(Member.id, Member.first_name, Member.last_name)\
          .order_by(desc('visit_count')).all()
         
         # Daily attendance counts
         daily_counts = db.session.query(
-            func.date(Attendance.check_in).label('date'),
-            func.count(Attendance.id).label('count')
+            AttendanceHourly.day.label('date'),
+            func.sum(AttendanceHourly.visits).label('count')
         ).filter(
-            Attendance.check_in >= start_dt,
-            Attendance.check_in <= end_dt
-        ).group_by(func.date(Attendance.check_in))\
-         .order_by('date').all()
+            AttendanceHourly.day >= first_day,
+            AttendanceHourly.day <= last_day
+        ).group_by(AttendanceHourly.day)\
+         .order_by(AttendanceHourly.day).all()
         
         # Peak hours analysis
         hourly_counts = db.session.query(
-            func.extract('hour', Attendance.check_in).label('hour'),
-            func.count(Attendance.id).label('count')
+            AttendanceHourly.hour.label('hour'),
+            func.sum(AttendanceHourly.visits).label('count')
         ).filter(
-            Attendance.check_in >= start_dt,
-            Attendance.check_in <= end_dt
-        ).group_by(func.extract('hour', Attendance.check_in))\
-         .order_by('hour').all()
+            AttendanceHourly.day >= first_day,
+            AttendanceHourly.day <= last_day
+        ).group_by(AttendanceHourly.hour)\
+         .order_by(AttendanceHourly.hour).all()
         
         # Format response
         member_summary = []
@@ -599,10 +806,8 @@ def get_attendance_stats():
         if total_members == 0:
             return jsonify({'average_attendance': 0}), 200
         
-        # Get unique members who attended in the last 30 days
-        attended_members = db.session.query(Attendance.member_id).filter(
-            Attendance.check_in >= thirty_days_ago
-        ).distinct().count()
+        # Unique members who attended in the last 30 days
+        attended_members = members_attended_since(thirty_days_ago)
         
         # Calculate average attendance percentage
         avg_attendance = round((attended_members / total_members) * 100, 1)
@@ -0,0 +1,100 @@
+"""
+SQL building blocks for attendance reporting.
+
+Statistics are read from the attendance rollups (see attendance_rollups.py)
+so their cost does not grow with the attendance history. The expressions
+here, used to build the rollups, hide the differences between PostgreSQL
+and SQLite date arithmetic.
+"""
+
+from models import db, Attendance, AttendanceDaily, MemberSummary
+from sqlalchemy import func, cast, Integer, extract, distinct, exists
+from datetime import date, datetime
+
+WEEKDAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def is_postgres():
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+
+def utc_expr(column):
+    """
+    A timestamptz column as UTC wall-clock time. PostgreSQL otherwise takes
+    dates and hours in the session TimeZone, while record_sessions() buckets
+    in UTC; SQLite stores the UTC values as given.
+    """
+    if is_postgres():
+        return func.timezone('UTC', column)
+    return column
+
+
+def visit_date_expr(column=Attendance.check_in):
+    """Calendar date (UTC) of a timestamp column"""
+    return func.date(utc_expr(column))
+
+
+def visit_hour_expr(column=Attendance.check_in):
+    """Hour of day (0-23, UTC) of a timestamp column"""
+    if is_postgres():
+        return cast(extract('hour', utc_expr(column)), Integer)
+    return cast(func.strftime('%H', column), Integer)
+
+
+def session_minutes_expr(check_in=Attendance.check_in, check_out=Attendance.check_out):
+    """Whole minutes between check-in and check-out (truncated, like int(seconds / 60))"""
+    if is_postgres():
+        return func.floor(extract('epoch', check_out - check_in) / 60)
+    seconds = cast(func.round((func.julianday(check_out) - func.julianday(check_in)) * 86400), Integer)
+    return seconds // 60
+
+
+def as_date(value):
+    """Dates come back as date objects from PostgreSQL and as strings from SQLite"""
+    if value is None or isinstance(value, date) and not isinstance(value, datetime):
+        return value
+    if isinstance(value, datetime):
+        return value.date()
+    return date.fromisoformat(value)
+
+
+def daily_attendance(start, member_id=None):
+    """
+    Visits, completed sessions and workout minutes per day since `start`,
+    as {date: (visits, completed_sessions, workout_minutes)}, read from the
+    attendance_daily rollup
+    """
+    query = db.session.query(
+        AttendanceDaily.day,
+        func.sum(AttendanceDaily.visits).label('visits'),
+        func.sum(AttendanceDaily.completed_sessions).label('completed_sessions'),
+        func.sum(AttendanceDaily.workout_minutes).label('workout_minutes')
+    ).filter(AttendanceDaily.day >= as_date(start))
+    if member_id:
+        query = query.filter(AttendanceDaily.member_id == member_id)
+    rows = query.group_by(AttendanceDaily.day).all()
+    return {as_date(row.day): (int(row.visits), int(row.completed_sessions), int(row.workout_minutes))
+            for row in rows}
+
+
+def weekly_pattern(daily):
+    """Visits per weekday name from per-day visit counts"""
+    pattern = {}
+    for day, (visits, _, _) in daily.items():
+        name = WEEKDAY_NAMES[day.weekday()]
+        pattern[name] = pattern.get(name, 0) + visits
+    return pattern
+
+
+def members_attended_since(since):
+    """
+    Number of members with a check-in since `since`: from the latest check-in
+    of their summary, or from the attendance rows of members without one
+    """
+    with_summary = db.session.query(func.count(MemberSummary.member_id))\
+        .filter(MemberSummary.last_check_in >= since).scalar()
+    without_summary = db.session.query(func.count(distinct(Attendance.member_id))).filter(
+        Attendance.check_in >= since,
+        ~exists().where(MemberSummary.member_id == Attendance.member_id)
+    ).scalar()
+    return with_summary + without_summary
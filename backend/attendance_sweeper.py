@@ -0,0 +1,91 @@
+"""
+Stale-session sweeper.
+
+Members who forget to check out leave open sessions behind, which would
+keep them "already checked in" and on the /attendance/current list forever.
+The attendance_sweeper worker started by create_app closes open sessions
+older than ATTENDANCE_MAX_SESSION_HOURS, SWEEP_BATCH_SIZE at a time with a
+commit per batch. A swept session gets check_out = check_in + the maximum
+duration and auto_closed = true. Its real duration is unknown, so it is
+not counted as a completed session in the rollups and duration averages,
+but it does move the member summary's last check-out.
+
+On PostgreSQL batches are claimed with FOR UPDATE SKIP LOCKED, so several
+processes can sweep at once.
+
+Sweep once from the command line with:
+    python attendance_sweeper.py
+"""
+
+import sys
+import os
+from datetime import datetime, timezone, timedelta
+
+# Add the backend directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import current_app
+from models import db, Attendance
+from attendance_batch import ClosedSession
+from member_summary import record_attendance
+from occupancy import check_out_event, publish_events, apply_events
+from sqlalchemy import update
+
+SWEEP_BATCH_SIZE = 500
+
+
+def _as_utc(value):
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def close_stale_batch(max_duration, batch_size=SWEEP_BATCH_SIZE):
+    """Close one batch of sessions open for longer than `max_duration`; returns the number closed"""
+    cutoff = datetime.now(timezone.utc) - max_duration
+    rows = db.session.query(Attendance.id, Attendance.member_id, Attendance.check_in).filter(
+        Attendance.check_out.is_(None),
+        Attendance.check_in < cutoff
+    ).order_by(Attendance.check_in).limit(batch_size).with_for_update(skip_locked=True).all()
+    if not rows:
+        db.session.rollback()
+        return 0
+
+    closed = [ClosedSession(row.id, row.member_id, _as_utc(row.check_in) + max_duration) for row in rows]
+    db.session.execute(update(Attendance), [
+        {'id': session.id, 'check_out': session.check_out, 'auto_closed': True} for session in closed
+    ])
+    record_attendance([], [(session.member_id, session.check_out) for session in closed if session.member_id])
+    events = [check_out_event(session) for session in closed]
+    publish_events(events)
+    db.session.commit()
+    apply_events(events)
+    return len(closed)
+
+
+def close_stale_sessions(max_duration=None):
+    """Close every stale open session, batch by batch; returns the number closed"""
+    if max_duration is None:
+        max_duration = timedelta(hours=current_app.config['ATTENDANCE_MAX_SESSION_HOURS'])
+    total = 0
+    while True:
+        closed = close_stale_batch(max_duration)
+        total += closed
+        if closed < SWEEP_BATCH_SIZE:
+            break
+    if total:
+        print(f"Auto-closed {total} stale attendance sessions")
+    return total
+
+
+def main():
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        total = close_stale_sessions()
+        print(f"Done. Closed {total} stale sessions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+In-process background workers.
+
+Each worker is a daemon thread that runs a function inside an application
+context every `interval` seconds, or sooner when woken with wake_worker().
+Work done by these functions must be safe to run from several processes at
+once (e.g. several gunicorn workers), since every process starts its own.
+"""
+
+import threading
+from models import db
+
+
+class PeriodicWorker(threading.Thread):
+    """Run `func` in an app context every `interval` seconds"""
+
+    def __init__(self, app, name, interval, func):
+        super().__init__(name=name, daemon=True)
+        self.app = app
+        self.interval = interval
+        self.func = func
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopped.is_set():
+                break
+            with self.app.app_context():
+                try:
+                    self.func()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Background worker {self.name} failed: {e}")
+                finally:
+                    db.session.remove()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+
+def start_worker(app, name, interval, func):
+    """Start a named worker for `app` (once per process)"""
+    workers = app.extensions.setdefault('background_workers', {})
+    if name not in workers:
+        worker = PeriodicWorker(app, name, interval, func)
+        workers[name] = worker
+        worker.start()
+    return workers[name]
+
+
+def wake_worker(app, name):
+    """Ask a running worker to run now instead of waiting for its interval"""
+    worker = app.extensions.get('background_workers', {}).get(name)
+    if worker:
+        worker.wake()
@@ -25,6 +25,38 @@ class Config:
     # App
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     DEBUG = os.environ.get('FLASK_DEBUG', 'False').lower() in ['true', '1', 'on']
+    
+    # Local timezone of the gym, used by reports that group by time of day
+    GYM_TIMEZONE = os.environ.get('GYM_TIMEZONE', 'UTC')
+    
+    # Background workers (member purge, ...) run as threads in every app process
+    BACKGROUND_WORKERS = os.environ.get('BACKGROUND_WORKERS', 'True').lower() in ['true', '1', 'on']
+    PURGE_INTERVAL_SECONDS = int(os.environ.get('PURGE_INTERVAL_SECONDS', 30))
+    
+    # Write-behind attendance: check-in/check-out are acknowledged once queued
+    # in a local SQLite file and flushed to the database by a background worker
+    ATTENDANCE_WRITE_BEHIND = os.environ.get('ATTENDANCE_WRITE_BEHIND', 'False').lower() in ['true', '1', 'on']
+    ATTENDANCE_QUEUE_PATH = os.environ.get('ATTENDANCE_QUEUE_PATH') or \
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'attendance_queue.db')
+    ATTENDANCE_FLUSH_INTERVAL_SECONDS = float(os.environ.get('ATTENDANCE_FLUSH_INTERVAL_SECONDS', 1))
+    ATTENDANCE_FLUSH_BATCH_SIZE = int(os.environ.get('ATTENDANCE_FLUSH_BATCH_SIZE', 500))
+    
+    # Monthly attendance partitions (PostgreSQL, see attendance_partitions.py)
+    ATTENDANCE_PARTITIONS_AHEAD = int(os.environ.get('ATTENDANCE_PARTITIONS_AHEAD', 3))
+    ATTENDANCE_RETENTION_MONTHS = int(os.environ.get('ATTENDANCE_RETENTION_MONTHS', 24))
+    ATTENDANCE_ARCHIVE_SCHEMA = os.environ.get('ATTENDANCE_ARCHIVE_SCHEMA', 'attendance_archive')
+    ATTENDANCE_RETENTION_DROP = os.environ.get('ATTENDANCE_RETENTION_DROP', 'False').lower() in ['true', '1', 'on']
+    PARTITION_MAINTENANCE_INTERVAL_SECONDS = int(os.environ.get('PARTITION_MAINTENANCE_INTERVAL_SECONDS', 3600))
+    
+    # Open sessions older than this are closed by the stale-session sweeper
+    ATTENDANCE_MAX_SESSION_HOURS = float(os.environ.get('ATTENDANCE_MAX_SESSION_HOURS', 6))
+    ATTENDANCE_SWEEP_INTERVAL_SECONDS = int(os.environ.get('ATTENDANCE_SWEEP_INTERVAL_SECONDS', 300))
+    
+    # Occupancy forecast: weeks of hourly rollups it is fitted on, and the
+    # local hour after which it is refitted once a day
+    ATTENDANCE_FORECAST_HISTORY_WEEKS = int(os.environ.get('ATTENDANCE_FORECAST_HISTORY_WEEKS', 12))
+    ATTENDANCE_FORECAST_REFIT_HOUR = int(os.environ.get('ATTENDANCE_FORECAST_REFIT_HOUR', 3))
+    ATTENDANCE_FORECAST_INTERVAL_SECONDS = int(os.environ.get('ATTENDANCE_FORECAST_INTERVAL_SECONDS', 900))
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -0,0 +1,27 @@
+"""
+Dialect helpers for statements that are not portable SQL.
+
+PostgreSQL is the production database; SQLite is supported for local
+development and tests.
+"""
+
+from models import db
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+def dialect_name():
+    return db.session.get_bind().dialect.name
+
+
+def dialect_insert(model):
+    """
+    INSERT construct of the current database's dialect, which adds
+    on_conflict_do_nothing() / on_conflict_do_update() (upserts)
+    """
+    name = dialect_name()
+    if name == 'postgresql':
+        return postgresql.insert(model)
+    if name == 'sqlite':
+        return sqlite.insert(model)
+    return insert(model)
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, Equipment, User, Role
+from pagination import InvalidCursor, keyset_paginate, page_meta, wants_total
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import func, desc
 from datetime import datetime, timezone, date, timedelta
@@ -46,6 +47,8 @@ def get_equipment():
         maintenance_status = request.args.get('maintenance_status', 'all')  # all, due, overdue
         page = int(request.args.get('page', 1))
         limit = int(request.args.get('limit', 50))
+        cursor = request.args.get('cursor')  # present (even empty) selects cursor mode
+        cursor_mode = cursor is not None
         
         # Build query
         query = Equipment.query
@@ -77,12 +80,21 @@ def get_equipment():
             # Past due date
             query = query.filter(Equipment.next_maintenance_date < today)
         
-        # Get total count for pagination
-        total = query.count()
+        # Get total count for pagination (optional in cursor mode)
+        total = query.count() if wants_total(request.args, cursor_mode) else None
         
         # Apply pagination and ordering
-        equipment_list = query.order_by(Equipment.category, Equipment.name)\
-            .offset((page - 1) * limit).limit(limit).all()
+        next_cursor = None
+        if cursor_mode:
+            # Category is nullable; compare on '' so the keyset predicate stays total
+            equipment_list, next_cursor = keyset_paginate(query, [
+                (func.coalesce(Equipment.category, ''), False),
+                (Equipment.name, False),
+                (Equipment.id, False)
+            ], cursor, limit)
+        else:
+            equipment_list = query.order_by(Equipment.category, Equipment.name)\
+                .offset((page - 1) * limit).limit(limit).all()
         
         # Format response
         equipment_data = []
@@ -125,12 +137,11 @@ def get_equipment():
         
         return jsonify({
             'equipment': equipment_data,
-            'total': total,
-            'page': page,
-            'limit': limit,
-            'pages': (total + limit - 1) // limit
+            **page_meta(limit, total, page, next_cursor, cursor_mode)
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -0,0 +1,91 @@
+"""
+Publish/subscribe hub for live attendance updates.
+
+/attendance/stream clients subscribe to the process-wide `hub`, which is fed
+by the occupancy tracker: every event that changes the open sessions (local
+check-ins/check-outs and, on PostgreSQL, those of other processes received
+by the LISTEN thread) is formatted as a server-sent event frame once and
+put on every subscriber's queue. Connected screens cost one broadcast per
+event instead of one query per poll. When the tracker reloads, a `resync`
+event carries all open sessions, like the snapshot a client gets first.
+
+A subscriber whose queue is full (a client that stopped reading) is
+dropped rather than slowing down the broadcast.
+"""
+
+import json
+import queue
+import threading
+from occupancy import tracker
+
+# Frames buffered per subscriber before it is considered stuck and dropped
+SUBSCRIBER_QUEUE_SIZE = 256
+
+# Comment frame sent when nothing happened, so proxies keep the connection open
+KEEPALIVE_SECONDS = 15
+
+
+def sse_frame(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class EventHub:
+    """Fan-out of preformatted SSE frames to subscriber queues"""
+
+    def __init__(self, queue_size=SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def broadcast(self, frame):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(frame)
+            except queue.Full:
+                self.unsubscribe(subscriber)
+                # Wakes the stream so it can end; the queue is full, so make room
+                try:
+                    subscriber.get_nowait()
+                    subscriber.put_nowait(None)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def publish_occupancy_event(self, event, count):
+        """OccupancyTracker listener"""
+        self.broadcast(sse_frame(event['type'], {**event, 'occupancy': count}))
+
+
+hub = EventHub()
+tracker.add_listener(hub.publish_occupancy_event)
+
+
+def stream(subscriber, snapshot):
+    """SSE frames for one client: the snapshot, then events until it is dropped"""
+    try:
+        yield sse_frame('snapshot', snapshot)
+        while True:
+            try:
+                frame = subscriber.get(timeout=KEEPALIVE_SECONDS)
+            except queue.Empty:
+                frame = ": keepalive\n\n"
+            if frame is None:
+                break
+            yield frame
+    finally:
+        hub.unsubscribe(subscriber)
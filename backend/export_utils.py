@@ -0,0 +1,68 @@
+"""
+Helpers for streaming exports.
+
+Exports are produced by generators that yield encoded chunks as rows are
+read from a server-side cursor, so memory use does not grow with the size
+of the table and the header reaches the client before the query finishes.
+"""
+
+import io
+import csv
+import json
+from flask import Response, stream_with_context
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = 1000
+
+# Rows buffered before a chunk is written to the response
+ROWS_PER_CHUNK = 200
+
+
+def _csv_chunks(columns, records):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    pending = 0
+    for record in records:
+        writer.writerow(['' if record.get(column) is None else record.get(column) for column in columns])
+        pending += 1
+        if pending >= ROWS_PER_CHUNK:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        yield buffer.getvalue()
+
+
+def _ndjson_chunks(columns, records):
+    lines = []
+    for record in records:
+        lines.append(json.dumps({column: record.get(column) for column in columns}, default=str))
+        if len(lines) >= ROWS_PER_CHUNK:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def stream_export(fmt, columns, records, filename):
+    """Streaming response of `records` (dicts) in csv or ndjson"""
+    chunks = _csv_chunks(columns, records) if fmt == 'csv' else _ndjson_chunks(columns, records)
+    return Response(
+        stream_with_context(chunks),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}.{fmt}"',
+            'X-Accel-Buffering': 'no'
+        }
+    )
@@ -21,6 +21,10 @@ from models import (
     Address, MembershipPlan, MemberMembership, WorkoutPlan, 
     DietPlan, Equipment, Attendance, Payment, PhysicalMetric
 )
+from member_summary import rebuild_all
+from attendance_rollups import rebuild_all as rebuild_attendance_rollups
+from trainer_analytics import rebuild_trainer_clients
+from payment_stats import invalidate_payment_stats
 
 fake = Faker('en_IN')  # Use Indian locale for more relevant data
 
@@ -58,7 +62,6 @@ def create_users_and_trainers(roles, count=10):
             bio=fake.text(max_nb_chars=200),
             rating=round(random.uniform(3.5, 5.0), 2),
             salary=random.randint(25000, 60000),
-            total_clients=random.randint(5, 30),
             availability=random.choice(availability_options),
             is_active=True
         )
@@ -366,6 +369,7 @@ def create_payments(members):
                 )
                 db.session.add(partial_payment)
     
+    invalidate_payment_stats()
     db.session.commit()
 
 def main():
@@ -412,6 +416,15 @@ def main():
         print("Creating payments...")
         create_payments(members)
         
+        # Build precomputed member summaries
+        print("Building member summaries...")
+        rebuild_all()
+        
+        # Attendance rollups and trainer client counts
+        print("Building attendance rollups and trainer clients...")
+        rebuild_attendance_rollups()
+        rebuild_trainer_clients()
+        
         print("\n" + "="*50)
         print("SYNTHETIC DATA GENERATION COMPLETE!")
         print("="*50)
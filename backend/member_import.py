@@ -0,0 +1,378 @@
+"""
+Bulk member import.
+
+Records use the same fields as the JSON body of POST /api/members/
+(email, firstName, lastName, password, phone, dateOfBirth, gender,
+emergencyContact, address, city, zipCode, height, weight, membershipPlan,
+startDate) and are read from CSV (one header row) or NDJSON (one object per
+line). Input is streamed and processed in chunks: each chunk is validated,
+its passwords are hashed on a process pool shared by all imports of the
+process and its rows are written with one multi-row INSERT per table before
+the chunk is committed. Emails are compared case-insensitively. Invalid rows
+are reported and skipped; they never abort the rest of the import.
+
+Import from the command line with:
+    python member_import.py members.csv
+    python member_import.py members.ndjson --format ndjson
+"""
+
+import sys
+import os
+import io
+import re
+import csv
+import json
+import uuid
+import atexit
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone, date, timedelta
+
+# Add the backend directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from models import (
+    db, Role, User, Member, MemberPhone, Address, PhysicalMetric,
+    MembershipPlan, MemberMembership, hash_password
+)
+from member_summary import rebuild_summaries
+from member_search import index_rows
+from sqlalchemy import insert, func
+from sqlalchemy.exc import DBAPIError, IntegrityError
+
+DEFAULT_CHUNK_SIZE = 500
+
+# Processes used to hash passwords (bcrypt dominates the cost of an import).
+# Capped by default so an import leaves CPUs to the requests of the app.
+HASH_WORKERS = int(os.environ.get('IMPORT_HASH_WORKERS', min(4, os.cpu_count() or 1)))
+
+_pool_lock = threading.Lock()
+_pool = None
+
+REQUIRED_FIELDS = ['email', 'firstName', 'lastName', 'password']
+
+# bcrypt refuses passwords longer than this
+MAX_PASSWORD_BYTES = 72
+
+# Record fields stored in length-limited columns
+FIELD_COLUMNS = [
+    ('email', User.email), ('firstName', Member.first_name), ('lastName', Member.last_name),
+    ('gender', Member.gender), ('emergencyContact', Member.emergency_contact),
+    ('phone', MemberPhone.phone), ('address', Address.street_name), ('city', Address.city_name),
+    ('zipCode', Address.postal_code)
+]
+
+
+class ImportFormatError(ValueError):
+    """The upload cannot be parsed as the requested format"""
+
+
+def validate_email(email):
+    """Validate email format"""
+    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+    return re.match(pattern, email) is not None
+
+
+def validate_phone(phone):
+    """Validate phone number format"""
+    # Remove all non-digit characters
+    digits_only = re.sub(r'[^\d]', '', phone)
+    return len(digits_only) >= 10
+
+
+def iter_records(stream, fmt='csv'):
+    """Yield (row number, record) pairs from a binary CSV or NDJSON stream"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        if not reader.fieldnames:
+            return
+        for record in reader:
+            # Row numbers count the header, like a spreadsheet
+            yield reader.line_num, {key: (value.strip() if isinstance(value, str) else value)
+                                    for key, value in record.items() if key}
+    elif fmt == 'ndjson':
+        for line_num, line in enumerate(text, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_num, ImportFormatError(f'Invalid JSON: {e.msg}')
+                continue
+            if not isinstance(record, dict):
+                yield line_num, ImportFormatError('Expected a JSON object')
+                continue
+            yield line_num, record
+    else:
+        raise ImportFormatError(f'Unsupported format: {fmt}')
+
+
+def _chunks(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _parse_date(value, field):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid date format for {field}. Use YYYY-MM-DD')
+
+
+def _parse_number(value, field):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{field} must be a number')
+
+
+def validate_record(record, plans):
+    """Return the rows to insert for one record, or raise ValueError"""
+    if isinstance(record, Exception):
+        raise ValueError(str(record))
+
+    for field in REQUIRED_FIELDS:
+        if not record.get(field):
+            raise ValueError(f'{field} is required')
+    email = str(record['email']).strip()
+    if not validate_email(email):
+        raise ValueError('Invalid email format')
+    if len(str(record['password']).encode('utf-8')) > MAX_PASSWORD_BYTES:
+        raise ValueError(f'password must be at most {MAX_PASSWORD_BYTES} bytes')
+    for field, column in FIELD_COLUMNS:
+        value = email if field == 'email' else record.get(field)
+        if value and len(str(value)) > column.type.length:
+            raise ValueError(f'{field} must be at most {column.type.length} characters')
+
+    dob = _parse_date(record['dateOfBirth'], 'dateOfBirth') if record.get('dateOfBirth') else None
+    height = _parse_number(record['height'], 'height') if record.get('height') else None
+    weight = _parse_number(record['weight'], 'weight') if record.get('weight') else None
+
+    plan = None
+    if record.get('membershipPlan'):
+        plan = plans.get(record['membershipPlan'])
+        if plan is None:
+            raise ValueError(f"Unknown membership plan: {record['membershipPlan']}")
+    start_date = date.today()
+    if record.get('startDate'):
+        start_date = _parse_date(record['startDate'], 'startDate')
+
+    user_id = uuid.uuid4()
+    member_id = uuid.uuid4()
+    rows = {
+        'email': email,
+        'password': str(record['password']),
+        'user': {'id': user_id, 'email': email, 'is_active': True},
+        'member': {
+            'id': member_id,
+            'user_id': user_id,
+            'first_name': record['firstName'],
+            'last_name': record['lastName'],
+            'dob': dob,
+            'gender': record.get('gender') or None,
+            'emergency_contact': record.get('emergencyContact') or None,
+            'is_active': True
+        },
+        'phone': None,
+        'address': None,
+        'metric': None,
+        'membership': None
+    }
+    if record.get('phone') and validate_phone(str(record['phone'])):
+        rows['phone'] = {'member_id': member_id, 'phone': str(record['phone'])}
+    if any(record.get(field) for field in ['address', 'city', 'zipCode']):
+        rows['address'] = {
+            'member_id': member_id,
+            'street_name': record.get('address') or None,
+            'city_name': record.get('city') or None,
+            'postal_code': record.get('zipCode') or None
+        }
+    if height or weight:
+        rows['metric'] = {
+            'member_id': member_id,
+            'height_cm': height,
+            'weight_kg': weight,
+            'bmi': round(weight / ((height / 100) ** 2), 2) if height and weight else None,
+            'measured_at': datetime.now(timezone.utc)
+        }
+    if plan is not None:
+        rows['membership'] = {
+            'member_id': member_id,
+            'plan_id': plan.id,
+            'start_date': start_date,
+            'end_date': start_date + timedelta(days=plan.duration_days),
+            'status': 'active',
+            'amount_paid': plan.price
+        }
+    return rows
+
+
+def _insert(prepared):
+    """Multi-row INSERT of prepared records, one statement per table"""
+    for model, key in [(User, 'user'), (Member, 'member'), (MemberPhone, 'phone'),
+                       (Address, 'address'), (PhysicalMetric, 'metric'),
+                       (MemberMembership, 'membership')]:
+        table_rows = [rows[key] for rows in prepared if rows[key] is not None]
+        if table_rows:
+            db.session.execute(insert(model), table_rows)
+
+
+def _row_error(error):
+    """Reason the database refused a single row, naming the constraint or column"""
+    message = str(error.orig).strip().splitlines()[0] if error.orig is not None else str(error)
+    constraint = getattr(getattr(error.orig, 'diag', None), 'constraint_name', None) or ''
+    if isinstance(error, IntegrityError) and ('email' in constraint or 'UNIQUE constraint failed: users.email' in message):
+        return 'Email already exists'
+    return f'Rejected by the database: {message}'
+
+
+def _hash_pool():
+    """The process pool for password hashing, created on first use; None when hashing in-process"""
+    global _pool
+    if HASH_WORKERS <= 1:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+            atexit.register(shutdown_hash_pool)
+        return _pool
+
+
+def shutdown_hash_pool():
+    """Stop the hashing processes (registered to run at exit)"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+def _hash_all(passwords):
+    pool = _hash_pool()
+    if pool is None:
+        return [hash_password(password) for password in passwords]
+    return list(pool.map(hash_password, passwords, chunksize=max(1, len(passwords) // (HASH_WORKERS * 4))))
+
+
+def import_members(records, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Import (row number, record) pairs, committing per chunk.
+    Returns a report with the created count and one error per rejected row.
+    """
+    member_role = Role.query.filter_by(name='MEMBER').first()
+    if not member_role:
+        raise LookupError('Member role not found')
+    role_id = member_role.id
+    plans = {plan.name: plan for plan in db.session.query(
+        MembershipPlan.id, MembershipPlan.name, MembershipPlan.duration_days, MembershipPlan.price).all()}
+
+    report = {'created': 0, 'failed': 0, 'errors': []}
+    seen_emails = set()
+
+    def reject(row_num, email, error):
+        report['failed'] += 1
+        report['errors'].append({'row': row_num, 'email': email, 'error': error})
+
+    for chunk in _chunks(records, chunk_size):
+        prepared = []
+        for row_num, record in chunk:
+            email = record.get('email') if isinstance(record, dict) else None
+            try:
+                rows = validate_record(record, plans)
+            except ValueError as e:
+                reject(row_num, email, str(e))
+                continue
+            if rows['email'].lower() in seen_emails:
+                reject(row_num, email, 'Duplicate email in upload')
+                continue
+            seen_emails.add(rows['email'].lower())
+            rows['row'] = row_num
+            prepared.append(rows)
+
+        # One lookup for the whole chunk instead of one per row
+        existing = {email for email, in db.session.query(func.lower(User.email))
+                    .filter(func.lower(User.email).in_([rows['email'].lower() for rows in prepared])).all()} \
+            if prepared else set()
+        accepted = []
+        for rows in prepared:
+            if rows['email'].lower() in existing:
+                reject(rows['row'], rows['email'], 'Email already exists')
+            else:
+                accepted.append(rows)
+        if not accepted:
+            continue
+
+        hashes = _hash_all([rows['password'] for rows in accepted])
+        for rows, password_hash in zip(accepted, hashes):
+            rows['user']['password_hash'] = password_hash
+            rows['user']['role_id'] = role_id
+
+        try:
+            _insert(accepted)
+            db.session.flush()
+            inserted = accepted
+        except DBAPIError:
+            # A row was refused (e.g. a conflicting email written concurrently):
+            # retry row by row to find it
+            db.session.rollback()
+            inserted = []
+            for rows in accepted:
+                try:
+                    with db.session.begin_nested():
+                        _insert([rows])
+                    inserted.append(rows)
+                except DBAPIError as e:
+                    reject(rows['row'], rows['email'], _row_error(e))
+
+        if inserted:
+            rebuild_summaries([rows['member']['id'] for rows in inserted])
+        db.session.commit()
+        index_rows((rows['member']['id'],
+                    f"{rows['member']['first_name'] or ''} {rows['member']['last_name'] or ''}",
+                    rows['email']) for rows in inserted)
+        report['created'] += len(inserted)
+    report['errors'].sort(key=lambda error: error['row'])
+    return report
+
+
+def detect_format(filename=None, content_type=None, requested=None):
+    """Pick csv or ndjson from an explicit choice, the file name or the content type"""
+    if requested:
+        return requested.lower()
+    if filename and filename.lower().endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    if content_type and ('ndjson' in content_type or 'jsonl' in content_type):
+        return 'ndjson'
+    return 'csv'
+
+
+def main():
+    import argparse
+    from app import create_app
+
+    parser = argparse.ArgumentParser(description='Bulk import members from CSV or NDJSON')
+    parser.add_argument('path', help='file to import')
+    parser.add_argument('--format', choices=['csv', 'ndjson'], help='defaults to the file extension')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        fmt = detect_format(args.path, requested=args.format)
+        with open(args.path, 'rb') as stream:
+            report = import_members(iter_records(stream, fmt), chunk_size=args.chunk_size)
+        for error in report['errors']:
+            print(f"Row {error['row']} ({error['email']}): {error['error']}")
+        print(f"Done. Created {report['created']} members, {report['failed']} rows rejected.")
+
+
+if __name__ == "__main__":
+    main()
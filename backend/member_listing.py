@@ -0,0 +1,300 @@
+"""
+Set-based loaders for member listings.
+
+The members page shows, for every row, the latest physical metrics, the
+active and most recent memberships and attendance figures. These are read
+from the precomputed `member_summary` table; members that do not have a
+summary row yet are computed from the raw tables for the whole page at
+once, in a fixed number of queries.
+
+The attendance percentage counts the calendar days (UTC) among the last
+ATTENDANCE_WINDOW_DAYS, today included, with at least one check-in, which
+is what the summary's visit bitmap holds. Before the summaries it counted
+the dates of check-ins in a rolling window of 30 x 24 hours, which could
+include a 31st, partial day.
+"""
+
+from flask import current_app
+from models import db, Attendance, Member, MemberMembership, MembershipPlan, PhysicalMetric, MemberSummary
+from attendance_stats import visit_date_expr
+from sqlalchemy import func, desc, case, distinct
+from sqlalchemy.orm import contains_eager, joinedload, selectinload
+from datetime import datetime, timedelta, timezone
+from collections import namedtuple
+import uuid
+
+LatestMembership = namedtuple('LatestMembership', ['plan_name', 'start_date', 'end_date', 'status'])
+MemberDetail = namedtuple('MemberDetail', ['member', 'summary', 'memberships', 'metrics'])
+
+# Physical metric rows shown on the member detail page
+DETAIL_METRICS_LIMIT = 10
+
+# Days covered by the `attendance` percentage
+ATTENDANCE_WINDOW_DAYS = 30
+
+
+def empty_member_stats():
+    """Stats returned for a member with no recorded activity"""
+    return {
+        'weight': None, 'height': None, 'bmi': None,
+        'attendance': '0%', 'last_check_in': None,
+        'plan': None, 'next_payment': None
+    }
+
+
+def plan_filter(plan):
+    """
+    Members with at least one membership whose plan name contains `plan`;
+    an EXISTS, so a member with several matching memberships is listed once
+    """
+    return Member.memberships.any(MemberMembership.plan.has(MembershipPlan.name.ilike(f"%{plan}%")))
+
+
+def load_latest_metrics(member_ids):
+    """Latest physical metric row per member"""
+    ranked = db.session.query(
+        PhysicalMetric.member_id,
+        PhysicalMetric.measured_at,
+        PhysicalMetric.height_cm,
+        PhysicalMetric.weight_kg,
+        PhysicalMetric.bmi,
+        func.row_number().over(
+            partition_by=PhysicalMetric.member_id,
+            order_by=desc(PhysicalMetric.measured_at)
+        ).label('rn')
+    ).filter(PhysicalMetric.member_id.in_(member_ids)).subquery()
+
+    rows = db.session.query(ranked).filter(ranked.c.rn == 1).all()
+    return {row.member_id: row for row in rows}
+
+
+def load_active_memberships(member_ids):
+    """One active membership (with plan name) per member"""
+    ranked = db.session.query(
+        MemberMembership.member_id,
+        MemberMembership.plan_id,
+        MemberMembership.end_date,
+        MembershipPlan.name.label('plan_name'),
+        func.row_number().over(
+            partition_by=MemberMembership.member_id,
+            order_by=desc(MemberMembership.start_date)
+        ).label('rn')
+    ).outerjoin(MembershipPlan, MemberMembership.plan_id == MembershipPlan.id)\
+     .filter(
+        MemberMembership.member_id.in_(member_ids),
+        MemberMembership.status == 'active'
+    ).subquery()
+
+    rows = db.session.query(ranked).filter(ranked.c.rn == 1).all()
+    return {row.member_id: row for row in rows}
+
+
+def _attendance_summary(member_ids, since):
+    """Distinct visit days since `since` and last check-in per member"""
+    rows = db.session.query(
+        Attendance.member_id,
+        func.count(distinct(case(
+            (Attendance.check_in >= since, visit_date_expr())
+        ))).label('attended_days'),
+        func.max(Attendance.check_in).label('last_check_in')
+    ).filter(Attendance.member_id.in_(member_ids))\
+     .group_by(Attendance.member_id).all()
+    return {row.member_id: row for row in rows}
+
+
+def load_summaries(member_ids):
+    """Member summary rows for a batch of members, keyed by member id"""
+    member_ids = list(member_ids)
+    if not member_ids:
+        return {}
+    rows = MemberSummary.query.filter(MemberSummary.member_id.in_(member_ids)).all()
+    return {row.member_id: row for row in rows}
+
+
+def visit_days(summary, today=None, days=ATTENDANCE_WINDOW_DAYS):
+    """Number of distinct days in the last `days` days (today included) with a visit"""
+    if not summary.visit_anchor or not summary.visit_bitmap:
+        return 0
+    today = today or datetime.now(timezone.utc).date()
+    shift = (today - summary.visit_anchor).days
+    if shift >= days:
+        return 0
+    # Bits 0..(days - 1 - shift) are the days from the anchor back to the window start
+    mask = (1 << (days - max(shift, 0))) - 1
+    return bin(summary.visit_bitmap & mask).count('1')
+
+
+def visit_engagement(summary, today=None):
+    """Current and longest visit streaks and check-ins this month, as of `today` (UTC)"""
+    if summary is None or not summary.visit_anchor:
+        return {
+            'current_streak': 0,
+            'longest_streak': summary.longest_streak if summary else 0,
+            'visits_this_month': 0
+        }
+    today = today or datetime.now(timezone.utc).date()
+    # A streak stays alive until a whole day passes without a visit
+    alive = (today - summary.visit_anchor).days <= 1
+    return {
+        'current_streak': summary.current_streak if alive else 0,
+        'longest_streak': summary.longest_streak,
+        'visits_this_month': summary.month_visits if summary.visit_month == today.replace(day=1) else 0
+    }
+
+
+def _stats_from_summary(summary):
+    attendance_percentage = round((visit_days(summary) / ATTENDANCE_WINDOW_DAYS) * 100, 1)
+    return {
+        'weight': f"{summary.weight_kg} kg" if summary.weight_kg else None,
+        'height': f"{summary.height_cm} cm" if summary.height_cm else None,
+        'bmi': float(summary.bmi) if summary.bmi else None,
+        'attendance': f"{attendance_percentage}%",
+        'last_check_in': summary.last_check_in.strftime('%Y-%m-%d %I:%M %p') if summary.last_check_in else None,
+        'plan': summary.active_plan_name if summary.active_plan_id else None,
+        'next_payment': summary.active_end_date.isoformat() if summary.active_plan_id else None
+    }
+
+
+def load_member_stats(member_ids, summaries=None):
+    """Get additional statistics for a batch of members, keyed by member id"""
+    member_ids = list(member_ids)
+    if not member_ids:
+        return {}
+    if summaries is None:
+        summaries = load_summaries(member_ids)
+
+    stats = {member_id: _stats_from_summary(summaries[member_id])
+             for member_id in member_ids if member_id in summaries}
+    missing = [member_id for member_id in member_ids if member_id not in summaries]
+    if missing:
+        stats.update(compute_member_stats(missing))
+    return stats
+
+
+def compute_member_stats(member_ids):
+    """Compute member statistics from the raw tables, keyed by member id"""
+    try:
+        metrics = load_latest_metrics(member_ids)
+        memberships = load_active_memberships(member_ids)
+
+        # Calculate attendance percentage (calendar days, like visit_days())
+        today = datetime.now(timezone.utc).date()
+        window_start = datetime.combine(today - timedelta(days=ATTENDANCE_WINDOW_DAYS - 1), datetime.min.time(),
+                                        tzinfo=timezone.utc)
+        total_days = ATTENDANCE_WINDOW_DAYS
+        attendance = _attendance_summary(member_ids, window_start)
+
+        stats = {}
+        for member_id in member_ids:
+            latest_metric = metrics.get(member_id)
+            current_membership = memberships.get(member_id)
+            visits = attendance.get(member_id)
+
+            attended_days = visits.attended_days if visits else 0
+            attendance_percentage = round((attended_days / total_days) * 100, 1)
+            last_check_in = visits.last_check_in if visits else None
+
+            stats[member_id] = {
+                'weight': f"{latest_metric.weight_kg} kg" if latest_metric and latest_metric.weight_kg else None,
+                'height': f"{latest_metric.height_cm} cm" if latest_metric and latest_metric.height_cm else None,
+                'bmi': float(latest_metric.bmi) if latest_metric and latest_metric.bmi else None,
+                'attendance': f"{attendance_percentage}%",
+                'last_check_in': last_check_in.strftime('%Y-%m-%d %I:%M %p') if last_check_in else None,
+                'plan': current_membership.plan_name if current_membership else None,
+                'next_payment': current_membership.end_date.isoformat() if current_membership else None
+            }
+        return stats
+    except Exception as e:
+        current_app.logger.exception(f"Error calculating member stats: {e}")
+        return {member_id: empty_member_stats() for member_id in member_ids}
+
+
+def load_latest_memberships(member_ids, summaries=None):
+    """Most recent membership (any status) per member, keyed by member id"""
+    member_ids = list(member_ids)
+    if not member_ids:
+        return {}
+    if summaries is None:
+        summaries = load_summaries(member_ids)
+
+    latest = {}
+    for member_id in member_ids:
+        summary = summaries.get(member_id)
+        if summary and summary.latest_plan_id:
+            latest[member_id] = LatestMembership(
+                summary.latest_plan_name, summary.latest_start_date,
+                summary.latest_end_date, summary.latest_status
+            )
+    missing = [member_id for member_id in member_ids if member_id not in summaries]
+    if missing:
+        latest.update(compute_latest_memberships(missing))
+    return latest
+
+
+def compute_latest_memberships(member_ids):
+    """Most recent membership per member from the raw tables, keyed by member id"""
+    ranked = db.session.query(
+        MemberMembership.member_id,
+        MemberMembership.plan_id,
+        MemberMembership.start_date,
+        MemberMembership.end_date,
+        MemberMembership.status,
+        MembershipPlan.name.label('plan_name'),
+        func.row_number().over(
+            partition_by=MemberMembership.member_id,
+            order_by=desc(MemberMembership.start_date)
+        ).label('rn')
+    ).join(MembershipPlan, MemberMembership.plan_id == MembershipPlan.id)\
+     .filter(MemberMembership.member_id.in_(member_ids)).subquery()
+
+    rows = db.session.query(ranked).filter(ranked.c.rn == 1).all()
+    return {row.member_id: row for row in rows}
+
+
+def membership_summary(membership):
+    """Format the `current_membership` / `membership_type` fields of a member row"""
+    if not membership:
+        return None, 'No Plan History'
+
+    current_membership = {
+        'plan_name': membership.plan_name,
+        'start_date': membership.start_date.isoformat(),
+        'end_date': membership.end_date.isoformat(),
+        'status': membership.status
+    }
+    # Show plan name with status indicator
+    if membership.status == 'active':
+        membership_type = membership.plan_name
+    else:
+        membership_type = f"{membership.plan_name} ({membership.status.title()})"
+    return current_membership, membership_type
+
+
+def load_member_detail(member_id):
+    """
+    Load everything the member detail page shows in three statements:
+    the member with user (if any), summary, phones and addresses; the membership
+    history with plans; and the latest physical metrics.
+    Returns None if the member does not exist.
+    """
+    member_id = uuid.UUID(str(member_id))
+    row = db.session.query(Member, MemberSummary)\
+        .outerjoin(Member.user)\
+        .outerjoin(MemberSummary, MemberSummary.member_id == Member.id)\
+        .options(
+            contains_eager(Member.user),
+            joinedload(Member.phones),
+            joinedload(Member.addresses),
+            selectinload(Member.memberships).joinedload(MemberMembership.plan)
+        )\
+        .filter(Member.id == member_id).first()
+    if row is None:
+        return None
+    member, summary = row
+
+    metrics = PhysicalMetric.query.filter_by(member_id=member.id)\
+        .order_by(desc(PhysicalMetric.measured_at)).limit(DETAIL_METRICS_LIMIT).all()
+    # Newest first; memberships without a start date last
+    memberships = sorted(member.memberships, reverse=True,
+                         key=lambda membership: (membership.start_date is not None, membership.start_date))
+    return MemberDetail(member, summary, memberships, metrics)
@@ -0,0 +1,208 @@
+"""
+Background purge of deleted members.
+
+Deleting a member only marks the member (and their login) inactive and
+deleted and queues a MemberPurgeJob. The purge worker started by create_app
+then removes the member's dependent rows table by table, PURGE_BATCH_SIZE
+rows at a time with a commit after every batch, so no single statement holds
+locks on attendance or payments for long. Progress is recorded on the job
+and every step is idempotent, so an interrupted job simply resumes. An open
+session of the member is deleted first and published as a check-out, so
+the live occupancy count drops with it. Deleted sessions are taken out of
+the attendance rollups batch by batch and the member's trainer client
+counts are dropped, so reports no longer include the member; check-ins of
+archived partitions, which have no raw rows left, stay in the gym-wide
+hourly rollup.
+
+Process pending jobs once from the command line with:
+    python member_purge.py
+"""
+
+import sys
+import os
+import time
+from datetime import datetime, timezone, timedelta
+
+# Add the backend directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from models import (
+    db, User, Member, MemberPhone, Address, PhysicalMetric, MemberMembership,
+    Attendance, AttendanceDaily, Payment, MemberSummary, MemberPurgeJob,
+    member_workout_assoc, member_diet_assoc
+)
+from attendance_batch import ClosedSession
+from occupancy import check_out_event, publish_events, apply_events
+from attendance_rollups import forget_sessions
+from trainer_analytics import forget_member
+from payment_stats import invalidate_payment_stats
+from sqlalchemy import select, delete, update
+
+PURGE_BATCH_SIZE = 500
+
+# Pause between batches so check-ins and payments get the tables in between
+PURGE_BATCH_PAUSE = 0.05
+
+PURGE_MAX_ATTEMPTS = 5
+
+# A running job whose row has not been touched for this long belongs to a dead worker
+STALE_JOB_MINUTES = 15
+
+# Dependent tables in deletion order (payments reference memberships)
+PURGE_STEPS = [
+    ('phones', MemberPhone.__table__),
+    ('addresses', Address.__table__),
+    ('physical_metrics', PhysicalMetric.__table__),
+    ('workout_plans', member_workout_assoc),
+    ('diet_plans', member_diet_assoc),
+    ('attendance', Attendance.__table__),
+    ('payments', Payment.__table__),
+    ('memberships', MemberMembership.__table__),
+]
+
+
+def utc_now():
+    return datetime.now(timezone.utc)
+
+
+def _delete_batch(table, member_id):
+    """Delete up to PURGE_BATCH_SIZE rows of `table` belonging to the member"""
+    ids = db.session.execute(
+        select(table.c.id).where(table.c.member_id == member_id).limit(PURGE_BATCH_SIZE)
+    ).scalars().all()
+    if ids:
+        db.session.execute(delete(table).where(table.c.id.in_(ids)))
+    return len(ids)
+
+
+def _delete_attendance_batch(member_id):
+    """Delete up to PURGE_BATCH_SIZE sessions of the member and take them out of the rollups"""
+    rows = db.session.query(
+        Attendance.id, Attendance.member_id, Attendance.check_in, Attendance.check_out, Attendance.auto_closed
+    ).filter(Attendance.member_id == member_id).limit(PURGE_BATCH_SIZE).all()
+    if rows:
+        db.session.execute(delete(Attendance).where(Attendance.id.in_([row.id for row in rows])))
+        forget_sessions((row.member_id, row.check_in, row.check_out, row.auto_closed) for row in rows)
+    return len(rows)
+
+
+def _close_open_sessions(member_id):
+    """Delete the member's open sessions and take them off the occupancy count, like a check-out"""
+    now = utc_now()
+    rows = db.session.query(
+        Attendance.id, Attendance.member_id, Attendance.check_in
+    ).filter(Attendance.member_id == member_id, Attendance.check_out.is_(None)).all()
+    if not rows:
+        return 0
+    closed = [ClosedSession(row.id, row.member_id, now) for row in rows]
+    db.session.execute(delete(Attendance).where(Attendance.id.in_([session.id for session in closed])))
+    forget_sessions((row.member_id, row.check_in, None, False) for row in rows)
+    events = [check_out_event(session) for session in closed]
+    publish_events(events)
+    db.session.commit()
+    apply_events(events)
+    return len(closed)
+
+
+def run_job(job):
+    """Remove everything belonging to the job's member, committing per batch"""
+    member_id = job.member_id
+
+    # Memberships cannot be deleted while the member points at one of them
+    db.session.execute(update(Member).where(Member.id == member_id).values(current_plan_id=None))
+    db.session.commit()
+
+    for step, table in PURGE_STEPS:
+        job.current_step = step
+        if step == 'attendance':
+            job.rows_deleted += _close_open_sessions(member_id)
+        while True:
+            if step == 'attendance':
+                deleted = _delete_attendance_batch(member_id)
+            else:
+                deleted = _delete_batch(table, member_id)
+            job.rows_deleted += deleted
+            if deleted and step == 'payments':
+                invalidate_payment_stats()
+            db.session.commit()
+            if deleted < PURGE_BATCH_SIZE:
+                break
+            time.sleep(PURGE_BATCH_PAUSE)
+
+    job.current_step = 'member'
+    user_id = db.session.execute(select(Member.user_id).where(Member.id == member_id)).scalar()
+    db.session.execute(delete(MemberSummary).where(MemberSummary.member_id == member_id))
+    # Emptied by the attendance step, except for days of archived partitions
+    db.session.execute(delete(AttendanceDaily).where(AttendanceDaily.member_id == member_id))
+    forget_member(member_id)
+    db.session.execute(delete(Member).where(Member.id == member_id))
+    if user_id:
+        db.session.execute(delete(User).where(User.id == user_id))
+    job.status = 'done'
+    job.current_step = None
+    job.finished_at = utc_now()
+    db.session.commit()
+
+
+def claim_job(skip_ids=()):
+    """Take the oldest pending (or abandoned) job, or return None"""
+    stale_before = utc_now() - timedelta(minutes=STALE_JOB_MINUTES)
+    query = MemberPurgeJob.query.filter(
+        db.or_(
+            MemberPurgeJob.status == 'pending',
+            db.and_(MemberPurgeJob.status == 'running', MemberPurgeJob.updated_at < stale_before)
+        ),
+        MemberPurgeJob.attempts < PURGE_MAX_ATTEMPTS,
+        MemberPurgeJob.id.notin_(skip_ids)
+    ).order_by(MemberPurgeJob.created_at)
+    if db.session.get_bind().dialect.name == 'postgresql':
+        # Several processes run the worker; each job goes to one of them
+        query = query.with_for_update(skip_locked=True)
+
+    job = query.first()
+    if job is None:
+        db.session.rollback()
+        return None
+    job.status = 'running'
+    job.attempts += 1
+    job.started_at = job.started_at or utc_now()
+    job.error = None
+    db.session.commit()
+    return job
+
+
+def process_pending(max_jobs=None):
+    """Run queued purge jobs until none are left; returns the number completed"""
+    completed = 0
+    failed_ids = []  # retried on the next run, not in a tight loop
+    while max_jobs is None or completed < max_jobs:
+        job = claim_job(failed_ids)
+        if job is None:
+            break
+        job_id = job.id
+        try:
+            run_job(job)
+            completed += 1
+            print(f"Purged member {job.member_id} ({job.rows_deleted} rows)")
+        except Exception as e:
+            db.session.rollback()
+            failed_ids.append(job_id)
+            job = db.session.get(MemberPurgeJob, job_id)
+            job.status = 'pending' if job.attempts < PURGE_MAX_ATTEMPTS else 'failed'
+            job.error = str(e)
+            db.session.commit()
+            print(f"Error purging member {job.member_id}: {e}")
+    return completed
+
+
+def main():
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        completed = process_pending()
+        print(f"Done. Completed {completed} purge jobs.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,23 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import (
     db, Member, User, Role, MemberPhone, Address, MemberMembership, 
-    MembershipPlan, PhysicalMetric, Attendance, Payment
+    MembershipPlan, PhysicalMetric, MemberSummary, MemberPurgeJob
 )
+from pagination import InvalidCursor, keyset_paginate, page_meta, wants_total
+from member_listing import (
+    load_summaries, load_member_stats, load_latest_memberships, membership_summary, load_member_detail,
+    visit_engagement, plan_filter
+)
+from member_summary import rebuild_summaries, record_metric
+from member_search import search_filter, typeahead, index_member, unindex_member
+from member_import import DEFAULT_CHUNK_SIZE, detect_format, iter_records, import_members
+from export_utils import EXPORT_FORMATS, EXPORT_BATCH_SIZE, stream_export
+from background import wake_worker
+from metric_series import RESOLUTIONS, DEFAULT_MAX_POINTS, metric_series, parse_bound
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import func, desc
+from sqlalchemy import select
+from sqlalchemy.orm import contains_eager, selectinload
 from datetime import datetime, timezone, date, timedelta
 import uuid
 import re
@@ -50,53 +62,17 @@ def calculate_age(birth_date):
 
 def get_member_stats(member):
     """Get additional member statistics"""
-    try:
-        # Get latest physical metrics
-        latest_metric = PhysicalMetric.query.filter_by(member_id=member.id)\
-            .order_by(desc(PhysicalMetric.measured_at)).first()
-        
-        # Get current membership
-        current_membership = MemberMembership.query.filter_by(
-            member_id=member.id, 
-            status='active'
-        ).first()
-        
-        # Calculate attendance percentage (last 30 days)
-        thirty_days_ago = datetime.now() - timedelta(days=30)
-        total_days = 30
-        attended_days = db.session.query(func.count(func.distinct(func.date(Attendance.check_in))))\
-            .filter(
-                Attendance.member_id == member.id,
-                Attendance.check_in >= thirty_days_ago
-            ).scalar() or 0
-        
-        attendance_percentage = round((attended_days / total_days) * 100, 1)
-        
-        # Get last check-in
-        last_attendance = Attendance.query.filter_by(member_id=member.id)\
-            .order_by(desc(Attendance.check_in)).first()
-        
-        return {
-            'weight': f"{latest_metric.weight_kg} kg" if latest_metric and latest_metric.weight_kg else None,
-            'height': f"{latest_metric.height_cm} cm" if latest_metric and latest_metric.height_cm else None,
-            'bmi': float(latest_metric.bmi) if latest_metric and latest_metric.bmi else None,
-            'attendance': f"{attendance_percentage}%",
-            'last_check_in': last_attendance.check_in.strftime('%Y-%m-%d %I:%M %p') if last_attendance else None,
-            'plan': current_membership.plan.name if current_membership and current_membership.plan else None,
-            'next_payment': current_membership.end_date.isoformat() if current_membership else None
-        }
-    except Exception as e:
-        print(f"Error calculating member stats: {e}")
-        return {
-            'weight': None, 'height': None, 'bmi': None,
-            'attendance': '0%', 'last_check_in': None,
-            'plan': None, 'next_payment': None
-        }
+    return load_member_stats([member.id])[member.id]
 
 @member_bp.route('/', methods=['GET'])
 @jwt_required()
 def get_members():
-    """Get all members with filtering and search"""
+    """
+    Get all members with filtering and search.
+    A member matches the plan filter once however many of their memberships
+    match it (the former join listed them once per matching membership).
+    Attendance is the share of the last 30 calendar days with a visit.
+    """
     try:
         current_user = get_current_user()
         if not current_user:
@@ -115,21 +91,21 @@ def get_members():
         plan = request.args.get('plan', '')
         page = int(request.args.get('page', 1))
         limit = int(request.args.get('limit', 50))
+        cursor = request.args.get('cursor')  # present (even empty) selects cursor mode
+        cursor_mode = cursor is not None
         
         # Build query
-        query = db.session.query(Member).join(User)
+        query = db.session.query(Member).join(User)\
+            .options(
+                contains_eager(Member.user),
+                selectinload(Member.phones),
+                selectinload(Member.addresses)
+            )\
+            .filter(Member.deleted_at.is_(None))
         
         # Apply search filter
         if search:
-            search_term = f"%{search}%"
-            query = query.filter(
-                db.or_(
-                    Member.first_name.ilike(search_term),
-                    Member.last_name.ilike(search_term),
-                    User.email.ilike(search_term),
-                    func.concat(Member.first_name, ' ', Member.last_name).ilike(search_term)
-                )
-            )
+            query = query.filter(search_filter(search))
         
         # Apply status filter
         if status == 'active':
@@ -137,50 +113,42 @@ def get_members():
         elif status == 'inactive':
             query = query.filter(Member.is_active == False)
         
-        # Apply membership plan filter
+        # Apply membership plan filter (each member appears once)
         if plan:
-            query = query.join(MemberMembership).join(MembershipPlan)\
-                .filter(MembershipPlan.name.ilike(f"%{plan}%"))
+            query = query.filter(plan_filter(plan))
         
-        # Get total count for pagination
-        total = query.count()
+        # Get total count for pagination (optional in cursor mode)
+        total = query.count() if wants_total(request.args, cursor_mode) else None
         
         # Apply pagination
-        offset = (page - 1) * limit
-        members = query.offset(offset).limit(limit).all()
+        next_cursor = None
+        if cursor_mode:
+            members, next_cursor = keyset_paginate(query, [(Member.id, False)], cursor, limit)
+        else:
+            offset = (page - 1) * limit
+            members = query.offset(offset).limit(limit).all()
+        
+        # Load per-row stats for the whole page at once
+        member_ids = [member.id for member in members]
+        summaries = load_summaries(member_ids)
+        stats_by_member = load_member_stats(member_ids, summaries)
+        latest_memberships = load_latest_memberships(member_ids, summaries)
         
         # Format response with additional stats
         members_data = []
         for member in members:
             member_dict = member.to_dict()
-            stats = get_member_stats(member)
-            member_dict.update(stats)
+            member_dict.update(stats_by_member[member.id])
             member_dict['age'] = calculate_age(member.dob)
             
             # Add user email
             if member.user:
                 member_dict['email'] = member.user.email
             
-            # Add current membership info - get most recent membership (active or most recent expired)
-            current_membership = MemberMembership.query.filter_by(
-                member_id=member.id
-            ).join(MembershipPlan).order_by(MemberMembership.start_date.desc()).first()
-            
-            if current_membership:
-                member_dict['current_membership'] = {
-                    'plan_name': current_membership.plan.name,
-                    'start_date': current_membership.start_date.isoformat(),
-                    'end_date': current_membership.end_date.isoformat(),
-                    'status': current_membership.status
-                }
-                # Show plan name with status indicator
-                if current_membership.status == 'active':
-                    member_dict['membership_type'] = current_membership.plan.name
-                else:
-                    member_dict['membership_type'] = f"{current_membership.plan.name} ({current_membership.status.title()})"
-            else:
-                member_dict['current_membership'] = None
-                member_dict['membership_type'] = 'No Plan History'
+            # Add current membership info - most recent membership (active or most recent expired)
+            current_membership, membership_type = membership_summary(latest_memberships.get(member.id))
+            member_dict['current_membership'] = current_membership
+            member_dict['membership_type'] = membership_type
             
             # Add trainer information (if assigned)
             # For now, we'll set it as 'Unassigned' since trainer assignment is not in the current schema
@@ -190,12 +158,107 @@ def get_members():
         
         return jsonify({
             'members': members_data,
-            'total': total,
-            'page': page,
-            'limit': limit,
-            'pages': (total + limit - 1) // limit
+            **page_meta(limit, total, page, next_cursor, cursor_mode)
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+ROSTER_COLUMNS = [
+    'id', 'first_name', 'last_name', 'email', 'phones', 'gender', 'dob', 'age',
+    'joined_on', 'is_active', 'emergency_contact', 'street_name', 'city_name',
+    'state_name', 'postal_code', 'membership_type', 'membership_status', 'plan',
+    'next_payment', 'attendance', 'last_check_in', 'weight', 'height', 'bmi'
+]
+
+@member_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_members():
+    """Stream the member roster as CSV or NDJSON (Admin only)"""
+    try:
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        if not is_admin(current_user):
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        fmt = request.args.get('format', 'csv').lower()
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({'error': 'format must be csv or ndjson'}), 400
+        status = request.args.get('status', 'all')  # all, active, inactive
+        
+        # Rows are read through a server-side cursor, EXPORT_BATCH_SIZE at a time;
+        # phones and addresses are loaded per batch
+        query = select(Member, User.email, MemberSummary)\
+            .join(User, Member.user_id == User.id)\
+            .outerjoin(MemberSummary, MemberSummary.member_id == Member.id)\
+            .options(selectinload(Member.phones), selectinload(Member.addresses))\
+            .where(Member.deleted_at.is_(None))\
+            .order_by(Member.id)\
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        if status == 'active':
+            query = query.where(Member.is_active == True)
+        elif status == 'inactive':
+            query = query.where(Member.is_active == False)
+        
+        def roster():
+            for batch in db.session.execute(query).partitions():
+                member_ids = [member.id for member, _, _ in batch]
+                summaries = {member.id: summary for member, _, summary in batch if summary is not None}
+                stats_by_member = load_member_stats(member_ids, summaries)
+                latest_memberships = load_latest_memberships(member_ids, summaries)
+                
+                for member, email, _ in batch:
+                    record = member.to_dict()
+                    record.update(stats_by_member[member.id])
+                    record.pop('addresses')
+                    address = member.addresses[0] if member.addresses else None
+                    for field in ['street_name', 'city_name', 'state_name', 'postal_code']:
+                        record[field] = getattr(address, field) if address else None
+                    record['phones'] = '; '.join(record['phones'])
+                    record['email'] = email
+                    record['age'] = calculate_age(member.dob)
+                    
+                    latest = latest_memberships.get(member.id)
+                    _, record['membership_type'] = membership_summary(latest)
+                    record['membership_status'] = latest.status if latest else None
+                    yield record
+                # Batches are not needed once written out
+                db.session.expunge_all()
+        
+        filename = f"members-{datetime.now(timezone.utc).strftime('%Y%m%d')}"
+        return stream_export(fmt, ROSTER_COLUMNS, roster(), filename)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@member_bp.route('/search', methods=['GET'])
+@jwt_required()
+def search_members():
+    """Typeahead search over member names and emails (Admin only)"""
+    try:
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        if not is_admin(current_user):
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        term = request.args.get('q', '').strip()
+        limit = min(int(request.args.get('limit', 10)), 50)
+        if not term:
+            return jsonify({'results': []}), 200
+        
+        return jsonify({'results': typeahead(term, limit)}), 200
+        
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return jsonify({'error': 'Database error occurred'}), 500
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -214,9 +277,10 @@ def get_member(member_id):
         except ValueError:
             return jsonify({'error': 'Invalid member ID format'}), 400
         
-        member = Member.query.get(member_id)
-        if not member:
+        detail = load_member_detail(member_id)
+        if not detail or detail.member.deleted_at:
             return jsonify({'error': 'Member not found'}), 404
+        member = detail.member
         
         # Check permissions
         is_same_member = (current_user.role.name == 'MEMBER' and 
@@ -228,18 +292,17 @@ def get_member(member_id):
         
         # Get detailed member information
         member_dict = member.to_dict()
-        stats = get_member_stats(member)
+        summaries = {member.id: detail.summary} if detail.summary else {}
+        stats = load_member_stats([member.id], summaries)[member.id]
         member_dict.update(stats)
         member_dict['age'] = calculate_age(member.dob)
+        member_dict['engagement'] = visit_engagement(detail.summary)
         
         # Add user email
         if member.user:
             member_dict['email'] = member.user.email
         
-        # Get membership history
-        memberships = MemberMembership.query.filter_by(member_id=member.id)\
-            .join(MembershipPlan).order_by(desc(MemberMembership.start_date)).all()
-        
+        # Membership history, most recent first
         member_dict['membership_history'] = [{
             'id': str(membership.id),
             'plan_id': str(membership.plan_id),
@@ -249,19 +312,16 @@ def get_member(member_id):
             'status': membership.status,
             'amount_paid': float(membership.amount_paid) if membership.amount_paid else 0,
             'discount': float(membership.discount) if membership.discount else 0
-        } for membership in memberships]
-        
-        # Get physical metrics history
-        metrics = PhysicalMetric.query.filter_by(member_id=member.id)\
-            .order_by(desc(PhysicalMetric.measured_at)).limit(10).all()
+        } for membership in detail.memberships]
         
+        # Physical metrics history
         member_dict['physical_metrics'] = [{
             'id': str(metric.id),
             'measured_at': metric.measured_at.isoformat(),
             'height_cm': float(metric.height_cm) if metric.height_cm else None,
             'weight_kg': float(metric.weight_kg) if metric.weight_kg else None,
             'bmi': float(metric.bmi) if metric.bmi else None
-        } for metric in metrics]
+        } for metric in detail.metrics]
         
         return jsonify({'member': member_dict}), 200
         
@@ -393,7 +453,12 @@ def create_member():
                 )
                 db.session.add(membership)
         
+        # Build the member summary from the rows added above
+        db.session.flush()
+        rebuild_summaries([member.id])
+        
         db.session.commit()
+        index_member(member, user.email)
         
         # Return created member data
         member_dict = member.to_dict()
@@ -412,6 +477,55 @@ def create_member():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@member_bp.route('/bulk', methods=['POST'])
+@jwt_required()
+def bulk_import_members():
+    """Create members from a CSV or NDJSON upload (Admin only)"""
+    try:
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        if not is_admin(current_user):
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        try:
+            chunk_size = min(int(request.args.get('chunk_size', DEFAULT_CHUNK_SIZE)), 5000)
+        except ValueError:
+            return jsonify({'error': 'Invalid chunk_size'}), 400
+        if chunk_size < 1:
+            return jsonify({'error': 'Invalid chunk_size'}), 400
+        
+        # Either a multipart upload in the `file` field or the raw request body
+        upload = request.files.get('file')
+        if upload:
+            stream = upload.stream
+            fmt = detect_format(upload.filename, upload.content_type, request.args.get('format'))
+        else:
+            stream = request.stream
+            fmt = detect_format(content_type=request.content_type, requested=request.args.get('format'))
+        if fmt not in ('csv', 'ndjson'):
+            return jsonify({'error': 'format must be csv or ndjson'}), 400
+        
+        report = import_members(iter_records(stream, fmt), chunk_size=chunk_size)
+        
+        return jsonify({
+            'message': f"Imported {report['created']} members",
+            **report
+        }), 200
+        
+    except UnicodeDecodeError:
+        db.session.rollback()
+        return jsonify({'error': 'Upload must be UTF-8 encoded'}), 400
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 500
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return jsonify({'error': 'Database error occurred'}), 500
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @member_bp.route('/<member_id>', methods=['PUT'])
 @jwt_required()
 def update_member(member_id):
@@ -428,7 +542,7 @@ def update_member(member_id):
             return jsonify({'error': 'Invalid member ID format'}), 400
         
         member = Member.query.get(member_id)
-        if not member:
+        if not member or member.deleted_at:
             return jsonify({'error': 'Member not found'}), 404
         
         # Check permissions
@@ -536,8 +650,11 @@ def update_member(member_id):
                 bmi=bmi
             )
             db.session.add(metric)
+            db.session.flush()
+            record_metric(member.id, metric)
         
         db.session.commit()
+        index_member(member, member.user.email)
         
         # Return updated member data
         member_dict = member.to_dict()
@@ -577,43 +694,25 @@ def delete_member(member_id):
             return jsonify({'error': 'Invalid member ID format'}), 400
         
         member = Member.query.get(member_id)
-        if not member:
+        if not member or member.deleted_at:
             return jsonify({'error': 'Member not found'}), 404
         
-        # Hard delete - actually remove from database
-        # First, delete related records to maintain referential integrity
-        
-        # Delete member phones
-        MemberPhone.query.filter_by(member_id=member.id).delete()
-        
-        # Delete member addresses
-        Address.query.filter_by(member_id=member.id).delete()
-        
-        # Delete physical metrics
-        PhysicalMetric.query.filter_by(member_id=member.id).delete()
-        
-        # Delete membership history
-        MemberMembership.query.filter_by(member_id=member.id).delete()
-        
-        # Delete attendance records
-        Attendance.query.filter_by(member_id=member.id).delete()
-        
-        # Delete payment records
-        Payment.query.filter_by(member_id=member.id).delete()
-        
-        # Delete the user account associated with this member
-        user = member.user
-        
-        # Delete the member record
-        db.session.delete(member)
-        
-        # Delete the user record
-        if user:
-            db.session.delete(user)
+        # Soft delete now; the member's rows are removed in batches by the purge worker
+        member.deleted_at = datetime.now(timezone.utc)
+        member.is_active = False
+        if member.user:
+            member.user.is_active = False
         
+        job = MemberPurgeJob(member_id=member.id, requested_by=current_user.id)
+        db.session.add(job)
         db.session.commit()
+        unindex_member(member.id)
+        wake_worker(current_app, 'member_purge')
         
-        return jsonify({'message': 'Member deleted successfully'}), 200
+        return jsonify({
+            'message': 'Member deleted successfully',
+            'purge_job': job.to_dict()
+        }), 202
         
     except SQLAlchemyError as e:
         db.session.rollback()
@@ -622,6 +721,32 @@ def delete_member(member_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@member_bp.route('/purge-jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_purge_job(job_id):
+    """Progress of a member purge job (Admin only)"""
+    try:
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        if not is_admin(current_user):
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        try:
+            job_id = uuid.UUID(job_id)
+        except ValueError:
+            return jsonify({'error': 'Invalid job ID format'}), 400
+        
+        job = db.session.get(MemberPurgeJob, job_id)
+        if not job:
+            return jsonify({'error': 'Purge job not found'}), 404
+        
+        return jsonify({'purge_job': job.to_dict()}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @member_bp.route('/<member_id>/metrics', methods=['POST'])
 @jwt_required()
 def add_physical_metrics(member_id):
@@ -638,7 +763,7 @@ def add_physical_metrics(member_id):
             return jsonify({'error': 'Invalid member ID format'}), 400
         
         member = Member.query.get(member_id)
-        if not member:
+        if not member or member.deleted_at:
             return jsonify({'error': 'Member not found'}), 404
         
         # Check permissions
@@ -671,6 +796,8 @@ def add_physical_metrics(member_id):
             bmi=bmi
         )
         db.session.add(metric)
+        db.session.flush()
+        record_metric(member.id, metric)
         db.session.commit()
         
         return jsonify({
@@ -693,6 +820,57 @@ def add_physical_metrics(member_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@member_bp.route('/<member_id>/metrics/series', methods=['GET'])
+@jwt_required()
+def get_metric_series(member_id):
+    """Downsampled weight/BMI series for progress charts"""
+    try:
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        # Validate UUID format
+        try:
+            member_id = str(uuid.UUID(member_id))
+        except ValueError:
+            return jsonify({'error': 'Invalid member ID format'}), 400
+        
+        member = Member.query.get(member_id)
+        if not member or member.deleted_at:
+            return jsonify({'error': 'Member not found'}), 404
+        
+        # Check permissions
+        is_same_member = (current_user.role.name == 'MEMBER' and 
+                         current_user.member_profile and 
+                         str(current_user.member_profile.id) == member_id)
+        
+        if not (is_admin(current_user) or is_same_member):
+            return jsonify({'error': 'Insufficient permissions'}), 403
+        
+        resolution = request.args.get('resolution', 'auto')
+        if resolution not in RESOLUTIONS:
+            return jsonify({'error': f"resolution must be one of: {', '.join(RESOLUTIONS)}"}), 400
+        
+        try:
+            start = parse_bound(request.args.get('from'))
+            end = parse_bound(request.args.get('to'), inclusive_end=True)
+            max_points = min(max(int(request.args.get('points', DEFAULT_MAX_POINTS)), 3), 5000)
+        except ValueError:
+            return jsonify({'error': 'Invalid from/to date or points. Use YYYY-MM-DD or ISO timestamps'}), 400
+        
+        resolution, points = metric_series(member.id, start, end, resolution, max_points)
+        
+        return jsonify({
+            'member_id': member_id,
+            'from': start.isoformat() if start else None,
+            'to': end.isoformat() if end else None,
+            'resolution': resolution,
+            'points': points
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @member_bp.route('/membership-plans', methods=['GET'])
 @jwt_required()
 def get_membership_plans():
@@ -0,0 +1,195 @@
+"""
+Member search.
+
+On PostgreSQL, name and email matching is served by pg_trgm GIN indexes
+(created by setup.py) and typeahead results are ranked with
+word_similarity(). Other databases use an in-process trigram index that is
+built from the members table on first use, kept current by the member
+routes of this process and rebuilt after SEARCH_INDEX_TTL seconds so that
+changes made by other processes are picked up.
+"""
+
+import threading
+import time
+import heapq
+from collections import defaultdict, Counter
+from models import db, Member, User
+from sqlalchemy import func, literal
+
+# Seconds before the in-process index is rebuilt from the database
+SEARCH_INDEX_TTL = 300
+
+
+def full_name_expr():
+    """`first last` expression, matching the trigram index on members"""
+    return func.coalesce(Member.first_name, '') + ' ' + func.coalesce(Member.last_name, '')
+
+
+def is_postgres():
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+
+class NgramIndex:
+    """Trigram inverted index over member names and emails"""
+
+    def __init__(self, n=3):
+        self.n = n
+        self._lock = threading.Lock()
+        self._postings = defaultdict(set)
+        self._docs = {}
+        self.built_at = None
+
+    def grams(self, text, padded=True):
+        text = (text or '').lower()
+        if padded:
+            text = ' ' * (self.n - 1) + text + ' '
+        return {text[i:i + self.n] for i in range(len(text) - self.n + 1)}
+
+    def _add(self, doc_id, name, email):
+        fields = ((name or '').lower(), (email or '').lower())
+        field_grams = tuple(self.grams(field) for field in fields)
+        self._docs[doc_id] = (fields, field_grams)
+        for gram in field_grams[0] | field_grams[1]:
+            self._postings[gram].add(doc_id)
+
+    def _remove(self, doc_id):
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        for gram in doc[1][0] | doc[1][1]:
+            postings = self._postings.get(gram)
+            if postings is not None:
+                postings.discard(doc_id)
+                if not postings:
+                    del self._postings[gram]
+
+    def rebuild(self, rows):
+        """Replace the index contents with (id, name, email) rows"""
+        with self._lock:
+            self._postings = defaultdict(set)
+            self._docs = {}
+            for doc_id, name, email in rows:
+                self._add(doc_id, name, email)
+            self.built_at = time.monotonic()
+
+    def add(self, doc_id, name, email):
+        with self._lock:
+            self._remove(doc_id)
+            self._add(doc_id, name, email)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def substring_matches(self, term):
+        """Ids whose name or email contains `term`, or None if the term is too short to index"""
+        term = term.lower()
+        query_grams = self.grams(term, padded=False)
+        if not query_grams:
+            return None
+        with self._lock:
+            postings = sorted((self._postings.get(gram, set()) for gram in query_grams), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+            return [doc_id for doc_id in candidates
+                    if any(term in field for field in self._docs[doc_id][0])]
+
+    def top_k(self, term, k=10):
+        """Best (score, id) matches for `term`, highest score first"""
+        term = term.lower()
+        query_grams = self.grams(term)
+        with self._lock:
+            shared = Counter()
+            for gram in query_grams:
+                for doc_id in self._postings.get(gram, ()):
+                    shared[doc_id] += 1
+
+            def score(doc_id):
+                fields, field_grams = self._docs[doc_id]
+                best = 0.0
+                for field, grams in zip(fields, field_grams):
+                    common = len(query_grams & grams)
+                    best = max(best, common / (len(query_grams) + len(grams) - common))
+                    if term in field:
+                        best = max(best, 0.5 + 0.5 * len(term) / len(field))
+                return best
+
+            return heapq.nlargest(k, ((score(doc_id), doc_id) for doc_id in shared))
+
+
+_index = NgramIndex()
+
+
+def _local_index():
+    """The in-process index, (re)built from the database when missing or stale"""
+    if _index.built_at is None or time.monotonic() - _index.built_at > SEARCH_INDEX_TTL:
+        rows = db.session.query(Member.id, full_name_expr(), User.email)\
+            .join(User, Member.user_id == User.id)\
+            .filter(Member.deleted_at.is_(None)).all()
+        _index.rebuild(rows)
+    return _index
+
+
+def index_member(member, email):
+    """Keep the in-process index current after a member is created or edited"""
+    if _index.built_at is not None:
+        _index.add(member.id, f"{member.first_name or ''} {member.last_name or ''}", email)
+
+
+def index_rows(rows):
+    """Add (id, full name, email) rows, e.g. from a bulk import, to the in-process index"""
+    if _index.built_at is not None:
+        for doc_id, name, email in rows:
+            _index.add(doc_id, name, email)
+
+
+def unindex_member(member_id):
+    """Drop a deleted member from the in-process index"""
+    _index.remove(member_id)
+
+
+def search_filter(term):
+    """Filter for the members list: name or email contains `term` (case-insensitive)"""
+    pattern = f"%{term}%"
+    if not is_postgres():
+        matches = _local_index().substring_matches(term)
+        if matches is not None:
+            return Member.id.in_(matches)
+    return db.or_(full_name_expr().ilike(pattern), User.email.ilike(pattern))
+
+
+def typeahead(term, limit=10):
+    """Top `limit` members for a search box, best match first"""
+    if is_postgres():
+        name = full_name_expr()
+        score = func.greatest(func.word_similarity(term, name), func.word_similarity(term, User.email))
+        pattern = f"%{term}%"
+        rows = db.session.query(Member.id, name.label('full_name'), User.email, score.label('score'))\
+            .join(User, Member.user_id == User.id)\
+            .filter(Member.deleted_at.is_(None))\
+            .filter(db.or_(
+                name.ilike(pattern),
+                User.email.ilike(pattern),
+                literal(term).op('<%')(name),
+                literal(term).op('<%')(User.email)
+            ))\
+            .order_by(score.desc())\
+            .limit(limit).all()
+        return [{
+            'id': str(row.id),
+            'full_name': row.full_name.strip(),
+            'email': row.email,
+            'score': round(float(row.score), 3)
+        } for row in rows]
+
+    ranked = _local_index().top_k(term, limit)
+    if not ranked:
+        return []
+    rows = {row.id: row for row in db.session.query(Member.id, full_name_expr().label('full_name'), User.email)
+            .join(User, Member.user_id == User.id)
+            .filter(Member.id.in_([doc_id for _, doc_id in ranked]), Member.deleted_at.is_(None)).all()}
+    return [{
+        'id': str(doc_id),
+        'full_name': rows[doc_id].full_name.strip(),
+        'email': rows[doc_id].email,
+        'score': round(score, 3)
+    } for score, doc_id in ranked if doc_id in rows]
@@ -0,0 +1,334 @@
+"""
+Maintenance of the `member_summary` table.
+
+Routes call the record_* / refresh_* helpers after flushing the write that
+changes a member's figures and before committing, so the summary row is
+updated in the same transaction. A missing row is built from the raw tables
+the first time it is needed, which makes every helper safe to call on
+members created before the table existed.
+
+Check-ins also keep engagement counters up to date: the current and
+longest runs of consecutive visit days and the check-ins of the latest
+month with a visit. A rebuild takes the streaks from the attendance_daily
+rollup, so they survive archived attendance partitions.
+
+Rebuild every summary from the raw tables with:
+    python member_summary.py
+"""
+
+import sys
+import os
+from collections import defaultdict
+from datetime import datetime, timezone, timedelta
+
+# Add the backend directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from models import db, Member, Attendance, AttendanceDaily, MemberSummary
+from member_listing import (
+    load_latest_metrics, load_active_memberships, compute_latest_memberships
+)
+from sqlalchemy import func
+
+# Number of days tracked in MemberSummary.visit_bitmap (fits a signed BIGINT)
+VISIT_BITMAP_DAYS = 62
+VISIT_BITMAP_MASK = (1 << VISIT_BITMAP_DAYS) - 1
+
+
+def _utc_date(value):
+    """Calendar date of a timestamp in UTC (naive values are taken as UTC)"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date()
+
+
+def _mark_visit(summary, visit_date):
+    """Set the bitmap bit for `visit_date`, sliding the window forward if needed"""
+    if summary.visit_anchor is None:
+        summary.visit_anchor = visit_date
+        summary.visit_bitmap = 1
+        return
+
+    shift = (visit_date - summary.visit_anchor).days
+    if shift > 0:
+        bitmap = (summary.visit_bitmap or 0) << shift if shift < VISIT_BITMAP_DAYS else 0
+        summary.visit_bitmap = (bitmap | 1) & VISIT_BITMAP_MASK
+        summary.visit_anchor = visit_date
+    elif -shift < VISIT_BITMAP_DAYS:
+        summary.visit_bitmap = (summary.visit_bitmap or 0) | (1 << -shift)
+
+
+def _visit_runs(bitmap):
+    """Length of the run of visit days ending at the anchor (bit 0) and of the longest run in the bitmap"""
+    current = 0
+    while current < VISIT_BITMAP_DAYS and bitmap >> current & 1:
+        current += 1
+    longest = run = 0
+    for bit in range(VISIT_BITMAP_DAYS):
+        run = run + 1 if bitmap >> bit & 1 else 0
+        longest = max(longest, run)
+    return current, longest
+
+
+def _record_visit(summary, check_in):
+    """Mark a visit and update the streak and this-month counters"""
+    visit_date = _utc_date(check_in)
+    previous_anchor = summary.visit_anchor
+    _mark_visit(summary, visit_date)
+
+    current, longest = _visit_runs(summary.visit_bitmap)
+    if current == VISIT_BITMAP_DAYS:
+        # The streak is longer than the bitmap; it grew by the days the anchor moved
+        shift = (summary.visit_anchor - previous_anchor).days if previous_anchor else 0
+        current = max(current, (summary.current_streak or 0) + shift)
+    summary.current_streak = current
+    summary.longest_streak = max(summary.longest_streak or 0, current, longest)
+
+    month = visit_date.replace(day=1)
+    if summary.visit_month is None or month > summary.visit_month:
+        summary.visit_month = month
+        summary.month_visits = 1
+    elif month == summary.visit_month:
+        summary.month_visits = (summary.month_visits or 0) + 1
+
+
+def _streaks(days):
+    """(current, longest) runs of consecutive dates in `days`; the current run ends on the latest date"""
+    current = longest = 0
+    previous = None
+    for day in sorted(days):
+        current = current + 1 if previous is not None and (day - previous).days == 1 else 1
+        longest = max(longest, current)
+        previous = day
+    return current, longest
+
+
+def _as_utc(value):
+    """Make naive timestamps (as returned by some drivers) comparable with aware ones"""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _later(current, candidate):
+    if candidate is None:
+        return current
+    if current is None:
+        return candidate
+    return max(_as_utc(current), _as_utc(candidate))
+
+
+def rebuild_summaries(member_ids):
+    """Recompute the summary rows of `member_ids` from the raw tables"""
+    member_ids = list(member_ids)
+    if not member_ids:
+        return {}
+
+    existing = {row.member_id: row for row in
+                MemberSummary.query.filter(MemberSummary.member_id.in_(member_ids)).all()}
+    metrics = load_latest_metrics(member_ids)
+    active = load_active_memberships(member_ids)
+    latest = compute_latest_memberships(member_ids)
+
+    visits = {row.member_id: row for row in db.session.query(
+        Attendance.member_id,
+        func.max(Attendance.check_in).label('last_check_in'),
+        func.max(Attendance.check_out).label('last_check_out')
+    ).filter(Attendance.member_id.in_(member_ids))
+     .group_by(Attendance.member_id).all()}
+    # From the start of a month, so the month of any visit in the bitmap is counted in full
+    window_start = (datetime.now(timezone.utc) - timedelta(days=VISIT_BITMAP_DAYS))\
+        .replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    recent_visits = db.session.query(Attendance.member_id, Attendance.check_in)\
+        .filter(Attendance.member_id.in_(member_ids), Attendance.check_in >= window_start)\
+        .order_by(Attendance.check_in).all()
+    # Streaks span the whole history, which the daily rollup keeps after raw rows are archived
+    visit_dates = defaultdict(set)
+    for member_id, day in db.session.query(AttendanceDaily.member_id, AttendanceDaily.day)\
+            .filter(AttendanceDaily.member_id.in_(member_ids), AttendanceDaily.visits > 0).all():
+        visit_dates[member_id].add(day)
+    for member_id, check_in in recent_visits:
+        visit_dates[member_id].add(_utc_date(check_in))
+
+    summaries = {}
+    for member_id in member_ids:
+        summary = existing.get(member_id)
+        if summary is None:
+            summary = MemberSummary(member_id=member_id)
+            db.session.add(summary)
+
+        metric = metrics.get(member_id)
+        summary.metric_measured_at = metric.measured_at if metric else None
+        summary.height_cm = metric.height_cm if metric else None
+        summary.weight_kg = metric.weight_kg if metric else None
+        summary.bmi = metric.bmi if metric else None
+
+        visit = visits.get(member_id)
+        summary.last_check_in = visit.last_check_in if visit else None
+        summary.last_check_out = visit.last_check_out if visit else None
+        summary.visit_anchor = None
+        summary.visit_bitmap = 0
+        summary.current_streak, summary.longest_streak = _streaks(visit_dates[member_id])
+        summary.visit_month = None
+        summary.month_visits = 0
+
+        _set_memberships(summary, active.get(member_id), latest.get(member_id))
+        summaries[member_id] = summary
+
+    for member_id, check_in in recent_visits:
+        summary = summaries[member_id]
+        visit_date = _utc_date(check_in)
+        _mark_visit(summary, visit_date)
+        if summary.visit_month != visit_date.replace(day=1):
+            summary.visit_month = visit_date.replace(day=1)
+            summary.month_visits = 0
+        summary.month_visits += 1
+    db.session.flush()
+    return summaries
+
+
+def _set_memberships(summary, active, latest):
+    summary.active_plan_id = active.plan_id if active else None
+    summary.active_plan_name = active.plan_name if active else None
+    summary.active_end_date = active.end_date if active else None
+    summary.latest_plan_id = latest.plan_id if latest else None
+    summary.latest_plan_name = latest.plan_name if latest else None
+    summary.latest_start_date = latest.start_date if latest else None
+    summary.latest_end_date = latest.end_date if latest else None
+    summary.latest_status = latest.status if latest else None
+
+
+def get_summary(member_id):
+    """Summary row of a member, locked for update and built if missing"""
+    summary = db.session.get(MemberSummary, member_id, with_for_update=True)
+    if summary is None:
+        summary = rebuild_summaries([member_id])[member_id]
+    return summary
+
+
+def _lock_summaries(member_ids):
+    """
+    Summary rows of many members, locked, as ({member_id: summary}, ids of
+    the rows built just now from the raw tables)
+    """
+    member_ids = list(member_ids)
+    if not member_ids:
+        return {}, set()
+    summaries = {row.member_id: row for row in MemberSummary.query
+                 .filter(MemberSummary.member_id.in_(member_ids))
+                 .with_for_update().all()}
+    missing = [member_id for member_id in member_ids if member_id not in summaries]
+    if missing:
+        summaries.update(rebuild_summaries(missing))
+    return summaries, set(missing)
+
+
+def get_summaries(member_ids):
+    """Summary rows of many members as {member_id: summary}, locked and built if missing"""
+    summaries, _ = _lock_summaries(member_ids)
+    return summaries
+
+
+def record_check_in(member_id, check_in):
+    """Account for a new check-in of a member"""
+    summaries, built = _lock_summaries([member_id])
+    summary = summaries[member_id]
+    summary.last_check_in = _later(summary.last_check_in, check_in)
+    # A row built from the raw tables already counts the new check-in
+    if member_id not in built:
+        _record_visit(summary, check_in)
+
+
+def record_check_out(member_id, check_out):
+    """Account for a member checking out"""
+    summary = get_summary(member_id)
+    summary.last_check_out = _later(summary.last_check_out, check_out)
+
+
+def record_attendance(check_ins, check_outs):
+    """
+    Account for many check-ins and check-outs at once; both are lists of
+    (member_id, timestamp) for rows that are already flushed
+    """
+    summaries, built = _lock_summaries({member_id for member_id, _ in check_ins + check_outs})
+    for member_id, check_in in sorted(check_ins, key=lambda visit: _as_utc(visit[1])):
+        summary = summaries[member_id]
+        summary.last_check_in = _later(summary.last_check_in, check_in)
+        # Rows built from the raw tables already count the new check-ins
+        if member_id not in built:
+            _record_visit(summary, check_in)
+    for member_id, check_out in check_outs:
+        summary = summaries[member_id]
+        summary.last_check_out = _later(summary.last_check_out, check_out)
+
+
+def _apply_metric(summary, metric):
+    if summary.metric_measured_at is None or (
+            metric.measured_at is not None and
+            _as_utc(metric.measured_at) >= _as_utc(summary.metric_measured_at)):
+        summary.metric_measured_at = metric.measured_at
+        summary.height_cm = metric.height_cm
+        summary.weight_kg = metric.weight_kg
+        summary.bmi = metric.bmi
+
+
+def record_metric(member_id, metric):
+    """Account for a new physical metric row (must be flushed)"""
+    _apply_metric(get_summary(member_id), metric)
+
+
+def record_metrics(latest_by_member):
+    """Account for new metric rows of many members at once ({member_id: newest new metric})"""
+    summaries = get_summaries(latest_by_member)
+    for member_id, metric in latest_by_member.items():
+        _apply_metric(summaries[member_id], metric)
+
+
+def refresh_memberships(member_id):
+    """Recompute the membership fields of a member after a membership change"""
+    summary = get_summary(member_id)
+    db.session.flush()
+    _set_memberships(summary,
+                     load_active_memberships([member_id]).get(member_id),
+                     compute_latest_memberships([member_id]).get(member_id))
+
+
+def rename_plan(plan_id, name):
+    """Propagate a membership plan rename to the summaries that show it"""
+    MemberSummary.query.filter(MemberSummary.active_plan_id == plan_id)\
+        .update({MemberSummary.active_plan_name: name}, synchronize_session=False)
+    MemberSummary.query.filter(MemberSummary.latest_plan_id == plan_id)\
+        .update({MemberSummary.latest_plan_name: name}, synchronize_session=False)
+
+
+def rebuild_all(batch_size=500):
+    """Rebuild the summary of every member, committing per batch"""
+    total = 0
+    last_id = None
+    while True:
+        query = db.session.query(Member.id).order_by(Member.id)
+        if last_id is not None:
+            query = query.filter(Member.id > last_id)
+        member_ids = [row.id for row in query.limit(batch_size).all()]
+        if not member_ids:
+            break
+        rebuild_summaries(member_ids)
+        db.session.commit()
+        total += len(member_ids)
+        last_id = member_ids[-1]
+        print(f"Rebuilt {total} member summaries...")
+    return total
+
+
+def main():
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        total = rebuild_all()
+        print(f"Done. Rebuilt {total} member summaries.")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,9 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import (
     db, MembershipPlan, MemberMembership, Member, User, Role, Payment
 )
+from pagination import InvalidCursor, keyset_paginate, page_meta, wants_total
+from member_summary import refresh_memberships, rename_plan
+from payment_stats import invalidate_payment_stats
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import func, desc
 from datetime import datetime, timezone, date, timedelta
@@ -180,6 +183,7 @@ def update_membership_plan(plan_id):
             if existing_plan:
                 return jsonify({'error': 'Plan name already exists'}), 400
             plan.name = data['name']
+            rename_plan(plan.id, plan.name)
         
         if 'duration_days' in data:
             try:
@@ -286,10 +290,12 @@ def get_memberships():
         plan_id = request.args.get('plan_id')
         page = int(request.args.get('page', 1))
         limit = int(request.args.get('limit', 50))
+        cursor = request.args.get('cursor')  # present (even empty) selects cursor mode
+        cursor_mode = cursor is not None
         
         # Build query
         query = db.session.query(MemberMembership)\
-            .join(Member).join(MembershipPlan)
+            .join(Member, MemberMembership.member_id == Member.id).join(MembershipPlan)
         
         # Apply filters
         if status != 'all':
@@ -309,12 +315,18 @@ def get_memberships():
             except ValueError:
                 return jsonify({'error': 'Invalid plan ID format'}), 400
         
-        # Get total count
-        total = query.count()
+        # Get total count (optional in cursor mode)
+        total = query.count() if wants_total(request.args, cursor_mode) else None
         
         # Apply pagination and ordering
-        memberships = query.order_by(desc(MemberMembership.start_date))\
-            .offset((page - 1) * limit).limit(limit).all()
+        next_cursor = None
+        if cursor_mode:
+            memberships, next_cursor = keyset_paginate(
+                query, [(MemberMembership.start_date, True), (MemberMembership.id, True)], cursor, limit
+            )
+        else:
+            memberships = query.order_by(desc(MemberMembership.start_date))\
+                .offset((page - 1) * limit).limit(limit).all()
         
         # Format response
         memberships_data = []
@@ -344,12 +356,11 @@ def get_memberships():
         
         return jsonify({
             'memberships': memberships_data,
-            'total': total,
-            'page': page,
-            'limit': limit,
-            'pages': (total + limit - 1) // limit
+            **page_meta(limit, total, page, next_cursor, cursor_mode)
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -384,7 +395,7 @@ def create_membership():
         
         # Check if member exists
         member = Member.query.get(data['member_id'])
-        if not member:
+        if not member or member.deleted_at:
             return jsonify({'error': 'Member not found'}), 404
         
         # Check if plan exists
@@ -445,6 +456,8 @@ def create_membership():
             mode=data.get('payment_mode', 'Cash')
         )
         db.session.add(payment)
+        invalidate_payment_stats()
+        refresh_memberships(membership.member_id)
         
         db.session.commit()
         
@@ -509,6 +522,7 @@ def update_membership(membership_id):
             except ValueError:
                 return jsonify({'error': 'Invalid end_date format. Use YYYY-MM-DD'}), 400
         
+        refresh_memberships(membership.member_id)
         db.session.commit()
         
         return jsonify({
@@ -0,0 +1,163 @@
+"""
+Downsampled physical-metric series for progress charts.
+
+Reads are served by the (member_id, measured_at) index. A series is either
+the raw readings, per-day/week/month averages computed in SQL, or an LTTB
+(largest-triangle-three-buckets) selection of raw readings computed with
+NumPy. The `auto` resolution returns raw readings when they fit in
+`max_points` and otherwise the finest bucket size that does.
+"""
+
+import numpy as np
+from datetime import datetime, timezone, timedelta
+from models import db, PhysicalMetric
+from sqlalchemy import func
+
+RESOLUTIONS = ['auto', 'raw', 'day', 'week', 'month', 'lttb']
+
+# Upper bound on points returned by `auto` and `lttb`
+DEFAULT_MAX_POINTS = 500
+
+# Approximate bucket lengths in days, used to pick a bucket size for `auto`
+BUCKET_DAYS = {'day': 1, 'week': 7, 'month': 30}
+
+
+def _bucket_expr(resolution):
+    """Start of the day/week/month containing measured_at"""
+    column = PhysicalMetric.measured_at
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return func.date(func.date_trunc(resolution, column))
+    if resolution == 'day':
+        return func.date(column)
+    if resolution == 'week':
+        # Monday on or before the reading, like date_trunc('week')
+        return func.date(column, '-6 days', 'weekday 1')
+    return func.date(column, 'start of month')
+
+
+def _in_range(query, member_id, start, end):
+    query = query.filter(PhysicalMetric.member_id == member_id)
+    if start is not None:
+        query = query.filter(PhysicalMetric.measured_at >= start)
+    if end is not None:
+        query = query.filter(PhysicalMetric.measured_at < end)
+    return query
+
+
+def _number(value):
+    return float(value) if value is not None else None
+
+
+def _timestamp(value):
+    if isinstance(value, str):
+        return value
+    return value.isoformat() if value is not None else None
+
+
+def raw_points(member_id, start=None, end=None):
+    rows = _in_range(db.session.query(
+        PhysicalMetric.measured_at, PhysicalMetric.weight_kg, PhysicalMetric.bmi
+    ), member_id, start, end).order_by(PhysicalMetric.measured_at).all()
+    return [{
+        't': _timestamp(row.measured_at),
+        'weight_kg': _number(row.weight_kg),
+        'bmi': _number(row.bmi),
+        'count': 1
+    } for row in rows]
+
+
+def bucketed_points(member_id, resolution, start=None, end=None):
+    """Average weight and BMI per day, week or month, computed in the database"""
+    bucket = _bucket_expr(resolution).label('bucket')
+    rows = _in_range(db.session.query(
+        bucket,
+        func.avg(PhysicalMetric.weight_kg).label('weight_kg'),
+        func.avg(PhysicalMetric.bmi).label('bmi'),
+        func.count(PhysicalMetric.id).label('count')
+    ), member_id, start, end).group_by(bucket).order_by(bucket).all()
+    return [{
+        't': _timestamp(row.bucket),
+        'weight_kg': round(_number(row.weight_kg), 2) if row.weight_kg is not None else None,
+        'bmi': round(_number(row.bmi), 2) if row.bmi is not None else None,
+        'count': row.count
+    } for row in rows]
+
+
+def lttb_indices(x, y, threshold):
+    """Indices of the points kept by largest-triangle-three-buckets downsampling"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # First and last points are always kept; the rest is split into threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point) is the third triangle vertex
+        if i + 2 < len(edges):
+            next_x = x[hi:edges[i + 2]].mean()
+            next_y = y[hi:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        areas = np.abs(
+            (x[previous] - next_x) * (y[lo:hi] - y[previous]) -
+            (x[previous] - x[lo:hi]) * (next_y - y[previous])
+        )
+        previous = lo + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
+
+
+def lttb_points(member_id, max_points, start=None, end=None):
+    """Raw readings thinned to `max_points` with LTTB on the weight curve"""
+    points = [point for point in raw_points(member_id, start, end) if point['weight_kg'] is not None]
+    if len(points) <= max_points:
+        return points
+    x = np.array([datetime.fromisoformat(point['t']).timestamp() for point in points])
+    y = np.array([point['weight_kg'] for point in points])
+    return [points[i] for i in lttb_indices(x, y, max_points)]
+
+
+def _auto_resolution(member_id, max_points, start, end):
+    count, first, last = _in_range(db.session.query(
+        func.count(PhysicalMetric.id),
+        func.min(PhysicalMetric.measured_at),
+        func.max(PhysicalMetric.measured_at)
+    ), member_id, start, end).one()
+    if count <= max_points:
+        return 'raw'
+    span_days = (last - first).days + 1
+    for resolution in ['day', 'week']:
+        if span_days / BUCKET_DAYS[resolution] <= max_points:
+            return resolution
+    return 'month'
+
+
+def metric_series(member_id, start=None, end=None, resolution='auto', max_points=DEFAULT_MAX_POINTS):
+    """Weight and BMI series of a member; returns (resolution used, points)"""
+    if resolution == 'auto':
+        resolution = _auto_resolution(member_id, max_points, start, end)
+    if resolution == 'raw':
+        return resolution, raw_points(member_id, start, end)
+    if resolution == 'lttb':
+        return resolution, lttb_points(member_id, max_points, start, end)
+    return resolution, bucketed_points(member_id, resolution, start, end)
+
+
+def parse_bound(value, inclusive_end=False):
+    """
+    Parse a from/to query parameter (YYYY-MM-DD or ISO timestamp) as UTC.
+    With inclusive_end, a plain date covers that whole day.
+    """
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    if inclusive_end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
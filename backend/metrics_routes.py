@@ -0,0 +1,183 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models import db, PhysicalMetric, Member, User
+from member_summary import record_metrics
+from db_utils import dialect_insert
+from sqlalchemy.exc import SQLAlchemyError
+from collections import namedtuple
+from datetime import datetime, timezone
+import numpy as np
+import uuid
+
+metrics_bp = Blueprint('metrics', __name__, url_prefix='/api/metrics')
+
+# Readings written per INSERT statement
+BATCH_CHUNK_SIZE = 1000
+
+# Largest batch accepted in one request
+MAX_BATCH_READINGS = 20000
+
+Reading = namedtuple('Reading', ['index', 'member_id', 'measured_at', 'height_cm', 'weight_kg'])
+StoredMetric = namedtuple('StoredMetric', ['measured_at', 'height_cm', 'weight_kg', 'bmi'])
+
+def get_current_user():
+    """Helper function to get current user from JWT token"""
+    current_user_id = get_jwt_identity()
+    if not current_user_id:
+        return None
+    return User.query.get(current_user_id)
+
+def is_admin(user):
+    """Check if user has admin role"""
+    if not user or not user.role:
+        return False
+    # Handle both uppercase and lowercase role names
+    role_name = user.role.name.upper() if user.role.name else ''
+    return role_name == 'ADMIN'
+
+def parse_reading(index, data):
+    """Validate one reading of a batch; raises ValueError with a message for the client"""
+    if not isinstance(data, dict):
+        raise ValueError('Reading must be an object')
+
+    try:
+        member_id = uuid.UUID(str(data.get('member_id')))
+    except ValueError:
+        raise ValueError('Invalid member_id')
+
+    if not data.get('measured_at'):
+        raise ValueError('measured_at is required')
+    try:
+        measured_at = datetime.fromisoformat(str(data['measured_at']).replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError('Invalid measured_at. Use an ISO 8601 timestamp')
+    if measured_at.tzinfo is None:
+        measured_at = measured_at.replace(tzinfo=timezone.utc)
+    measured_at = measured_at.astimezone(timezone.utc)
+
+    height = data.get('height_cm', data.get('height'))
+    weight = data.get('weight_kg', data.get('weight'))
+    try:
+        height = float(height) if height not in (None, '') else None
+        weight = float(weight) if weight not in (None, '') else None
+    except (TypeError, ValueError):
+        raise ValueError('height and weight must be numbers')
+    if height is None and weight is None:
+        raise ValueError('height or weight is required')
+    if (height is not None and not 0 < height < 300) or (weight is not None and not 0 < weight < 700):
+        raise ValueError('height or weight out of range')
+
+    return Reading(index, member_id, measured_at, height, weight)
+
+def compute_bmi(readings):
+    """BMI for a list of readings, None where height or weight is missing"""
+    heights = np.array([r.height_cm if r.height_cm is not None else np.nan for r in readings], dtype=float)
+    weights = np.array([r.weight_kg if r.weight_kg is not None else np.nan for r in readings], dtype=float)
+    bmi = np.round(weights / (heights / 100) ** 2, 2)
+    return [None if np.isnan(value) else float(value) for value in bmi]
+
+def insert_readings(readings):
+    """
+    Insert readings with one multi-row INSERT, skipping (member_id, measured_at)
+    keys that are already stored, and update member summaries.
+    Returns the number of readings stored.
+    """
+    rows = [{
+        'id': uuid.uuid4(),
+        'member_id': reading.member_id,
+        'measured_at': reading.measured_at,
+        'height_cm': reading.height_cm,
+        'weight_kg': reading.weight_kg,
+        'bmi': bmi,
+        'created_at': datetime.now(timezone.utc)
+    } for reading, bmi in zip(readings, compute_bmi(readings))]
+    statement = dialect_insert(PhysicalMetric).values(rows)\
+        .on_conflict_do_nothing(index_elements=['member_id', 'measured_at'])\
+        .returning(PhysicalMetric.id)
+    stored_ids = set(db.session.execute(statement).scalars().all())
+    rows = [row for row in rows if row['id'] in stored_ids]
+
+    latest = {}
+    for row in rows:
+        current = latest.get(row['member_id'])
+        if current is None or row['measured_at'] > current.measured_at:
+            latest[row['member_id']] = StoredMetric(row['measured_at'], row['height_cm'], row['weight_kg'], row['bmi'])
+    record_metrics(latest)
+    return len(rows)
+
+@metrics_bp.route('/batch', methods=['POST'])
+@jwt_required()
+def ingest_batch():
+    """Bulk-ingest scale readings across members (Admin only)"""
+    try:
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        if not is_admin(current_user):
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        data = request.get_json()
+        readings_data = data.get('readings') if isinstance(data, dict) else data
+        if not isinstance(readings_data, list) or not readings_data:
+            return jsonify({'error': 'readings must be a non-empty list'}), 400
+        if len(readings_data) > MAX_BATCH_READINGS:
+            return jsonify({'error': f'At most {MAX_BATCH_READINGS} readings per batch'}), 400
+        
+        errors = []
+        inserted = 0
+        duplicates = 0
+        
+        # Validate, and drop repeats of a (member_id, measured_at) key within the batch
+        readings = []
+        seen = set()
+        for index, item in enumerate(readings_data):
+            try:
+                reading = parse_reading(index, item)
+            except ValueError as e:
+                errors.append({'index': index, 'error': str(e)})
+                continue
+            key = (reading.member_id, reading.measured_at)
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            readings.append(reading)
+        
+        for start in range(0, len(readings), BATCH_CHUNK_SIZE):
+            chunk = readings[start:start + BATCH_CHUNK_SIZE]
+        
+            # Unknown or deleted members
+            member_ids = {reading.member_id for reading in chunk}
+            known = {row.id for row in db.session.query(Member.id).filter(
+                Member.id.in_(member_ids), Member.deleted_at.is_(None)
+            ).all()}
+        
+            new_readings = []
+            for reading in chunk:
+                if reading.member_id not in known:
+                    errors.append({'index': reading.index, 'error': 'Member not found'})
+                else:
+                    new_readings.append(reading)
+        
+            # Readings that are already stored are skipped by the INSERT
+            stored = insert_readings(new_readings) if new_readings else 0
+            db.session.commit()
+            inserted += stored
+            duplicates += len(new_readings) - stored
+        
+        errors.sort(key=lambda error: error['index'])
+        return jsonify({
+            'message': f'Stored {inserted} readings',
+            'inserted': inserted,
+            'duplicates': duplicates,
+            'failed': len(errors),
+            'errors': errors
+        }), 200
+
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return jsonify({'error': 'Database error occurred'}), 500
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
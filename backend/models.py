@@ -12,6 +12,10 @@ def utc_now():
     """Return current UTC time as timezone-aware datetime"""
     return datetime.now(timezone.utc)
 
+def hash_password(password):
+    """bcrypt hash of a password (module-level so it can run in worker processes)"""
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
 # Association tables (many-to-many)
 member_workout_assoc = Table(
     "member_workout_plans", db.metadata,
@@ -66,7 +70,7 @@ class User(db.Model):
 
     def set_password(self, password):
         """Hash and set password"""
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
         """Check if provided password matches the hash"""
@@ -99,13 +103,13 @@ class Trainer(db.Model):
     bio = Column(db.Text)
     rating = Column(db.Numeric(3, 2), default=0.0)  # Rating from 0.00 to 5.00
     salary = Column(db.Integer, default=0)  # Monthly salary amount
-    total_clients = Column(db.Integer, default=0)  # Total number of clients
+    total_clients = Column(db.Integer, default=0)  # Distinct members trained, kept by trainer_analytics
     availability = Column(db.String(50))  # Availability status (Full-time, Part-time, etc)
     is_active = Column(db.Boolean, default=True)
     created_at = Column(db.TIMESTAMP(timezone=True), default=utc_now)
     updated_at = Column(db.TIMESTAMP(timezone=True), default=utc_now, onupdate=utc_now)
 
-    user = db.relationship("User", backref="trainer_profile")
+    user = db.relationship("User", backref=db.backref("trainer_profile", uselist=False))
     phones = db.relationship("TrainerPhone", cascade="all,delete-orphan")
 
     def to_dict(self):
@@ -154,10 +158,11 @@ class Member(db.Model):
     current_plan_id = Column(UUID(as_uuid=True), ForeignKey("member_memberships.id"), nullable=True)
     emergency_contact = Column(db.String(50))
     is_active = Column(db.Boolean, default=True)
+    deleted_at = Column(db.TIMESTAMP(timezone=True), nullable=True)  # Set on delete; rows are purged in the background
     created_at = Column(db.TIMESTAMP(timezone=True), default=utc_now)
     updated_at = Column(db.TIMESTAMP(timezone=True), default=utc_now, onupdate=utc_now)
 
-    user = db.relationship("User", backref="member_profile")
+    user = db.relationship("User", backref=db.backref("member_profile", uselist=False))
     phones = db.relationship("MemberPhone", cascade="all,delete-orphan")
     addresses = db.relationship("Address", cascade="all,delete-orphan")
     memberships = db.relationship("MemberMembership", back_populates="member", foreign_keys="[MemberMembership.member_id]")
@@ -209,6 +214,9 @@ class MemberMembership(db.Model):
     discount = Column(db.Numeric(7, 2), default=0)
     created_at = Column(db.TIMESTAMP(timezone=True), default=utc_now)
 
+    # Keyset pagination order for the memberships list
+    __table_args__ = (db.Index('ix_member_memberships_start_date_id', 'start_date', 'id'),)
+
     member = db.relationship("Member", back_populates="memberships", foreign_keys=[member_id])
     plan = db.relationship("MembershipPlan")
 
@@ -249,6 +257,10 @@ class Equipment(db.Model):
     next_maintenance_date = Column(db.Date)
     created_at = Column(db.TIMESTAMP(timezone=True), default=utc_now)
 
+# Keyset pagination order for the equipment list
+db.Index('ix_equipment_category_name_id',
+         db.func.coalesce(Equipment.category, ''), Equipment.name, Equipment.id)
+
 class Attendance(db.Model):
     __tablename__ = "attendance"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -257,6 +269,25 @@ class Attendance(db.Model):
     check_in = Column(db.TIMESTAMP(timezone=True), nullable=False)
     check_out = Column(db.TIMESTAMP(timezone=True), nullable=True)
     created_at = Column(db.TIMESTAMP(timezone=True), default=utc_now)
+    # Client-supplied key that makes retried check-ins safe
+    idempotency_key = Column(db.String(100), nullable=True)
+    # Closed by the stale-session sweeper rather than by a check-out; the
+    # session's real duration is unknown
+    auto_closed = Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+
+    __table_args__ = (
+        # Keyset pagination order for the attendance list
+        db.Index('ix_attendance_check_in_id', 'check_in', 'id'),
+        # At most one open session per member; check-in relies on it to be race-free
+        db.Index('uq_attendance_open_member', 'member_id', unique=True,
+                 postgresql_where=check_out.is_(None), sqlite_where=check_out.is_(None)),
+        db.Index('uq_attendance_idempotency_key', 'idempotency_key', unique=True),
+        # Trainer analytics
+        db.Index('ix_attendance_trainer_check_in', 'trainer_id', 'check_in'),
+    )
+
+    member = db.relationship("Member")
+    trainer = db.relationship("Trainer")
 
 class Payment(db.Model):
     __tablename__ = "payments"
@@ -267,6 +298,12 @@ class Payment(db.Model):
     date = Column(db.TIMESTAMP(timezone=True), default=utc_now)
     mode = Column(db.String(80))
 
+    # Keyset pagination order for the payments list
+    __table_args__ = (db.Index('ix_payments_date_id', 'date', 'id'),)
+
+    member = db.relationship("Member")
+    membership = db.relationship("MemberMembership")
+
 class PhysicalMetric(db.Model):
     __tablename__ = "physical_metrics"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -275,4 +312,151 @@ class PhysicalMetric(db.Model):
     height_cm = Column(db.Numeric(6, 2))
     weight_kg = Column(db.Numeric(6, 2))
     bmi = Column(db.Numeric(6, 2))
-    created_at = Column(db.TIMESTAMP(timezone=True), default=utc_now)
\ No newline at end of file
+    created_at = Column(db.TIMESTAMP(timezone=True), default=utc_now)
+
+    # Latest-metric lookups and time-series reads; unique, so batch ingestion
+    # skips repeated readings with ON CONFLICT DO NOTHING
+    __table_args__ = (db.Index('ix_physical_metrics_member_measured_at', 'member_id', 'measured_at', unique=True),)
+
+class MemberSummary(db.Model):
+    """Precomputed per-member figures shown on member list and detail views.
+
+    Maintained in the same transaction as the writes that change them
+    (check-in/out, new metrics, membership changes) and rebuildable from the
+    raw tables with `python member_summary.py`.
+    """
+    __tablename__ = "member_summary"
+    member_id = Column(UUID(as_uuid=True), ForeignKey("members.id", ondelete="CASCADE"), primary_key=True)
+    # Latest physical metric
+    metric_measured_at = Column(db.TIMESTAMP(timezone=True))
+    height_cm = Column(db.Numeric(6, 2))
+    weight_kg = Column(db.Numeric(6, 2))
+    bmi = Column(db.Numeric(6, 2))
+    # Attendance: bit i of visit_bitmap is set if the member visited on visit_anchor - i days
+    last_check_in = Column(db.TIMESTAMP(timezone=True))
+    last_check_out = Column(db.TIMESTAMP(timezone=True))
+    visit_anchor = Column(db.Date)
+    visit_bitmap = Column(db.BigInteger, default=0, nullable=False)
+    # Runs of consecutive visit days; current_streak is the run ending on visit_anchor
+    current_streak = Column(db.Integer, default=0, nullable=False)
+    longest_streak = Column(db.Integer, default=0, nullable=False)
+    # Check-ins in the calendar month starting on visit_month
+    visit_month = Column(db.Date)
+    month_visits = Column(db.Integer, default=0, nullable=False)
+    # Active membership
+    active_plan_id = Column(UUID(as_uuid=True))
+    active_plan_name = Column(db.String(120))
+    active_end_date = Column(db.Date)
+    # Most recent membership (any status)
+    latest_plan_id = Column(UUID(as_uuid=True))
+    latest_plan_name = Column(db.String(120))
+    latest_start_date = Column(db.Date)
+    latest_end_date = Column(db.Date)
+    latest_status = Column(db.String(50))
+    updated_at = Column(db.TIMESTAMP(timezone=True), default=utc_now, onupdate=utc_now)
+
+
+class MemberPurgeJob(db.Model):
+    """Background removal of a soft-deleted member and their dependent rows"""
+    __tablename__ = "member_purge_jobs"
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    # Not a foreign key: the member row is removed by the job itself
+    member_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    requested_by = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    status = Column(db.String(20), nullable=False, default="pending")  # pending, running, done, failed
+    current_step = Column(db.String(50))
+    rows_deleted = Column(db.Integer, nullable=False, default=0)
+    attempts = Column(db.Integer, nullable=False, default=0)
+    error = Column(db.Text)
+    created_at = Column(db.TIMESTAMP(timezone=True), default=utc_now)
+    started_at = Column(db.TIMESTAMP(timezone=True))
+    finished_at = Column(db.TIMESTAMP(timezone=True))
+    updated_at = Column(db.TIMESTAMP(timezone=True), default=utc_now, onupdate=utc_now)
+
+    __table_args__ = (db.Index('ix_member_purge_jobs_status_created_at', 'status', 'created_at'),)
+
+    def to_dict(self):
+        return {
+            'id': str(self.id),
+            'member_id': str(self.member_id),
+            'status': self.status,
+            'current_step': self.current_step,
+            'rows_deleted': self.rows_deleted,
+            'attempts': self.attempts,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class AttendanceQueueCheckpoint(db.Model):
+    """Last event of a write-behind attendance queue applied to this database"""
+    __tablename__ = "attendance_queue_checkpoints"
+    # Random id stored in the queue file
+    queue_id = Column(db.String(36), primary_key=True)
+    last_sequence = Column(db.BigInteger, nullable=False, default=0)
+    updated_at = Column(db.TIMESTAMP(timezone=True), default=utc_now, onupdate=utc_now)
+
+
+class AttendanceDaily(db.Model):
+    """Visits of a member per day, rolled up from attendance (kept after raw rows are archived)"""
+    __tablename__ = "attendance_daily"
+    day = Column(db.Date, primary_key=True)
+    member_id = Column(UUID(as_uuid=True), ForeignKey("members.id", ondelete="CASCADE"), primary_key=True)
+    visits = Column(db.Integer, nullable=False, default=0)
+    completed_sessions = Column(db.Integer, nullable=False, default=0)
+    workout_minutes = Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (db.Index('ix_attendance_daily_member_day', 'member_id', 'day'),)
+
+
+class AttendanceHourly(db.Model):
+    """Check-ins of the whole gym per day and hour of check-in, rolled up from attendance"""
+    __tablename__ = "attendance_hourly"
+    day = Column(db.Date, primary_key=True)
+    hour = Column(db.SmallInteger, primary_key=True)
+    visits = Column(db.Integer, nullable=False, default=0)
+
+
+class TrainerClient(db.Model):
+    """Members a trainer has had sessions with; Trainer.total_clients counts them"""
+    __tablename__ = "trainer_clients"
+    trainer_id = Column(UUID(as_uuid=True), ForeignKey("trainers.id", ondelete="CASCADE"), primary_key=True)
+    member_id = Column(UUID(as_uuid=True), ForeignKey("members.id", ondelete="CASCADE"), primary_key=True)
+    first_session_at = Column(db.TIMESTAMP(timezone=True), nullable=False)
+
+    __table_args__ = (db.Index('ix_trainer_clients_member_id', 'member_id'),)
+
+
+class AttendanceForecast(db.Model):
+    """Fitted parameters of the occupancy forecast, refitted nightly (see attendance_forecast.py)"""
+    __tablename__ = "attendance_forecasts"
+    name = Column(db.String(50), primary_key=True)
+    fitted_at = Column(db.TIMESTAMP(timezone=True), nullable=False)
+    gym_timezone = Column(db.String(64), nullable=False)
+    history_weeks = Column(db.Integer, nullable=False)
+    # Expected check-ins per local weekday and hour at trend_origin (168 values, Monday 00:00 first)
+    seasonal = Column(db.JSON, nullable=False)
+    # Change of the hourly check-ins per week away from trend_origin
+    trend_per_week = Column(db.Float, nullable=False, default=0)
+    trend_origin = Column(db.TIMESTAMP(timezone=True), nullable=False)
+    # Average length of a completed session, which turns check-ins into occupancy
+    session_minutes = Column(db.Float, nullable=False)
+
+
+class CacheVersion(db.Model):
+    """Counters bumped by the writes that make cached results stale"""
+    __tablename__ = "cache_versions"
+    name = Column(db.String(50), primary_key=True)
+    version = Column(db.BigInteger, nullable=False, default=0)
+
+
+class PaymentStatsCache(db.Model):
+    """Payment statistics per period and day, valid while `version` is the current 'payments' version"""
+    __tablename__ = "payment_stats_cache"
+    period = Column(db.String(10), primary_key=True)
+    day = Column(db.Date, primary_key=True)
+    version = Column(db.BigInteger, nullable=False)
+    payload = Column(db.JSON, nullable=False)
+    computed_at = Column(db.TIMESTAMP(timezone=True), default=utc_now)
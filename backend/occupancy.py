@@ -0,0 +1,257 @@
+"""
+Live gym occupancy.
+
+Every process keeps the open attendance sessions (checked in, not checked
+out) in an in-memory OccupancyTracker, so lobby screens polling
+/attendance/current never hit the database. The tracker is loaded from the
+database on first use and then kept current by attendance events:
+
+- Routes call publish_event() before committing. On PostgreSQL this is a
+  pg_notify() on the ATTENDANCE_CHANNEL, which is delivered to every
+  process only if the transaction commits.
+- After the commit, routes call apply_event() so the local tracker is
+  updated immediately.
+- A listener thread (started by create_app on PostgreSQL) LISTENs on the
+  channel and applies events from other processes.
+
+Events are idempotent (keyed by attendance id), so a process applying its
+own event twice is harmless. As a safety net against missed notifications
+the tracker is reloaded every OCCUPANCY_RESYNC_SECONDS.
+"""
+
+import json
+import select
+import threading
+import time
+from datetime import datetime, timezone
+from models import db, Attendance, Member, Trainer
+from sqlalchemy import func, text
+
+ATTENDANCE_CHANNEL = 'attendance_events'
+
+OCCUPANCY_RESYNC_SECONDS = 300
+
+# How long the listener waits for notifications before checking for shutdown
+LISTEN_POLL_SECONDS = 5
+
+
+def _full_name(first_name, last_name):
+    return f"{first_name} {last_name}"
+
+
+def _parse_time(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value is not None and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def current_members(sessions, now=None):
+    """Open sessions as /attendance/current lists them"""
+    now = now or datetime.now(timezone.utc)
+    members = []
+    for session in sessions:
+        # Calculate time since check-in
+        time_since_checkin = now - session['check_in']
+        hours_since = int(time_since_checkin.total_seconds() / 3600)
+        minutes_since = int((time_since_checkin.total_seconds() % 3600) / 60)
+        members.append({
+            'attendance_id': session['attendance_id'],
+            'member_id': session['member_id'],
+            'member_name': session['member_name'],
+            'check_in': session['check_in'].isoformat(),
+            'time_since_checkin': f"{hours_since}h {minutes_since}m",
+            'trainer_name': session['trainer_name']
+        })
+    return members
+
+
+class OccupancyTracker:
+    """Open attendance sessions of the gym, keyed by attendance id"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._sessions = {}
+        self._loaded_at = None
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Call `callback(event, count)` after every event that changes the tracked sessions"""
+        self._listeners.append(callback)
+
+    def _notify(self, event, count):
+        for callback in self._listeners:
+            try:
+                callback(event, count)
+            except Exception as e:
+                print(f"Occupancy listener error: {e}")
+
+    def load(self):
+        """Replace the tracked sessions with the open sessions in the database"""
+        with self._lock:
+            rows = db.session.query(
+                Attendance.id, Attendance.member_id, Attendance.check_in, Attendance.trainer_id,
+                Member.first_name, Member.last_name,
+                Trainer.first_name.label('trainer_first_name'),
+                Trainer.last_name.label('trainer_last_name')
+            ).join(Member, Attendance.member_id == Member.id)\
+             .outerjoin(Trainer, Attendance.trainer_id == Trainer.id)\
+             .filter(Attendance.check_out.is_(None)).all()
+            self._sessions = {str(row.id): {
+                'attendance_id': str(row.id),
+                'member_id': str(row.member_id),
+                'member_name': _full_name(row.first_name, row.last_name),
+                'check_in': _parse_time(row.check_in),
+                'trainer_name': _full_name(row.trainer_first_name, row.trainer_last_name)
+                if row.trainer_id else None
+            } for row in rows}
+            self._loaded_at = time.monotonic()
+            count = len(self._sessions)
+            sessions = sorted(self._sessions.values(), key=lambda session: session['check_in'])
+        # Sessions may have changed without events (e.g. missed notifications),
+        # so listeners get all of them, as /attendance/current lists them
+        if self._listeners:
+            self._notify({'type': 'resync', 'current_members': current_members(sessions)}, count)
+
+    def ensure_loaded(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > OCCUPANCY_RESYNC_SECONDS:
+            self.load()
+
+    def invalidate(self):
+        """Force a reload on next use (e.g. after the listener lost events)"""
+        with self._lock:
+            self._loaded_at = None
+
+    def apply(self, event):
+        """Apply a check_in / check_out event; events already applied are ignored"""
+        with self._lock:
+            if event['type'] == 'check_in':
+                changed = event['attendance_id'] not in self._sessions
+                self._sessions[event['attendance_id']] = {
+                    'attendance_id': event['attendance_id'],
+                    'member_id': event['member_id'],
+                    'member_name': event.get('member_name'),
+                    'check_in': _parse_time(event['check_in']),
+                    'trainer_name': event.get('trainer_name')
+                }
+            elif event['type'] == 'check_out':
+                changed = self._sessions.pop(event['attendance_id'], None) is not None
+            else:
+                changed = False
+            count = len(self._sessions)
+        if changed:
+            self._notify(event, count)
+
+    def sessions(self):
+        """Open sessions, earliest check-in first"""
+        self.ensure_loaded()
+        with self._lock:
+            return sorted(self._sessions.values(), key=lambda session: session['check_in'])
+
+    def count(self):
+        self.ensure_loaded()
+        with self._lock:
+            return len(self._sessions)
+
+
+tracker = OccupancyTracker()
+
+
+def check_in_event(session):
+    """Event for a new session (an attendance_checkin.CheckIn)"""
+    return {
+        'type': 'check_in',
+        'attendance_id': str(session.id),
+        'member_id': str(session.member_id),
+        'member_name': session.member_name,
+        'check_in': session.check_in.isoformat(),
+        'trainer_name': session.trainer_name
+    }
+
+
+def check_out_event(attendance):
+    return {
+        'type': 'check_out',
+        'attendance_id': str(attendance.id),
+        'member_id': str(attendance.member_id),
+        'check_out': attendance.check_out.isoformat()
+    }
+
+
+def publish_event(event):
+    """Send an event to the other processes when the current transaction commits"""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute(db.select(func.pg_notify(ATTENDANCE_CHANNEL, json.dumps(event))))
+
+
+def publish_events(events):
+    """publish_event() for many events with one statement"""
+    if events and db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute(
+            text("SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload"),
+            {'channel': ATTENDANCE_CHANNEL, 'payloads': [json.dumps(event) for event in events]}
+        )
+
+
+def apply_event(event):
+    """Apply an event to this process's tracker (call after committing)"""
+    tracker.apply(event)
+
+
+def apply_events(events):
+    for event in events:
+        tracker.apply(event)
+
+
+class NotificationListener(threading.Thread):
+    """LISTEN for attendance events from other processes (PostgreSQL only)"""
+
+    def __init__(self, app):
+        super().__init__(name='attendance_listener', daemon=True)
+        self.app = app
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                self._listen()
+            except Exception as e:
+                print(f"Attendance listener error: {e}")
+                # Events may have been missed while disconnected
+                tracker.invalidate()
+                self._stopped.wait(LISTEN_POLL_SECONDS)
+
+    def _listen(self):
+        with self.app.app_context():
+            connection = db.engine.raw_connection()
+            try:
+                dbapi_connection = connection.dbapi_connection
+                dbapi_connection.autocommit = True
+                cursor = dbapi_connection.cursor()
+                cursor.execute(f"LISTEN {ATTENDANCE_CHANNEL}")
+                # Load after LISTEN so nothing committed in between is lost
+                tracker.load()
+                db.session.remove()
+                while not self._stopped.is_set():
+                    readable, _, _ = select.select([dbapi_connection], [], [], LISTEN_POLL_SECONDS)
+                    if not readable:
+                        continue
+                    dbapi_connection.poll()
+                    while dbapi_connection.notifies:
+                        notification = dbapi_connection.notifies.pop(0)
+                        tracker.apply(json.loads(notification.payload))
+            finally:
+                connection.invalidate()
+
+    def stop(self):
+        self._stopped.set()
+
+
+def start_listener(app):
+    """Start the notification listener for `app` (once per process)"""
+    if 'attendance_listener' not in app.extensions:
+        listener = NotificationListener(app)
+        app.extensions['attendance_listener'] = listener
+        listener.start()
+    return app.extensions['attendance_listener']
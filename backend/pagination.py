@@ -0,0 +1,121 @@
+"""
+Keyset (cursor) pagination helpers shared by the list endpoints.
+
+Offset pagination has to walk past every skipped row, so deep pages on
+large tables (attendance, payments) get slower the further you go. In
+cursor mode the client passes back an opaque `next_cursor` that encodes
+the sort key of the last row it saw, and the next page starts right after
+it using an index-friendly range predicate.
+"""
+
+import base64
+import json
+import uuid
+from datetime import datetime, date
+from decimal import Decimal
+from sqlalchemy import and_, or_
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor token cannot be decoded"""
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    if isinstance(value, uuid.UUID):
+        return {'u': str(value)}
+    if isinstance(value, Decimal):
+        return {'n': str(value)}
+    return value
+
+
+def _decode_value(value):
+    if not isinstance(value, dict):
+        return value
+    if 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    if 'd' in value:
+        return date.fromisoformat(value['d'])
+    if 'u' in value:
+        return uuid.UUID(value['u'])
+    if 'n' in value:
+        return Decimal(value['n'])
+    raise InvalidCursor('Unknown cursor value')
+
+
+def encode_cursor(values):
+    """Encode the sort key values of a row as an opaque URL-safe token"""
+    payload = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, size):
+    """Decode a token produced by encode_cursor into `size` sort key values"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        values = [_decode_value(v) for v in values]
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor('Invalid cursor')
+    if len(values) != size:
+        raise InvalidCursor('Invalid cursor')
+    return values
+
+
+def _after(sort_keys, values):
+    """Predicate selecting rows that sort strictly after `values`"""
+    clauses = []
+    for i, (expr, descending) in enumerate(sort_keys):
+        equal_prefix = [sort_keys[j][0] == values[j] for j in range(i)]
+        step = expr < values[i] if descending else expr > values[i]
+        clauses.append(and_(*equal_prefix, step))
+    return or_(*clauses)
+
+
+def keyset_paginate(query, sort_keys, cursor=None, limit=50):
+    """
+    Fetch one page of `query` ordered by `sort_keys`.
+
+    `sort_keys` is a list of (expression, descending) pairs and must end
+    with a unique column (the primary key) so the order is total.
+    Returns (items, next_cursor); next_cursor is None on the last page.
+    """
+    if cursor:
+        values = decode_cursor(cursor, len(sort_keys))
+        query = query.filter(_after(sort_keys, values))
+
+    query = query.order_by(*[expr.desc() if descending else expr.asc()
+                             for expr, descending in sort_keys])
+    key_columns = [expr.label(f'_cursor_{i}') for i, (expr, _) in enumerate(sort_keys)]
+    rows = query.add_columns(*key_columns).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][1:])
+    return [row[0] for row in rows], next_cursor
+
+
+def wants_total(args, cursor_mode):
+    """Whether the client asked for an exact total (default: offset mode only)"""
+    include_total = args.get('include_total')
+    if include_total is None:
+        return not cursor_mode
+    return include_total.lower() in ['true', '1', 'yes']
+
+
+def page_meta(limit, total=None, page=None, next_cursor=None, cursor_mode=False):
+    """Pagination fields of a list response for either mode"""
+    meta = {'limit': limit}
+    if cursor_mode:
+        meta['next_cursor'] = next_cursor
+    else:
+        meta['page'] = page
+    if total is not None:
+        meta['total'] = total
+        if not cursor_mode:
+            meta['pages'] = (total + limit - 1) // limit
+    return meta
@@ -3,9 +3,11 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import (
     db, Payment, Member, MemberMembership, MembershipPlan, User, Role
 )
+from pagination import InvalidCursor, keyset_paginate, page_meta, wants_total
+from payment_stats import payment_statistics, invalidate_payment_stats, PERIOD_DAYS
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import func, desc, extract
-from datetime import datetime, timezone, date, timedelta
+from sqlalchemy import desc
+from datetime import datetime, timezone, date
 import uuid
 
 payment_bp = Blueprint('payments', __name__, url_prefix='/api/payments')
@@ -45,6 +47,8 @@ def get_payments():
         payment_mode = request.args.get('payment_mode')
         page = int(request.args.get('page', 1))
         limit = int(request.args.get('limit', 50))
+        cursor = request.args.get('cursor')  # present (even empty) selects cursor mode
+        cursor_mode = cursor is not None
         
         # Build base query
         query = db.session.query(Payment)\
@@ -88,12 +92,18 @@ def get_payments():
             except ValueError:
                 return jsonify({'error': 'Invalid end_date format. Use YYYY-MM-DD'}), 400
         
-        # Get total count
-        total = query.count()
+        # Get total count (optional in cursor mode)
+        total = query.count() if wants_total(request.args, cursor_mode) else None
         
         # Apply pagination and ordering
-        payments = query.order_by(desc(Payment.date))\
-            .offset((page - 1) * limit).limit(limit).all()
+        next_cursor = None
+        if cursor_mode:
+            payments, next_cursor = keyset_paginate(
+                query, [(Payment.date, True), (Payment.id, True)], cursor, limit
+            )
+        else:
+            payments = query.order_by(desc(Payment.date))\
+                .offset((page - 1) * limit).limit(limit).all()
         
         # Format response
         payments_data = []
@@ -113,12 +123,11 @@ def get_payments():
         
         return jsonify({
             'payments': payments_data,
-            'total': total,
-            'page': page,
-            'limit': limit,
-            'pages': (total + limit - 1) // limit
+            **page_meta(limit, total, page, next_cursor, cursor_mode)
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -152,7 +161,7 @@ def create_payment():
         
         # Check if member exists
         member = Member.query.get(data['member_id'])
-        if not member:
+        if not member or member.deleted_at:
             return jsonify({'error': 'Member not found'}), 404
         
         # Validate amount
@@ -195,6 +204,7 @@ def create_payment():
         )
         
         db.session.add(payment)
+        invalidate_payment_stats()
         db.session.commit()
         
         return jsonify({
@@ -284,121 +294,15 @@ def get_payment_statistics():
         
         # Get query parameters
         period = request.args.get('period', 'month')  # week, month, year
-        
-        # Calculate date range
-        today = date.today()
-        if period == 'week':
-            start_date = today - timedelta(days=7)
-        elif period == 'month':
-            start_date = today - timedelta(days=30)
-        elif period == 'year':
-            start_date = today - timedelta(days=365)
-        else:
+        if period not in PERIOD_DAYS:
             return jsonify({'error': 'Invalid period. Use week, month, or year'}), 400
         
-        start_datetime = datetime.combine(start_date, datetime.min.time()).replace(tzinfo=timezone.utc)
-        
-        # Total revenue for period
-        period_revenue = db.session.query(func.sum(Payment.amount))\
-            .filter(Payment.date >= start_datetime).scalar() or 0
-        
-        # Total revenue all time
-        total_revenue = db.session.query(func.sum(Payment.amount)).scalar() or 0
-        
-        # Payment count for period
-        period_payments = Payment.query.filter(Payment.date >= start_datetime).count()
-        
-        # Payment modes distribution
-        payment_modes = db.session.query(
-            Payment.mode,
-            func.count(Payment.id).label('count'),
-            func.sum(Payment.amount).label('total')
-        ).filter(Payment.date >= start_datetime)\
-         .group_by(Payment.mode)\
-         .order_by(desc('total')).all()
-        
-        # Daily revenue for trend analysis
-        daily_revenue = db.session.query(
-            func.date(Payment.date).label('date'),
-            func.sum(Payment.amount).label('revenue'),
-            func.count(Payment.id).label('count')
-        ).filter(Payment.date >= start_datetime)\
-         .group_by(func.date(Payment.date))\
-         .order_by('date').all()
-        
-        # Monthly revenue (for yearly period)
-        monthly_revenue = []
-        if period == 'year':
-            monthly_revenue = db.session.query(
-                extract('year', Payment.date).label('year'),
-                extract('month', Payment.date).label('month'),
-                func.sum(Payment.amount).label('revenue')
-            ).filter(Payment.date >= start_datetime)\
-             .group_by(extract('year', Payment.date), extract('month', Payment.date))\
-             .order_by('year', 'month').all()
-        
-        # Top paying members
-        top_members = db.session.query(
-            Member.first_name,
-            Member.last_name,
-            func.sum(Payment.amount).label('total_paid'),
-            func.count(Payment.id).label('payment_count')
-        ).join(Payment)\
-         .filter(Payment.date >= start_datetime)\
-         .group_by(Member.id, Member.first_name, Member.last_name)\
-         .order_by(desc('total_paid'))\
-         .limit(10).all()
-        
-        # Average payment amount
-        avg_payment = db.session.query(func.avg(Payment.amount))\
-            .filter(Payment.date >= start_datetime).scalar() or 0
-        
-        return jsonify({
-            'period': period,
-            'date_range': {
-                'start_date': start_date.isoformat(),
-                'end_date': today.isoformat()
-            },
-            'revenue': {
-                'period_total': float(period_revenue),
-                'all_time_total': float(total_revenue),
-                'average_payment': float(avg_payment)
-            },
-            'payment_count': period_payments,
-            'payment_modes': [
-                {
-                    'mode': mode.mode,
-                    'count': mode.count,
-                    'total_amount': float(mode.total)
-                }
-                for mode in payment_modes
-            ],
-            'daily_revenue': [
-                {
-                    'date': day.date.isoformat(),
-                    'revenue': float(day.revenue),
-                    'payment_count': day.count
-                }
-                for day in daily_revenue
-            ],
-            'monthly_revenue': [
-                {
-                    'year': int(month.year),
-                    'month': int(month.month),
-                    'revenue': float(month.revenue)
-                }
-                for month in monthly_revenue
-            ],
-            'top_members': [
-                {
-                    'member_name': f"{member.first_name} {member.last_name}",
-                    'total_paid': float(member.total_paid),
-                    'payment_count': member.payment_count
-                }
-                for member in top_members
-            ]
-        }), 200
+        # Computed in one statement and cached per (period, day) until the next payment
+        return jsonify(payment_statistics(period, date.today())), 200
         
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return jsonify({'error': 'Database error occurred'}), 500
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -0,0 +1,145 @@
+"""
+Payment statistics for the admin dashboard.
+
+Every figure of /api/payments/stats comes from one statement: a CTE with
+the payments of the period feeds a UNION ALL of its groupings (totals, per
+mode, per day, top members) next to the all-time total. Monthly revenue is
+summed from the daily rows.
+
+Results are cached in `payment_stats_cache` per (period, day). A cached row
+is valid while its version equals the 'payments' counter in
+`cache_versions`, which every write to payments bumps in its own
+transaction (invalidate_payment_stats()). A result computed while a payment
+commits is stored under the old version, so it is never served. Rows of
+earlier days are never read again; they are deleted whenever a new result
+is stored, so the table holds at most the rows of one day per period.
+"""
+
+from collections import defaultdict
+from datetime import datetime, timezone, timedelta
+from models import db, Payment, Member, CacheVersion, PaymentStatsCache
+from attendance_stats import as_date
+from db_utils import dialect_insert
+from sqlalchemy import select, delete, union_all, literal, null, cast, func, desc, String
+
+PERIOD_DAYS = {'week': 7, 'month': 30, 'year': 365}
+
+PAYMENTS_VERSION = 'payments'
+
+TOP_MEMBERS_LIMIT = 10
+
+
+def invalidate_payment_stats():
+    """Make cached statistics stale; call in the transaction that writes payments"""
+    statement = dialect_insert(CacheVersion).values(name=PAYMENTS_VERSION, version=1)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['name'],
+        set_={'version': CacheVersion.version + 1}
+    ))
+
+
+def _current_version():
+    return db.session.execute(
+        select(CacheVersion.version).where(CacheVersion.name == PAYMENTS_VERSION)
+    ).scalar() or 0
+
+
+def compute_payment_statistics(period, today):
+    """All payment statistics of the `period` days before `today`, in one statement"""
+    start_date = today - timedelta(days=PERIOD_DAYS[period])
+    start_datetime = datetime.combine(start_date, datetime.min.time()).replace(tzinfo=timezone.utc)
+
+    window = select(
+        Payment.id, Payment.member_id, Payment.amount, Payment.mode, func.date(Payment.date).label('day')
+    ).where(Payment.date >= start_datetime).cte('period_payments')
+    no_key = cast(null(), String)
+
+    def branch(kind, key=no_key, first_name=no_key, last_name=no_key, source=window):
+        return select(
+            literal(kind).label('kind'), key.label('key'),
+            first_name.label('first_name'), last_name.label('last_name'),
+            func.count(source.c.id).label('count'), func.sum(source.c.amount).label('total')
+        )
+
+    top = select(
+        Member.first_name, Member.last_name,
+        func.count(window.c.id).label('count'), func.sum(window.c.amount).label('total')
+    ).join(Member, Member.id == window.c.member_id)\
+        .group_by(Member.id, Member.first_name, Member.last_name)\
+        .order_by(desc('total')).limit(TOP_MEMBERS_LIMIT).subquery()
+
+    statement = union_all(
+        branch('period'),
+        branch('mode', cast(window.c.mode, String)).group_by(window.c.mode),
+        branch('day', cast(window.c.day, String)).group_by(window.c.day),
+        select(literal('top_member'), no_key, top.c.first_name, top.c.last_name, top.c.count, top.c.total),
+        branch('all_time', source=Payment.__table__)
+    )
+
+    period_total = period_count = all_time_total = 0
+    modes, days, top_members = [], [], []
+    for row in db.session.execute(statement):
+        if row.kind == 'period':
+            period_total, period_count = row.total or 0, row.count
+        elif row.kind == 'all_time':
+            all_time_total = row.total or 0
+        elif row.kind == 'mode':
+            modes.append({'mode': row.key, 'count': row.count, 'total_amount': float(row.total)})
+        elif row.kind == 'day':
+            days.append({'date': as_date(row.key).isoformat(), 'revenue': float(row.total), 'payment_count': row.count})
+        else:
+            top_members.append({
+                'member_name': f"{row.first_name} {row.last_name}",
+                'total_paid': float(row.total),
+                'payment_count': row.count
+            })
+    modes.sort(key=lambda mode: mode['total_amount'], reverse=True)
+    days.sort(key=lambda day: day['date'])
+    top_members.sort(key=lambda member: member['total_paid'], reverse=True)
+
+    monthly = []
+    if period == 'year':
+        by_month = defaultdict(float)
+        for day in days:
+            by_month[(int(day['date'][:4]), int(day['date'][5:7]))] += day['revenue']
+        monthly = [{'year': year, 'month': month, 'revenue': revenue}
+                   for (year, month), revenue in sorted(by_month.items())]
+
+    return {
+        'period': period,
+        'date_range': {
+            'start_date': start_date.isoformat(),
+            'end_date': today.isoformat()
+        },
+        'revenue': {
+            'period_total': float(period_total),
+            'all_time_total': float(all_time_total),
+            'average_payment': float(period_total) / period_count if period_count else 0.0
+        },
+        'payment_count': period_count,
+        'payment_modes': modes,
+        'daily_revenue': days,
+        'monthly_revenue': monthly,
+        'top_members': top_members
+    }
+
+
+def payment_statistics(period, today):
+    """Payment statistics from the cache, computed and stored when missing or stale"""
+    version = _current_version()
+    cached = db.session.get(PaymentStatsCache, (period, today))
+    if cached is not None and cached.version == version:
+        return cached.payload
+
+    payload = compute_payment_statistics(period, today)
+    statement = dialect_insert(PaymentStatsCache).values(
+        period=period, day=today, version=version, payload=payload, computed_at=datetime.now(timezone.utc)
+    )
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['period', 'day'],
+        set_={column: statement.excluded[column] for column in ['version', 'payload', 'computed_at']}
+    ))
+    # Results of earlier days are never served again
+    db.session.execute(delete(PaymentStatsCache).where(PaymentStatsCache.day < today))
+    db.session.commit()
+    return payload
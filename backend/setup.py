@@ -24,7 +24,7 @@ from datetime import datetime, timezone
 from dotenv import load_dotenv
 from sqlalchemy import (
     create_engine, Column, String, Integer, Date, DateTime, Boolean, Text,
-    ForeignKey, Table, Numeric, TIMESTAMP
+    ForeignKey, Table, Numeric, TIMESTAMP, Index, func, BigInteger, SmallInteger, Float, JSON, false
 )
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
@@ -148,6 +148,7 @@ class Member(Base):
     current_plan_id = Column(UUID(as_uuid=True), ForeignKey("member_memberships.id"), nullable=True)
     emergency_contact = Column(String(50), nullable=False)
     is_active = Column(Boolean, default=True)
+    deleted_at = Column(TIMESTAMP(timezone=True), nullable=True)
     created_at = Column(TIMESTAMP(timezone=True), default=utc_now)
     updated_at = Column(TIMESTAMP(timezone=True), default=utc_now, onupdate=utc_now)
 
@@ -182,6 +183,8 @@ class MemberMembership(Base):
     discount = Column(Numeric(7, 2), default=0)
     created_at = Column(TIMESTAMP(timezone=True), default=utc_now)
 
+    __table_args__ = (Index('ix_member_memberships_start_date_id', 'start_date', 'id'),)
+
     member = relationship("Member", back_populates="memberships",foreign_keys=[member_id])
     plan = relationship("MembershipPlan")
 
@@ -226,6 +229,10 @@ class Equipment(Base):
     created_at = Column(TIMESTAMP(timezone=True), default=utc_now)
 
 
+Index('ix_equipment_category_name_id',
+      func.coalesce(Equipment.category, ''), Equipment.name, Equipment.id)
+
+
 class Attendance(Base):
     __tablename__ = "attendance"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -234,6 +241,16 @@ class Attendance(Base):
     check_in = Column(TIMESTAMP(timezone=True), nullable=False)
     check_out = Column(TIMESTAMP(timezone=True), nullable=True)
     created_at = Column(TIMESTAMP(timezone=True), default=utc_now)
+    idempotency_key = Column(String(100), nullable=True)
+    auto_closed = Column(Boolean, nullable=False, default=False, server_default=false())
+
+    __table_args__ = (
+        Index('ix_attendance_check_in_id', 'check_in', 'id'),
+        Index('uq_attendance_open_member', 'member_id', unique=True,
+              postgresql_where=check_out.is_(None), sqlite_where=check_out.is_(None)),
+        Index('uq_attendance_idempotency_key', 'idempotency_key', unique=True),
+        Index('ix_attendance_trainer_check_in', 'trainer_id', 'check_in'),
+    )
 
 
 class Payment(Base):
@@ -245,6 +262,8 @@ class Payment(Base):
     date = Column(TIMESTAMP(timezone=True), default=utc_now)
     mode = Column(String(80))
 
+    __table_args__ = (Index('ix_payments_date_id', 'date', 'id'),)
+
 
 class PhysicalMetric(Base):
     __tablename__ = "physical_metrics"
@@ -256,6 +275,202 @@ class PhysicalMetric(Base):
     bmi = Column(Numeric(6, 2))
     created_at = Column(TIMESTAMP(timezone=True), default=utc_now)
 
+    # Latest-metric lookups and time-series reads; unique, so batch ingestion
+    # skips repeated readings with ON CONFLICT DO NOTHING
+    __table_args__ = (Index('ix_physical_metrics_member_measured_at', 'member_id', 'measured_at', unique=True),)
+
+
+class MemberSummary(Base):
+    __tablename__ = "member_summary"
+    member_id = Column(UUID(as_uuid=True), ForeignKey("members.id", ondelete="CASCADE"), primary_key=True)
+    metric_measured_at = Column(TIMESTAMP(timezone=True))
+    height_cm = Column(Numeric(6, 2))
+    weight_kg = Column(Numeric(6, 2))
+    bmi = Column(Numeric(6, 2))
+    last_check_in = Column(TIMESTAMP(timezone=True))
+    last_check_out = Column(TIMESTAMP(timezone=True))
+    visit_anchor = Column(Date)
+    visit_bitmap = Column(BigInteger, default=0, nullable=False)
+    current_streak = Column(Integer, default=0, nullable=False)
+    longest_streak = Column(Integer, default=0, nullable=False)
+    visit_month = Column(Date)
+    month_visits = Column(Integer, default=0, nullable=False)
+    active_plan_id = Column(UUID(as_uuid=True))
+    active_plan_name = Column(String(120))
+    active_end_date = Column(Date)
+    latest_plan_id = Column(UUID(as_uuid=True))
+    latest_plan_name = Column(String(120))
+    latest_start_date = Column(Date)
+    latest_end_date = Column(Date)
+    latest_status = Column(String(50))
+    updated_at = Column(TIMESTAMP(timezone=True), default=utc_now, onupdate=utc_now)
+
+
+class MemberPurgeJob(Base):
+    __tablename__ = "member_purge_jobs"
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    member_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    requested_by = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    status = Column(String(20), nullable=False, default="pending")
+    current_step = Column(String(50))
+    rows_deleted = Column(Integer, nullable=False, default=0)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    created_at = Column(TIMESTAMP(timezone=True), default=utc_now)
+    started_at = Column(TIMESTAMP(timezone=True))
+    finished_at = Column(TIMESTAMP(timezone=True))
+    updated_at = Column(TIMESTAMP(timezone=True), default=utc_now, onupdate=utc_now)
+
+    __table_args__ = (Index('ix_member_purge_jobs_status_created_at', 'status', 'created_at'),)
+
+
+class AttendanceQueueCheckpoint(Base):
+    __tablename__ = "attendance_queue_checkpoints"
+    queue_id = Column(String(36), primary_key=True)
+    last_sequence = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(TIMESTAMP(timezone=True), default=utc_now, onupdate=utc_now)
+
+
+class AttendanceDaily(Base):
+    __tablename__ = "attendance_daily"
+    day = Column(Date, primary_key=True)
+    member_id = Column(UUID(as_uuid=True), ForeignKey("members.id", ondelete="CASCADE"), primary_key=True)
+    visits = Column(Integer, nullable=False, default=0)
+    completed_sessions = Column(Integer, nullable=False, default=0)
+    workout_minutes = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (Index('ix_attendance_daily_member_day', 'member_id', 'day'),)
+
+
+class AttendanceHourly(Base):
+    __tablename__ = "attendance_hourly"
+    day = Column(Date, primary_key=True)
+    hour = Column(SmallInteger, primary_key=True)
+    visits = Column(Integer, nullable=False, default=0)
+
+
+class TrainerClient(Base):
+    __tablename__ = "trainer_clients"
+    trainer_id = Column(UUID(as_uuid=True), ForeignKey("trainers.id", ondelete="CASCADE"), primary_key=True)
+    member_id = Column(UUID(as_uuid=True), ForeignKey("members.id", ondelete="CASCADE"), primary_key=True)
+    first_session_at = Column(TIMESTAMP(timezone=True), nullable=False)
+
+    __table_args__ = (Index('ix_trainer_clients_member_id', 'member_id'),)
+
+
+
+class AttendanceForecast(Base):
+    __tablename__ = "attendance_forecasts"
+    name = Column(String(50), primary_key=True)
+    fitted_at = Column(TIMESTAMP(timezone=True), nullable=False)
+    gym_timezone = Column(String(64), nullable=False)
+    history_weeks = Column(Integer, nullable=False)
+    seasonal = Column(JSON, nullable=False)
+    trend_per_week = Column(Float, nullable=False, default=0)
+    trend_origin = Column(TIMESTAMP(timezone=True), nullable=False)
+    session_minutes = Column(Float, nullable=False)
+
+
+class CacheVersion(Base):
+    __tablename__ = "cache_versions"
+    name = Column(String(50), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
+
+class PaymentStatsCache(Base):
+    __tablename__ = "payment_stats_cache"
+    period = Column(String(10), primary_key=True)
+    day = Column(Date, primary_key=True)
+    version = Column(BigInteger, nullable=False)
+    payload = Column(JSON, nullable=False)
+    computed_at = Column(TIMESTAMP(timezone=True), default=utc_now)
+
+def partitioned_tables(engine):
+    """Names of natively partitioned tables (see attendance_partitions.py)"""
+    if engine.dialect.name != 'postgresql':
+        return set()
+    with engine.connect() as conn:
+        return set(conn.execute(text(
+            "SELECT c.relname FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid"
+        )).scalars())
+
+
+def ensure_indexes(engine):
+    """Create indexes added after the tables were first created"""
+    partitioned = partitioned_tables(engine)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            # Unique indexes of a partitioned table must contain the partition key;
+            # attendance_partitions.py enforces them with guard tables instead
+            if index.unique and table.name in partitioned:
+                continue
+            index.create(bind=engine, checkfirst=True)
+
+
+# PostgreSQL-specific DDL that cannot be expressed as portable metadata.
+# Every statement is idempotent so the script can be re-run on a live database.
+POSTGRES_DDL = [
+    # Columns added after the tables were first created
+    "ALTER TABLE members ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMPTZ",
+    "ALTER TABLE attendance ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(100)",
+    "ALTER TABLE attendance ADD COLUMN IF NOT EXISTS auto_closed BOOLEAN NOT NULL DEFAULT false",
+    "ALTER TABLE member_summary ADD COLUMN IF NOT EXISTS current_streak INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE member_summary ADD COLUMN IF NOT EXISTS longest_streak INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE member_summary ADD COLUMN IF NOT EXISTS visit_month DATE",
+    "ALTER TABLE member_summary ADD COLUMN IF NOT EXISTS month_visits INTEGER NOT NULL DEFAULT 0",
+    # uq_attendance_open_member allows one open session per member: close all
+    # but the latest open session of each member before it is created, marked
+    # auto_closed (added above) so they stay out of duration aggregates
+    "UPDATE attendance a SET check_out = a.check_in, auto_closed = true "
+    "WHERE a.check_out IS NULL AND EXISTS (SELECT 1 FROM attendance b "
+    "WHERE b.member_id = a.member_id AND b.check_out IS NULL AND (b.check_in, b.id) > (a.check_in, a.id))",
+    # ix_physical_metrics_member_measured_at became unique: drop repeated
+    # readings and the old non-unique index, which ensure_indexes() recreates
+    "DELETE FROM physical_metrics a USING physical_metrics b "
+    "WHERE a.member_id = b.member_id AND a.measured_at = b.measured_at AND a.id > b.id",
+    "DO $$ BEGIN IF EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'ix_physical_metrics_member_measured_at' "
+    "AND indexdef NOT LIKE 'CREATE UNIQUE INDEX%') THEN DROP INDEX ix_physical_metrics_member_measured_at; END IF; END $$",
+    # Trigram indexes behind member search (ILIKE '%term%' and word_similarity)
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_members_full_name_trgm ON members "
+    "USING gin ((coalesce(first_name, '') || ' ' || coalesce(last_name, '')) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_users_email_trgm ON users USING gin (email gin_trgm_ops)",
+    # Case-insensitive email lookups of the bulk import
+    "CREATE INDEX IF NOT EXISTS ix_users_email_lower ON users (lower(email))",
+]
+
+
+# Rebuild the attendance rollups from the raw rows, in UTC like record_sessions()
+# in attendance_rollups.py. Days before the earliest raw check-in (archived
+# partitions) keep their rollups; re-running rebuilds the same rows.
+ROLLUP_BACKFILL = [
+    "DELETE FROM attendance_daily WHERE day >= (SELECT min(timezone('UTC', check_in))::date FROM attendance)",
+    "INSERT INTO attendance_daily (day, member_id, visits, completed_sessions, workout_minutes) "
+    "SELECT timezone('UTC', check_in)::date, member_id, count(*), "
+    "count(*) FILTER (WHERE check_out IS NOT NULL AND NOT auto_closed), "
+    "coalesce(sum(floor(extract(epoch FROM check_out - check_in) / 60)) "
+    "FILTER (WHERE check_out IS NOT NULL AND NOT auto_closed), 0)::int "
+    "FROM attendance WHERE member_id IS NOT NULL GROUP BY 1, 2",
+    "DELETE FROM attendance_hourly WHERE day >= (SELECT min(timezone('UTC', check_in))::date FROM attendance)",
+    "INSERT INTO attendance_hourly (day, hour, visits) "
+    "SELECT timezone('UTC', check_in)::date, extract(hour FROM timezone('UTC', check_in))::int, count(*) "
+    "FROM attendance GROUP BY 1, 2",
+]
+
+
+def backfill_rollups(engine):
+    """Run ROLLUP_BACKFILL in one transaction"""
+    with engine.begin() as conn:
+        for statement in ROLLUP_BACKFILL:
+            conn.execute(text(statement))
+
+
+def apply_postgres_ddl(engine):
+    """Run POSTGRES_DDL in order"""
+    with engine.begin() as conn:
+        for statement in POSTGRES_DDL:
+            conn.execute(text(statement))
+
 
 def main():
     # Get database URL from environment variable
@@ -273,8 +488,15 @@ def main():
     
     print("Creating database tables...")
     Base.metadata.create_all(engine)
+    apply_postgres_ddl(engine)
+    ensure_indexes(engine)
+    print("Building attendance rollups...")
+    backfill_rollups(engine)
 
     print("Database setup complete! Tables have been created in the 'fithub' database.")
+    print("If the database already has members, run `python member_summary.py` to build their summaries")
+    print("(again after upgrading, to fill in visit streaks).")
+    print("If the database already has attendance, run `python trainer_analytics.py` to count the trainers' clients.")
 
     # Seed roles
     Session = sessionmaker(bind=engine)
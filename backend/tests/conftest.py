@@ -0,0 +1,61 @@
+"""
+Shared fixtures for the tests that run against a throwaway SQLite database;
+no server needed. All test modules share one database, so the factories
+give every member a unique email unless the test picks one.
+"""
+
+import os
+import sys
+import tempfile
+import uuid
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db'))
+os.environ.setdefault('BACKGROUND_WORKERS', 'false')
+
+from app import create_app
+from models import db, Role, User, Member, MembershipPlan
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def make_member(app):
+    """Factory for members with a MEMBER login; rows are flushed, not committed"""
+    def make(email=None, first_name='Test', last_name='Member', **fields):
+        role = Role.query.filter_by(name='MEMBER').first()
+        if role is None:
+            role = Role(name='MEMBER')
+            db.session.add(role)
+            db.session.flush()
+        user = User(email=email or f'member-{uuid.uuid4().hex}@example.com', role_id=role.id, password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        fields.setdefault('dob', date(1990, 1, 1))
+        member = Member(user_id=user.id, first_name=first_name, last_name=last_name, **fields)
+        db.session.add(member)
+        db.session.flush()
+        return member
+    return make
+
+
+@pytest.fixture
+def make_plan(app):
+    """Factory for membership plans; rows are flushed, not committed"""
+    def make(name=None, duration_days=30, price=10):
+        plan = MembershipPlan(name=name or f'Plan {uuid.uuid4().hex[:8]}', duration_days=duration_days, price=price)
+        db.session.add(plan)
+        db.session.flush()
+        return plan
+    return make
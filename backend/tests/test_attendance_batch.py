@@ -0,0 +1,115 @@
+"""
+Tests for batch check-in/check-out: resent events, lost races and
+conflicting events. Runs against a throwaway SQLite database; no server needed.
+"""
+
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from models import db, Attendance
+import attendance_batch
+from attendance_batch import process_batch
+
+
+@pytest.fixture
+def member_id(make_member):
+    member = make_member(first_name='Bat', last_name='Ch')
+    db.session.commit()
+    return member.id
+
+
+def _event(event_type, member_id, minutes_ago, event_id=None):
+    event = {
+        'type': event_type,
+        'member_id': str(member_id),
+        'timestamp': (datetime.now(timezone.utc) - timedelta(minutes=minutes_ago)).isoformat()
+    }
+    if event_id:
+        event['event_id'] = event_id
+    return event
+
+
+def _run(items):
+    results, _ = process_batch(items)
+    db.session.commit()
+    return results
+
+
+def test_resent_batch_reports_duplicates(app, member_id):
+    items = [_event('check_in', member_id, 30, event_id='resend-in-1')]
+    first = _run(items)
+    second = _run(items)
+
+    assert first[0]['status'] == 'ok'
+    assert second[0] == {'index': 0, 'status': 'duplicate', 'attendance_id': first[0]['attendance_id']}
+    assert Attendance.query.filter(Attendance.member_id == member_id).count() == 1
+
+
+def test_event_id_of_another_member_is_rejected(app, member_id, make_member):
+    _run([_event('check_in', member_id, 30, event_id='shared-id-1')])
+    other_id = make_member().id
+    db.session.commit()
+
+    results = _run([_event('check_in', other_id, 10, event_id='shared-id-1')])
+    assert results[0]['error'] == 'event_id was already used for another member'
+
+
+def test_lost_race_with_same_event_id_is_a_duplicate(app, member_id, monkeypatch):
+    stored = _run([_event('check_in', member_id, 30, event_id='race-id-1')])
+
+    # Replay the state as read before the concurrent request committed
+    load_state = attendance_batch._load_state
+
+    def stale_state(events):
+        members, trainers, _, _, _ = load_state(events)
+        return members, trainers, {}, {}, {}
+    monkeypatch.setattr(attendance_batch, '_load_state', stale_state)
+
+    results = _run([
+        _event('check_in', member_id, 30, event_id='race-id-1'),
+        _event('check_out', member_id, 5)
+    ])
+    assert results[0] == {'index': 0, 'status': 'duplicate', 'attendance_id': stored[0]['attendance_id']}
+    assert results[1]['status'] == 'error'
+    assert Attendance.query.filter(Attendance.member_id == member_id).count() == 1
+
+
+def test_lost_race_without_event_id_asks_for_retry(app, member_id, monkeypatch):
+    _run([_event('check_in', member_id, 30)])
+
+    load_state = attendance_batch._load_state
+
+    def stale_state(events):
+        members, trainers, _, _, _ = load_state(events)
+        return members, trainers, {}, {}, {}
+    monkeypatch.setattr(attendance_batch, '_load_state', stale_state)
+
+    results = _run([_event('check_in', member_id, 20)])
+    assert results[0]['error'] == 'Conflicted with a concurrent check-in, please retry'
+
+
+def test_conflicting_events_in_one_batch(app, member_id):
+    results = _run([
+        _event('check_out', member_id, 60),
+        _event('check_in', member_id, 50),
+        _event('check_in', member_id, 45),
+        _event('check_out', member_id, 55),
+        _event('check_out', member_id, 20),
+        _event('check_in', member_id, 30),
+    ])
+
+    assert [result['status'] for result in results] == ['error', 'ok', 'error', 'error', 'ok', 'error']
+    assert results[0]['error'] == 'No active check-in found for this member'
+    assert results[2]['error'] == 'Member is already checked in'
+    assert results[3]['error'] == 'Check-out is earlier than the check-in'
+    assert results[4]['duration_minutes'] == 30
+    assert results[5]['error'] == 'Check-in is earlier than the last check-out'
+
+
+def test_check_in_before_last_check_out_of_earlier_batch(app, member_id):
+    _run([_event('check_in', member_id, 60), _event('check_out', member_id, 10)])
+
+    results = _run([_event('check_in', member_id, 20), _event('check_in', member_id, 5)])
+    assert results[0]['error'] == 'Check-in is earlier than the last check-out'
+    assert results[1]['status'] == 'ok'
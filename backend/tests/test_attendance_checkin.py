@@ -0,0 +1,80 @@
+"""
+Tests for the single-statement check-in: idempotent retries and double
+check-ins. Runs against a throwaway SQLite database; no server needed.
+"""
+
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from models import db, Attendance
+from attendance_checkin import insert_check_in, find_by_idempotency_key, rejection_reason
+
+
+@pytest.fixture
+def member_id(make_member):
+    member = make_member(first_name='Che', last_name='Kin')
+    db.session.commit()
+    return member.id
+
+
+def _open_sessions(member_id):
+    return Attendance.query.filter(Attendance.member_id == member_id, Attendance.check_out.is_(None)).count()
+
+
+def test_check_in_returns_names(app, member_id):
+    checked_in = insert_check_in(member_id)
+    db.session.commit()
+
+    assert checked_in is not None
+    assert checked_in.member_id == member_id
+    assert checked_in.member_name == 'Che Kin'
+    assert checked_in.trainer_name is None
+    assert _open_sessions(member_id) == 1
+
+
+def test_retry_with_same_idempotency_key_inserts_once(app, member_id):
+    first = insert_check_in(member_id, idempotency_key='retry-key-1')
+    db.session.commit()
+    # The client timed out and sends the same request again
+    retry = insert_check_in(member_id, idempotency_key='retry-key-1')
+    db.session.rollback()
+
+    assert first is not None
+    assert retry is None
+    existing = find_by_idempotency_key('retry-key-1')
+    assert existing.id == first.id
+    assert Attendance.query.filter(Attendance.member_id == member_id).count() == 1
+
+
+def test_double_check_in_is_rejected(app, member_id):
+    first = insert_check_in(member_id)
+    db.session.commit()
+    second = insert_check_in(member_id, check_in=datetime.now(timezone.utc) + timedelta(seconds=1))
+    db.session.rollback()
+
+    assert first is not None
+    assert second is None
+    error, status, open_session = rejection_reason(member_id)
+    assert (error, status) == ('Member is already checked in', 400)
+    assert open_session.id == first.id
+    assert _open_sessions(member_id) == 1
+
+
+def test_check_in_after_check_out_opens_new_session(app, member_id):
+    first = insert_check_in(member_id, check_in=datetime.now(timezone.utc) - timedelta(hours=1))
+    db.session.get(Attendance, first.id).check_out = datetime.now(timezone.utc) - timedelta(minutes=5)
+    db.session.commit()
+
+    second = insert_check_in(member_id)
+    db.session.commit()
+
+    assert second is not None and second.id != first.id
+    assert _open_sessions(member_id) == 1
+
+
+def test_unknown_member_is_rejected(app):
+    missing = '00000000-0000-0000-0000-000000000000'
+    assert insert_check_in(missing) is None
+    db.session.rollback()
+    assert rejection_reason(missing)[:2] == ('Member not found', 404)
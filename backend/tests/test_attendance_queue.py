@@ -0,0 +1,115 @@
+"""
+Tests for the write-behind attendance queue: flushing, rejected events and
+replay after a crash between the database commit and the local delete.
+Runs against a throwaway SQLite database; no server needed.
+"""
+
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from models import db, Attendance, AttendanceQueueCheckpoint
+from attendance_queue import AttendanceQueue, flush
+
+
+@pytest.fixture
+def member_id(make_member):
+    member = make_member(first_name='Q', last_name='Ueue')
+    db.session.commit()
+    return member.id
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = AttendanceQueue(str(tmp_path / 'attendance-queue.db'))
+    yield queue
+    queue.close()
+
+
+def _event(event_type, member_id, minutes_ago):
+    return {
+        'type': event_type,
+        'member_id': str(member_id),
+        'timestamp': (datetime.now(timezone.utc) - timedelta(minutes=minutes_ago)).isoformat()
+    }
+
+
+def _sessions(member_id):
+    return Attendance.query.filter(Attendance.member_id == member_id).order_by(Attendance.check_in).all()
+
+
+def _checkpoint(queue):
+    db.session.expire_all()
+    return db.session.get(AttendanceQueueCheckpoint, queue.queue_id).last_sequence
+
+
+def test_flush_applies_events_in_order(app, member_id, queue):
+    sequences = [queue.append(_event('check_in', member_id, 60)),
+                 queue.append(_event('check_out', member_id, 30)),
+                 queue.append(_event('check_in', member_id, 10))]
+
+    assert flush(queue, 2) == 2
+    assert flush(queue, 2) == 1
+    assert flush(queue, 2) == 0
+
+    sessions = _sessions(member_id)
+    assert len(sessions) == 2
+    assert sessions[0].check_out is not None and sessions[1].check_out is None
+    assert queue.pending() == 0
+    assert _checkpoint(queue) == sequences[-1]
+
+
+def test_rejected_events_are_kept_aside(app, member_id, queue):
+    queue.append(_event('check_out', member_id, 30))
+    sequence = queue.append(_event('check_in', member_id, 10))
+
+    assert flush(queue, 10) == 2
+
+    assert len(_sessions(member_id)) == 1
+    assert queue.pending() == 0
+    rejected = queue._connection.execute("SELECT sequence, error FROM rejected").fetchall()
+    assert rejected == [(sequence - 1, 'No active check-in found for this member')]
+
+
+def test_replay_after_crash_applies_events_once(app, member_id, queue, monkeypatch):
+    queue.append(_event('check_in', member_id, 60))
+    last = queue.append(_event('check_out', member_id, 30))
+
+    # The process dies after the database commit, before the local delete
+    def crash(*args, **kwargs):
+        raise RuntimeError('crashed')
+    with monkeypatch.context() as patch:
+        patch.setattr(queue, 'ack', crash)
+        with pytest.raises(RuntimeError):
+            flush(queue, 10)
+    assert queue.pending() == 2
+    assert _checkpoint(queue) == last
+
+    # After a restart the queue file is reopened and flushed again
+    reopened = AttendanceQueue(queue.path)
+    try:
+        assert reopened.queue_id == queue.queue_id
+        assert flush(reopened, 10) == 2
+        assert reopened.pending() == 0
+    finally:
+        reopened.close()
+
+    sessions = _sessions(member_id)
+    assert len(sessions) == 1
+    assert sessions[0].check_out is not None
+
+
+def test_events_after_checkpoint_are_applied_on_replay(app, member_id, queue, monkeypatch):
+    queue.append(_event('check_in', member_id, 60))
+    with monkeypatch.context() as patch:
+        patch.setattr(queue, 'ack', lambda *args, **kwargs: None)
+        flush(queue, 10)
+    # A new event arrives while the applied one is still in the file
+    queue.append(_event('check_out', member_id, 5))
+
+    assert flush(queue, 10) == 2
+
+    sessions = _sessions(member_id)
+    assert len(sessions) == 1
+    assert sessions[0].check_out is not None
+    assert queue.pending() == 0
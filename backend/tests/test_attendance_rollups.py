@@ -0,0 +1,85 @@
+"""
+Tests for the attendance rollups: incremental upserts, and the removals of
+the member purge, against a rebuild from raw rows. Runs against a throwaway SQLite database; no server needed.
+"""
+
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from models import db, Attendance, AttendanceDaily, AttendanceHourly, MemberPurgeJob
+from attendance_rollups import record_sessions, rebuild_rollups
+from member_purge import process_pending
+
+
+@pytest.fixture
+def member_ids(make_member):
+    member_ids = [make_member(first_name='Roll', last_name=f'Up{i}').id for i in range(2)]
+    db.session.commit()
+    return member_ids
+
+
+def _rollup_rows(start, end):
+    daily = db.session.query(
+        AttendanceDaily.day, AttendanceDaily.member_id, AttendanceDaily.visits,
+        AttendanceDaily.completed_sessions, AttendanceDaily.workout_minutes
+    ).filter(AttendanceDaily.day >= start, AttendanceDaily.day < end)
+    hourly = db.session.query(
+        AttendanceHourly.day, AttendanceHourly.hour, AttendanceHourly.visits
+    ).filter(AttendanceHourly.day >= start, AttendanceHourly.day < end)
+    return sorted(map(tuple, daily), key=str), sorted(map(tuple, hourly))
+
+
+def _sessions(member_ids, start):
+    # Sessions around UTC midnight, where bucketing in another zone would differ
+    return [
+        (member_ids[0], start + timedelta(hours=23, minutes=30), start + timedelta(days=1, minutes=40), False),
+        (member_ids[0], start + timedelta(days=1, minutes=5), None, False),
+        (member_ids[1], start + timedelta(hours=23, minutes=55), start + timedelta(days=1, hours=1), False),
+        (member_ids[1], start + timedelta(days=2, hours=6), start + timedelta(days=2, hours=6), True),
+        (member_ids[1], start + timedelta(days=3), start + timedelta(days=3, minutes=59), False),
+    ]
+
+
+def _record(sessions):
+    for member_id, check_in, check_out, auto_closed in sessions:
+        db.session.add(Attendance(member_id=member_id, check_in=check_in, check_out=check_out,
+                                  auto_closed=auto_closed))
+        record_sessions(check_ins=[(member_id, check_in)])
+        db.session.commit()
+    for member_id, check_in, check_out, auto_closed in sessions:
+        if check_out is not None and not auto_closed:
+            record_sessions(check_outs=[(member_id, check_in, check_out)])
+            db.session.commit()
+
+
+def test_rebuild_matches_incremental_rollups(app, member_ids):
+    start = datetime(2024, 3, 1, tzinfo=timezone.utc)
+    end = start + timedelta(days=7)
+    _record(_sessions(member_ids, start))
+
+    incremental = _rollup_rows(start.date(), end.date())
+    assert len(incremental[0]) == 5
+    assert (start.date(), 23, 2) in incremental[1]
+
+    rebuild_rollups(start, end)
+    db.session.commit()
+
+    assert _rollup_rows(start.date(), end.date()) == incremental
+
+
+def test_purge_takes_sessions_out_of_rollups(app, member_ids):
+    start = datetime(2024, 4, 1, tzinfo=timezone.utc)
+    end = start + timedelta(days=7)
+    _record(_sessions(member_ids, start))
+
+    db.session.add(MemberPurgeJob(member_id=member_ids[0]))
+    db.session.commit()
+    process_pending()
+
+    daily, hourly = _rollup_rows(start.date(), end.date())
+    assert {row[1] for row in daily} == {member_ids[1]}
+    rebuild_rollups(start, end)
+    db.session.commit()
+    # Hours emptied by the purge keep a zero row
+    assert _rollup_rows(start.date(), end.date()) == (daily, [row for row in hourly if row[2]])
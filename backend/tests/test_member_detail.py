@@ -0,0 +1,97 @@
+"""
+Query-count test for the member detail loader.
+Runs against a throwaway SQLite database; no server needed.
+"""
+
+from datetime import datetime, timezone, timedelta, date
+import uuid
+
+import pytest
+from sqlalchemy import event
+
+from models import db, Member, MemberPhone, Address, PhysicalMetric, MemberMembership
+from member_listing import load_member_detail, DETAIL_METRICS_LIMIT
+from member_summary import rebuild_summaries
+
+
+class QueryCounter:
+    """Collect the SQL statements executed on an engine"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+@pytest.fixture
+def member_id(make_member, make_plan):
+    member = make_member(email='detail@example.com', first_name='Dee', last_name='Tail')
+
+    db.session.add_all([MemberPhone(member_id=member.id, phone=f'555000000{i}') for i in range(2)])
+    db.session.add_all([Address(member_id=member.id, city_name=f'City {i}') for i in range(2)])
+    now = datetime.now(timezone.utc)
+    db.session.add_all([
+        PhysicalMetric(member_id=member.id, height_cm=170, weight_kg=70 + i, bmi=24,
+                       measured_at=now - timedelta(days=i))
+        for i in range(DETAIL_METRICS_LIMIT + 5)
+    ])
+    plans = [make_plan(f'Plan {i}') for i in range(3)]
+    db.session.add_all([
+        MemberMembership(member_id=member.id, plan_id=plan.id,
+                         start_date=date.today() - timedelta(days=40 * i),
+                         end_date=date.today() - timedelta(days=40 * i - 30),
+                         status='active' if i == 0 else 'expired')
+        for i, plan in enumerate(plans)
+    ])
+    db.session.flush()
+    rebuild_summaries([member.id])
+    db.session.commit()
+    member_id = member.id
+    db.session.expunge_all()
+    return member_id
+
+
+def test_member_detail_loads_in_three_statements(app, member_id):
+    with QueryCounter(db.engine) as counter:
+        detail = load_member_detail(member_id)
+
+        # Touch everything the detail endpoint renders; nothing may lazy-load
+        assert detail.member.user.email == 'detail@example.com'
+        assert len(detail.member.phones) == 2
+        assert len(detail.member.addresses) == 2
+        assert detail.summary is not None
+        assert [m.plan.name for m in detail.memberships] == ['Plan 0', 'Plan 1', 'Plan 2']
+        assert len(detail.metrics) == DETAIL_METRICS_LIMIT
+
+    assert counter.count <= 3, counter.statements
+
+
+def test_member_detail_missing_member(app):
+    with QueryCounter(db.engine) as counter:
+        assert load_member_detail('00000000-0000-0000-0000-000000000000') is None
+    assert counter.count == 1
+
+
+def test_member_detail_without_user(app):
+    # SQLite does not enforce the foreign key, which stands in for a member whose user is gone
+    member = Member(user_id=uuid.uuid4(), first_name='No', last_name='User')
+    db.session.add(member)
+    db.session.commit()
+
+    detail = load_member_detail(member.id)
+    assert detail is not None
+    assert detail.member.user is None
+    assert detail.memberships == []
@@ -0,0 +1,73 @@
+"""
+Tests for the bulk member import: rows that the database or bcrypt would
+refuse are rejected on their own, with the reason, and never abort the rest
+of the import. Runs against a throwaway SQLite database; no server needed.
+"""
+
+import uuid
+
+import pytest
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+import member_import
+from models import db, Role, User
+from member_import import import_members, _row_error
+
+
+@pytest.fixture
+def member_role(app, monkeypatch):
+    # Hash in-process; the pool adds nothing to a handful of rows
+    monkeypatch.setattr(member_import, 'HASH_WORKERS', 1)
+    if not Role.query.filter_by(name='MEMBER').first():
+        db.session.add(Role(name='MEMBER'))
+        db.session.commit()
+
+
+def _record(**fields):
+    record = {'email': f'import-{uuid.uuid4().hex}@example.com', 'firstName': 'Im',
+              'lastName': 'Port', 'password': 'secret123'}
+    record.update(fields)
+    return record
+
+
+def test_overlong_fields_reject_only_their_row(member_role):
+    records = [
+        (2, _record()),
+        (3, _record(password='é' * 37)),
+        (4, _record(firstName='x' * 121)),
+        (5, _record(zipCode='1' * 31)),
+        (6, _record(password='p' * 72))
+    ]
+    report = import_members(records)
+
+    assert report['created'] == 2
+    assert [(error['row'], error['error']) for error in report['errors']] == [
+        (3, 'password must be at most 72 bytes'),
+        (4, 'firstName must be at most 120 characters'),
+        (5, 'zipCode must be at most 30 characters')
+    ]
+
+
+def _refused(row):
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(User), [row])
+    except IntegrityError as e:
+        return e
+    raise AssertionError('insert was not refused')
+
+
+def test_row_error_names_the_constraint(member_role):
+    role_id = Role.query.filter_by(name='MEMBER').first().id
+    email = f'taken-{uuid.uuid4().hex}@example.com'
+    db.session.add(User(email=email, password_hash='x', role_id=role_id))
+    db.session.commit()
+
+    duplicate = {'id': uuid.uuid4(), 'email': email, 'password_hash': 'x', 'role_id': role_id}
+    assert _row_error(_refused(duplicate)) == 'Email already exists'
+    # Anything else names the column instead of blaming the email
+    no_role = {'id': uuid.uuid4(), 'email': f'other-{uuid.uuid4().hex}@example.com', 'password_hash': 'x'}
+    error = _row_error(_refused(no_role))
+    db.session.rollback()
+    assert error.startswith('Rejected by the database:') and 'users.role_id' in error
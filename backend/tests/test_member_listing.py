@@ -0,0 +1,56 @@
+"""
+Tests pinning the semantics of the member list: the plan filter lists a
+member once however many of their memberships match, and the attendance
+percentage counts UTC calendar days (today and the 29 before it) both from
+the summary and from the raw tables. Runs against a throwaway SQLite
+database; no server needed.
+"""
+
+from datetime import datetime, date, time, timedelta, timezone
+
+import pytest
+
+from models import db, Attendance, Member, MemberMembership
+from member_listing import plan_filter, compute_member_stats, load_member_stats
+from member_summary import rebuild_summaries
+
+
+@pytest.fixture
+def member_id(make_member):
+    member = make_member(first_name='List', last_name='Ing')
+    db.session.commit()
+    return member.id
+
+
+def _days_ago(days, hour=0):
+    today = datetime.now(timezone.utc).date()
+    return datetime.combine(today - timedelta(days=days), time(hour, 0, 1), tzinfo=timezone.utc)
+
+
+def test_plan_filter_lists_member_once(app, member_id, make_plan):
+    for name in ['Platinum Monthly', 'Platinum Annual']:
+        plan = make_plan(name)
+        db.session.add(MemberMembership(member_id=member_id, plan_id=plan.id, start_date=date(2024, 1, 1),
+                                        end_date=date(2024, 12, 31), status='expired'))
+    db.session.commit()
+
+    query = Member.query.filter(Member.id == member_id, plan_filter('platinum'))
+    assert query.count() == 1
+    assert [member.id for member in query.all()] == [member_id]
+    assert Member.query.filter(Member.id == member_id, plan_filter('bronze')).count() == 0
+
+
+def test_attendance_counts_calendar_days(app, member_id):
+    # Day 30 is outside the window even when it lies within 30 x 24 hours
+    # of now; two check-ins on one day count once
+    for days_ago, hour in [(0, 0), (0, 1), (29, 0), (30, 23)]:
+        check_in = _days_ago(days_ago, hour)
+        db.session.add(Attendance(member_id=member_id, check_in=check_in,
+                                  check_out=check_in + timedelta(minutes=30)))
+    db.session.commit()
+
+    assert compute_member_stats([member_id])[member_id]['attendance'] == '6.7%'
+
+    summaries = rebuild_summaries([member_id])
+    db.session.commit()
+    assert load_member_stats([member_id], summaries)[member_id]['attendance'] == '6.7%'
@@ -0,0 +1,102 @@
+"""
+Tests for the engagement counters of member summaries: the streaks, visit
+bitmap and month counters kept by check-ins must equal what a rebuild from
+the attendance rows computes. Runs against a throwaway SQLite database; no
+server needed.
+"""
+
+from datetime import datetime, timezone, timedelta, time
+
+import pytest
+
+from models import db, Attendance, MemberSummary
+from attendance_rollups import record_sessions
+from member_summary import record_check_in, rebuild_summaries
+from member_listing import visit_engagement
+from attendance_stats import members_attended_since
+
+ENGAGEMENT_FIELDS = ['visit_anchor', 'visit_bitmap', 'current_streak', 'longest_streak',
+                     'visit_month', 'month_visits']
+
+
+@pytest.fixture
+def member_id(make_member):
+    member = make_member(first_name='Sum', last_name='Mary')
+    rebuild_summaries([member.id])
+    db.session.commit()
+    return member.id
+
+
+def _visit(member_id, check_in):
+    """A (closed) session, recorded the way the routes record its check-in"""
+    db.session.add(Attendance(member_id=member_id, check_in=check_in, check_out=check_in + timedelta(minutes=30)))
+    db.session.flush()
+    record_check_in(member_id, check_in)
+    record_sessions(check_ins=[(member_id, check_in)])
+    db.session.commit()
+
+
+def _engagement(member_id):
+    db.session.expire_all()
+    summary = db.session.get(MemberSummary, member_id)
+    return {field: getattr(summary, field) for field in ENGAGEMENT_FIELDS}
+
+
+def _days_ago(days, second=1):
+    today = datetime.now(timezone.utc).date()
+    return datetime.combine(today - timedelta(days=days), time(0, 0, second), tzinfo=timezone.utc)
+
+
+def test_incremental_streaks_match_rebuild(app, member_id):
+    # An old five-day run (only in the rollup window of a rebuild), gaps, and
+    # two check-ins on the same day
+    days = [100, 99, 98, 97, 96, 40, 39, 20, 19, 18, 2, 1, 0]
+    for days_ago in days:
+        _visit(member_id, _days_ago(days_ago))
+    _visit(member_id, _days_ago(0, second=2))
+
+    incremental = _engagement(member_id)
+    assert incremental['current_streak'] == 3
+    assert incremental['longest_streak'] == 5
+
+    rebuild_summaries([member_id])
+    db.session.commit()
+    assert _engagement(member_id) == incremental
+
+
+def test_bitmap_window_slides_like_rebuild(app, member_id):
+    # Visits further apart than the bitmap window reset the bitmap
+    for days_ago in [90, 89, 10, 3, 2]:
+        _visit(member_id, _days_ago(days_ago))
+
+    incremental = _engagement(member_id)
+    assert incremental['visit_anchor'] == _days_ago(2).date()
+    assert incremental['current_streak'] == 2
+
+    rebuild_summaries([member_id])
+    db.session.commit()
+    assert _engagement(member_id) == incremental
+
+
+def test_streak_lapses_after_a_missed_day(app, member_id):
+    for days_ago in [4, 3, 2]:
+        _visit(member_id, _days_ago(days_ago))
+    summary = db.session.get(MemberSummary, member_id)
+    today = datetime.now(timezone.utc).date()
+
+    assert visit_engagement(summary, today - timedelta(days=1))['current_streak'] == 3
+    assert visit_engagement(summary, today)['current_streak'] == 0
+    assert visit_engagement(summary, today)['longest_streak'] == 3
+
+
+def test_attended_members_include_members_without_summary(app, member_id, make_member):
+    since = _days_ago(5)
+    before = members_attended_since(since)
+    _visit(member_id, _days_ago(1))
+    other = make_member(first_name='No', last_name='Summary')
+    db.session.add(Attendance(member_id=other.id, check_in=_days_ago(1), check_out=_days_ago(1, second=30)))
+    db.session.add(Attendance(member_id=other.id, check_in=_days_ago(2), check_out=_days_ago(2, second=30)))
+    db.session.commit()
+
+    assert db.session.get(MemberSummary, other.id) is None
+    assert members_attended_since(since) == before + 2
@@ -0,0 +1,40 @@
+"""
+Tests for batch ingestion of scale readings: a (member_id, measured_at) key
+is stored once, however often it is sent. Runs against a throwaway SQLite
+database; no server needed.
+"""
+
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from models import db, PhysicalMetric, MemberSummary
+from metrics_routes import Reading, insert_readings
+
+
+@pytest.fixture
+def member_id(make_member):
+    member = make_member(first_name='Scale', last_name='Reading')
+    db.session.commit()
+    return member.id
+
+
+def test_stored_readings_are_skipped(app, member_id):
+    measured_at = datetime(2024, 5, 1, 7, 30, tzinfo=timezone.utc)
+    first = [Reading(0, member_id, measured_at, 180.0, 80.0)]
+    assert insert_readings(first) == 1
+    db.session.commit()
+
+    # The repeat is skipped by the unique index; only the new reading is stored
+    again = [Reading(0, member_id, measured_at, 180.0, 81.0),
+             Reading(1, member_id, measured_at + timedelta(days=1), 180.0, 79.0)]
+    assert insert_readings(again) == 1
+    db.session.commit()
+
+    weights = db.session.query(PhysicalMetric.measured_at, PhysicalMetric.weight_kg)\
+        .filter_by(member_id=member_id).order_by(PhysicalMetric.measured_at).all()
+    assert [float(weight) for _, weight in weights] == [80.0, 79.0]
+    assert float(db.session.get(MemberSummary, member_id).weight_kg) == 79.0
+
+    assert insert_readings(first) == 0
+    db.session.commit()
@@ -0,0 +1,81 @@
+"""
+Tests for keyset pagination: walking every page with the cursor returns
+each row exactly once, in order, including rows that tie on the leading
+sort key. Runs against a throwaway SQLite database; no server needed.
+"""
+
+import uuid
+from datetime import datetime, timezone, timedelta, date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import func
+
+from models import db, Attendance, Equipment
+from pagination import keyset_paginate, encode_cursor, decode_cursor, InvalidCursor
+
+
+@pytest.fixture
+def member_id(make_member):
+    member = make_member(first_name='Page', last_name='Nation')
+
+    # Pairs of sessions share a check-in time, so pages split ties
+    start = datetime(2024, 1, 1, 8, tzinfo=timezone.utc)
+    db.session.add_all([
+        Attendance(member_id=member.id, check_in=start + timedelta(hours=i // 2),
+                   check_out=start + timedelta(hours=i // 2, minutes=45))
+        for i in range(11)
+    ])
+    db.session.commit()
+    return member.id
+
+
+def _walk(query, sort_keys, limit):
+    """Every page of the query, following next_cursor until the last page"""
+    pages = []
+    cursor = None
+    while True:
+        items, cursor = keyset_paginate(query, sort_keys, cursor, limit)
+        pages.append(items)
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 4, 11, 50])
+def test_descending_pages_have_no_gaps_or_duplicates(app, member_id, limit):
+    query = Attendance.query.filter(Attendance.member_id == member_id)
+    sort_keys = [(Attendance.check_in, True), (Attendance.id, True)]
+
+    pages = _walk(query, sort_keys, limit)
+    walked = [row.id for page in pages for row in page]
+    expected = [row.id for row in query.order_by(Attendance.check_in.desc(), Attendance.id.desc()).all()]
+
+    assert walked == expected
+    assert len(set(walked)) == 11
+    assert all(len(page) == limit for page in pages[:-1])
+    assert 0 < len(pages[-1]) <= limit
+
+
+def test_expression_key_with_nulls(app):
+    names = ['Bench', 'Rack', 'Rower', 'Bike', 'Mat', 'Ball']
+    categories = [None, 'Strength', None, 'Cardio', 'Strength', 'Cardio']
+    db.session.add_all([Equipment(name=name, category=category) for name, category in zip(names, categories)])
+    db.session.commit()
+
+    query = Equipment.query.filter(Equipment.name.in_(names))
+    sort_keys = [(func.coalesce(Equipment.category, ''), False), (Equipment.name, False), (Equipment.id, False)]
+
+    walked = [item.name for page in _walk(query, sort_keys, 4) for item in page]
+    assert walked == ['Bench', 'Rower', 'Ball', 'Bike', 'Mat', 'Rack']
+
+
+def test_cursor_round_trip():
+    values = [datetime(2024, 1, 1, 8, 30, tzinfo=timezone.utc), date(2024, 2, 29),
+              uuid.UUID('12345678-1234-5678-1234-567812345678'), Decimal('19.99'), 'text', 7]
+    assert decode_cursor(encode_cursor(values), len(values)) == values
+
+
+@pytest.mark.parametrize('token', ['not base64!', encode_cursor([1]), encode_cursor([{'x': 1}, 2])])
+def test_invalid_cursor(token):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token, 2)
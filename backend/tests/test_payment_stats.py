@@ -0,0 +1,87 @@
+"""
+Tests for the payment statistics cache: cached figures are served until a
+payment write bumps the version, including payments removed by the member
+purge, and rows of earlier days are pruned. Runs against a throwaway SQLite
+database; no server needed.
+"""
+
+from datetime import datetime, timezone, timedelta, date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+
+from models import db, Member, Payment, PaymentStatsCache, MemberPurgeJob
+from payment_stats import payment_statistics, invalidate_payment_stats
+from member_purge import process_pending
+
+
+@pytest.fixture
+def member_id(make_member):
+    member = make_member(first_name='Pay', last_name='Ment')
+    db.session.commit()
+    return member.id
+
+
+def _record_payment(member_id, amount):
+    """Write a payment the way POST /api/payments/ does"""
+    db.session.add(Payment(member_id=member_id, amount=Decimal(amount),
+                           date=datetime.now(timezone.utc), mode='Card'))
+    invalidate_payment_stats()
+    db.session.commit()
+
+
+def _statistics(count_statements=False):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        stats = payment_statistics('week', date.today())
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return (stats, len(statements)) if count_statements else stats
+
+
+def test_cached_statistics_are_served_until_a_payment(app, member_id):
+    before = _statistics()
+    cached, statements = _statistics(count_statements=True)
+    assert cached == before
+    # Version and cache row lookups only
+    assert statements <= 2
+
+    _record_payment(member_id, '40.00')
+    after = _statistics()
+
+    assert after['payment_count'] == before['payment_count'] + 1
+    assert after['revenue']['all_time_total'] == before['revenue']['all_time_total'] + 40.0
+    assert _statistics() == after
+
+
+def test_purge_invalidates_statistics(app, member_id):
+    _record_payment(member_id, '25.50')
+    before = _statistics()
+
+    db.session.get(Member, member_id).deleted_at = datetime.now(timezone.utc)
+    db.session.add(MemberPurgeJob(member_id=member_id))
+    db.session.commit()
+    assert process_pending() == 1
+
+    after = _statistics()
+    assert after['payment_count'] == before['payment_count'] - 1
+    assert after['revenue']['all_time_total'] == before['revenue']['all_time_total'] - 25.5
+
+
+def test_storing_a_result_prunes_earlier_days(app):
+    yesterday = date.today() - timedelta(days=1)
+    payment_statistics('week', yesterday)
+    assert db.session.get(PaymentStatsCache, ('week', yesterday)) is not None
+
+    # A cache hit writes nothing; the next stored result deletes the old rows
+    invalidate_payment_stats()
+    db.session.commit()
+    _statistics()
+    db.session.expire_all()
+    assert db.session.get(PaymentStatsCache, ('week', yesterday)) is None
+    assert db.session.get(PaymentStatsCache, ('week', date.today())) is not None
@@ -0,0 +1,181 @@
+"""
+Trainer workload analytics.
+
+Attendance rows carry the trainer who ran the session. trainer_analytics()
+aggregates a trainer's sessions over the last N weeks with grouped SQL on
+the (trainer_id, check_in) index: totals, a per-week series and a profile
+by hour of day.
+
+`trainer_clients` holds every (trainer, member) pair that had a session,
+and Trainer.total_clients counts the trainer's rows there. Routes call
+record_trainer_clients() in the same transaction as the check-ins it
+accounts for. Only pairs that are new bump the count, so the trainer list
+stays accurate without a recount. Like the attendance rollups, the pairs
+outlive archived attendance partitions.
+
+Backfill the pairs and counts from raw attendance with:
+    python trainer_analytics.py
+"""
+
+import sys
+import os
+from collections import Counter
+from datetime import datetime, timezone, timedelta
+
+# Add the backend directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from models import db, Attendance, Trainer, TrainerClient
+from attendance_stats import is_postgres, as_date, utc_expr, visit_hour_expr, session_minutes_expr
+from db_utils import dialect_insert
+from sqlalchemy import select, update, delete, func, case, and_, bindparam
+
+MAX_ANALYTICS_WEEKS = 52
+
+
+def week_start_expr(column=Attendance.check_in):
+    """Monday of the (UTC) week of a timestamp column"""
+    if is_postgres():
+        return func.date(func.date_trunc('week', utc_expr(column)))
+    # 'weekday 0' moves forward to Sunday (or stays on it)
+    return func.date(column, 'weekday 0', '-6 days')
+
+
+def record_trainer_clients(sessions):
+    """
+    Account for new check-ins with a trainer, as (trainer_id, member_id,
+    check_in); bumps total_clients of trainers that got a new client
+    """
+    first_sessions = {}
+    for trainer_id, member_id, check_in in sessions:
+        if trainer_id is None or member_id is None:
+            continue
+        key = (trainer_id, member_id)
+        if key not in first_sessions or check_in < first_sessions[key]:
+            first_sessions[key] = check_in
+    if not first_sessions:
+        return
+
+    # Keys are sorted so concurrent check-ins lock rows in the same order
+    statement = dialect_insert(TrainerClient).values([
+        {'trainer_id': trainer_id, 'member_id': member_id, 'first_session_at': check_in}
+        for (trainer_id, member_id), check_in in sorted(first_sessions.items(), key=str)
+    ]).on_conflict_do_nothing().returning(TrainerClient.trainer_id)
+    added = Counter(db.session.execute(statement).scalars())
+    if added:
+        db.session.execute(
+            update(Trainer.__table__)
+            .where(Trainer.__table__.c.id == bindparam('trainer'))
+            .values(total_clients=func.coalesce(Trainer.__table__.c.total_clients, 0) + bindparam('added')),
+            [{'trainer': trainer_id, 'added': count} for trainer_id, count in sorted(added.items(), key=str)]
+        )
+
+
+def forget_member(member_id):
+    """Drop a purged member's pairs and take them off their trainers' counts"""
+    trainer_ids = select(TrainerClient.trainer_id).where(TrainerClient.member_id == member_id)
+    db.session.execute(update(Trainer).where(Trainer.id.in_(trainer_ids)).values(
+        total_clients=Trainer.total_clients - 1
+    ))
+    db.session.execute(delete(TrainerClient).where(TrainerClient.member_id == member_id))
+
+
+def rebuild_trainer_clients():
+    """Add the pairs found in raw attendance and recount total_clients of every trainer"""
+    pairs = select(
+        Attendance.trainer_id, Attendance.member_id, func.min(Attendance.check_in)
+    ).where(Attendance.trainer_id.isnot(None), Attendance.member_id.isnot(None))\
+        .group_by(Attendance.trainer_id, Attendance.member_id)
+    statement = dialect_insert(TrainerClient).from_select(
+        ['trainer_id', 'member_id', 'first_session_at'], pairs
+    ).on_conflict_do_nothing()
+    db.session.execute(statement)
+
+    counts = select(func.count()).where(TrainerClient.trainer_id == Trainer.id).scalar_subquery()
+    updated = db.session.execute(update(Trainer).values(total_clients=counts)).rowcount
+    db.session.commit()
+    return updated
+
+
+def trainer_analytics(trainer_id, weeks, now=None):
+    """
+    Sessions, distinct clients and session hours of a trainer over the last
+    `weeks` weeks (the current one included), in total, per week and by
+    hour of check-in
+    """
+    now = now or datetime.now(timezone.utc)
+    this_week = datetime(now.year, now.month, now.day, tzinfo=timezone.utc) - timedelta(days=now.weekday())
+    start = this_week - timedelta(weeks=weeks - 1)
+    days = (now - start).total_seconds() / 86400
+    in_window = [Attendance.trainer_id == trainer_id, Attendance.check_in >= start]
+
+    # Sessions closed by the stale-session sweeper have no real duration
+    completed = and_(Attendance.check_out.isnot(None), Attendance.auto_closed.is_(False))
+    minutes = func.coalesce(func.sum(case((completed, session_minutes_expr()))), 0)
+    columns = [
+        func.count(Attendance.id).label('sessions'),
+        func.count(func.distinct(Attendance.member_id)).label('clients'),
+        minutes.label('minutes')
+    ]
+
+    totals = db.session.execute(select(*columns).where(*in_window)).one()
+
+    week = week_start_expr()
+    by_week = {as_date(row.week): row for row in db.session.execute(
+        select(week.label('week'), *columns).where(*in_window).group_by(week)
+    )}
+    weekly = []
+    for offset in range(weeks):
+        week_start = (start + timedelta(weeks=offset)).date()
+        row = by_week.get(week_start)
+        weekly.append({
+            'week_start': week_start.isoformat(),
+            'sessions': row.sessions if row else 0,
+            'clients': row.clients if row else 0,
+            'session_hours': round(int(row.minutes) / 60, 2) if row else 0
+        })
+
+    hour = visit_hour_expr()
+    by_hour = {row.hour: row for row in db.session.execute(
+        select(hour.label('hour'), *columns).where(*in_window).group_by(hour)
+    )}
+    hourly = []
+    for hour_of_day in range(24):
+        row = by_hour.get(hour_of_day)
+        session_minutes = int(row.minutes) if row else 0
+        hourly.append({
+            'hour': hour_of_day,
+            'sessions': row.sessions if row else 0,
+            'session_hours': round(session_minutes / 60, 2),
+            # Session time started in this hour per hour of the window (sessions
+            # are attributed to the hour they start in; concurrent clients add up)
+            'utilization': round(session_minutes / (60 * days), 3)
+        })
+
+    return {
+        'trainer_id': str(trainer_id),
+        'weeks': weeks,
+        'window': {'start': start.isoformat(), 'end': now.isoformat()},
+        'totals': {
+            'sessions': totals.sessions,
+            'clients': totals.clients,
+            'session_hours': round(int(totals.minutes) / 60, 2),
+            'average_sessions_per_week': round(totals.sessions / weeks, 2)
+        },
+        'weekly': weekly,
+        'hourly': hourly
+    }
+
+
+def main():
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        updated = rebuild_trainer_clients()
+        print(f"Done. Recounted clients of {updated} trainers.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, Trainer, User, Role, TrainerPhone
+from trainer_analytics import trainer_analytics, MAX_ANALYTICS_WEEKS
 from sqlalchemy.exc import SQLAlchemyError
 import uuid
 
@@ -124,6 +125,48 @@ def get_trainer(trainer_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@trainer_bp.route('/<trainer_id>/analytics', methods=['GET'])
+@jwt_required()
+def get_trainer_analytics(trainer_id):
+    """Sessions, clients, weekly session hours and hourly utilization of a trainer"""
+    try:
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        # Validate trainer_id is a valid UUID
+        try:
+            uuid.UUID(trainer_id)
+        except ValueError:
+            return jsonify({'error': 'Invalid trainer ID format'}), 400
+        
+        trainer = Trainer.query.get(trainer_id)
+        if not trainer:
+            return jsonify({'error': 'Trainer not found'}), 404
+        
+        # Check permissions
+        is_same_trainer = (current_user.role.name == 'TRAINER' and 
+                          current_user.trainer_profile and 
+                          str(current_user.trainer_profile.id) == trainer_id)
+        
+        if not (is_admin(current_user) or is_same_trainer):
+            return jsonify({'error': 'Insufficient permissions'}), 403
+        
+        try:
+            weeks = int(request.args.get('weeks', 12))
+        except ValueError:
+            return jsonify({'error': 'weeks must be an integer'}), 400
+        if not 1 <= weeks <= MAX_ANALYTICS_WEEKS:
+            return jsonify({'error': f'weeks must be between 1 and {MAX_ANALYTICS_WEEKS}'}), 400
+        
+        analytics = trainer_analytics(trainer.id, weeks)
+        analytics['total_clients'] = trainer.total_clients
+        
+        return jsonify({'analytics': analytics}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @trainer_bp.route('/<trainer_id>', methods=['PUT'])
 @jwt_required()
 def update_trainer(trainer_id):
@@ -161,7 +204,8 @@ def update_trainer(trainer_id):
         
         # Admin can update additional fields
         if is_admin(current_user):
-            allowed_fields.extend(['salary', 'rating', 'total_clients', 'is_active'])
+            # total_clients is maintained from attendance (see trainer_analytics.py)
+            allowed_fields.extend(['salary', 'rating', 'is_active'])
         
         for field in allowed_fields:
             if field in data: